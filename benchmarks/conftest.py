@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import pytest
+
+
+from os import fspath
+from tox2travis import tox2travis
+from tox2travis.config import Environment
+
+
+#: The number of environments in the synthetic configurations
+SIZES = [10, 1000, 100000]
+
+#: Sizes small enough to still be parsed with tox itself in reasonable time
+TOX_SIZES = [10, 1000]
+
+_PYTHONS = ["27", "35", "36", "37", "38"]
+
+
+def synthetic_envnames(count):
+    """Return `count` environment names spread over all known pythons.
+
+    :param int count:
+    :rtype: [str]
+    """
+    return ["py{}-feature{}".format(_PYTHONS[i % len(_PYTHONS)], i)
+            for i in range(count)]
+
+
+def synthetic_toxini(count):
+    """Return a tox.ini with `count` environments.
+
+    Besides the plain envlist it uses factor conditional settings, so
+    parsing it exercises more than splitting lines.
+
+    :param int count:
+    :rtype: str
+    """
+    lines = ["[tox]", "envlist ="]
+    lines.extend("    " + envname for envname in synthetic_envnames(count))
+    lines.extend([
+        "[testenv]",
+        "deps =",
+        "    pytest",
+        "    py27: mock",
+        "    py38: coverage",
+        "commands = pytest",
+        "[testenv:lint]",
+        "basepython = python3.8",
+        "deps = flake8",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_environments(count):
+    """Return `count` environments as the fast parser would.
+
+    :param int count:
+    :rtype: [tox2travis.config.Environment]
+    """
+    return [Environment(envname,
+                        "python{}.{}".format(envname[2], envname[3]),
+                        ["pytest"])
+            for envname in synthetic_envnames(count)]
+
+
+def filled_basepythons(count):
+    """Return all known basepythons filled with `count` environments.
+
+    :param int count:
+    :rtype: [tox2travis.tox2travis.BasePython]
+    """
+    return tox2travis.fill_basepythons(tox2travis.ALL_KNOWN_BASEPYTHONS,
+                                       synthetic_environments(count))
+
+
+@pytest.fixture(params=SIZES, ids="{}envs".format)
+def size(request):
+    return request.param
+
+
+@pytest.fixture()
+def toxini(tmpdir, size):
+    """A tox.ini with `size` environments."""
+    path = tmpdir / "tox.ini"
+    path.write_text(synthetic_toxini(size), "utf-8")
+    return fspath(path)
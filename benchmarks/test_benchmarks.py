@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Benchmarks of the phases of generating a CI configuration.
+
+Run them with ``make benchmark`` and compare against the last saved run with
+``make benchmark-compare``.
+"""
+import pytest
+import subprocess
+import sys
+
+
+from click.testing import CliRunner
+from io import StringIO
+from tox2travis import tox2travis
+from tox2travis.__main__ import main
+from tox2travis.writers import ALL_WRITERS
+from .conftest import (filled_basepythons, synthetic_environments,
+                       TOX_SIZES)
+
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(params=ALL_WRITERS, ids=lambda writer: writer.name)
+def writer(request):
+    return request.param
+
+
+def test_parse_fast(benchmark, toxini, size):
+    envs = benchmark(tox2travis.get_all_environments, toxini, parser="fast")
+    assert len(envs) == size + 1
+
+
+@pytest.mark.parametrize("size", TOX_SIZES, ids="{}envs".format)
+def test_parse_tox(benchmark, toxini, size):
+    envs = benchmark(tox2travis.get_all_environments, toxini, parser="tox")
+    assert len(envs) == size + 1
+
+
+def test_fill_basepythons(benchmark, size):
+    envs = synthetic_environments(size)
+
+    basepythons = benchmark(tox2travis.fill_basepythons,
+                            tox2travis.ALL_KNOWN_BASEPYTHONS, envs)
+    assert sum(len(bp.environments) for bp in basepythons) == size
+
+
+def test_generate_matrix_specifications(benchmark, writer, size):
+    basepythons = filled_basepythons(size)
+
+    def render():
+        instance = writer()
+        instance.outfile = StringIO()
+        instance.generate_matrix_specifications(basepythons)
+        return instance.outfile.getvalue()
+
+    assert benchmark(render)
+
+
+def test_write(benchmark, writer, size, tmpdir):
+    basepythons = filled_basepythons(size)
+    directory = str(tmpdir)
+
+    benchmark(tox2travis.write_config, basepythons, writer.name, directory)
+
+
+def test_cli(benchmark, toxini, tmpdir, monkeypatch):
+    runner = CliRunner()
+    monkeypatch.chdir(tmpdir)
+
+    def run():
+        return runner.invoke(main, ["--no-cache", "--output=travis",
+                                    "--output=actions"])
+
+    result = benchmark(run)
+    assert result.exit_code == 0, result.output
+
+
+def test_import_time(benchmark):
+    """The cold start of a new process importing the CLI."""
+    def run():
+        subprocess.run([sys.executable, "-c", "import tox2travis.__main__"],
+                       check=True)
+
+    benchmark.pedantic(run, rounds=10)
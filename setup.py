@@ -9,6 +9,7 @@ setup(name="tox2travis",
       author_email="themineo@gmail.com",
       packages=["tox2travis"],
       package_dir={"tox2travis": "tox2travis"},
+      package_data={"tox2travis": ["pythons.json"]},
       download_url="https://github.com/mineo/tox2travis/tarball/master",
       url="http://github.com/mineo/tox2travis",
       license="MIT",
@@ -24,7 +25,7 @@ setup(name="tox2travis",
       python_requires='>=3.6',
       entry_points='''
       [console_scripts]
-      tox2travis=tox2travis.__main__:main
+      tox2travis=tox2travis.client:run
       ''',
       setup_requires=["setuptools_scm", "pytest-runner"],
       use_scm_version={"write_to": "tox2travis/version.py"},
@@ -5,7 +5,6 @@
 import pytest
 
 
-from copy import deepcopy
 from tox2travis import tox2travis
 
 
@@ -14,4 +13,13 @@ def basepythons():
     """
 
     """
-    return deepcopy(tox2travis.ALL_KNOWN_BASEPYTHONS)
+    return [tox2travis.BasePython.from_version(version)
+            for version in tox2travis.ALL_KNOWN_BASEPYTHONS]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    """Keep cache entries written during tests out of the user's cache."""
+    directory = tmpdir / "cache"
+    monkeypatch.setenv("TOX2TRAVIS_CACHE_DIR", str(directory))
+    return directory
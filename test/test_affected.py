@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import os
+import pytest
+import re
+import shutil
+import subprocess
+import sys
+import yaml
+
+
+from click.testing import CliRunner
+from os import fspath, getcwd
+from pathlib import Path
+from textwrap import dedent
+from tox2travis import config, tox2travis
+from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.plan import Plan
+from tox2travis.writers import inputs_pattern, job_inputs
+
+
+TOXINI = dedent("""\
+[tox]
+envlist = py38,lint,docs
+[testenv]
+deps = -r requirements.txt
+commands = pytest {posargs:tests}
+[testenv:lint]
+basepython = python3.8
+skip_install = true
+commands = flake8 {toxinidir}/src ../common
+[testenv:docs]
+basepython = python3.8
+skip_install = true
+changedir = docs
+commands = sphinx-build -b html . {envtmpdir}/html
+""")
+
+
+@pytest.fixture()
+def envs(tmpdir):
+    config_path = fspath(tmpdir / "tox.ini")
+    with open(config_path, "w") as fp:
+        fp.write(TOXINI)
+    return {env.envname: env
+            for env in tox2travis.get_all_environments(config_path,
+                                                       parser="fast")}
+
+
+def test_environment_inputs(envs):
+    # Environments installing the package or running in the configuration
+    # directory depend on all of it
+    assert envs["py38"].inputs == ["."]
+    assert envs["lint"].inputs == [".", "../common"]
+    assert envs["docs"].inputs == ["docs", "tox.ini"]
+
+
+def test_minimal_paths():
+    assert config.minimal_paths(["a/b", "a", "c/d", "c/de", "a"]) == \
+        ["a", "c/d", "c/de"]
+    assert config.minimal_paths(["a", ".", "../b"]) == [".", "../b"]
+
+
+def test_job_inputs(envs):
+    assert job_inputs([envs["docs"]], "pkg") == [
+        "pkg/docs", "pkg/requirements.txt", "pkg/tox.ini"]
+    assert job_inputs([envs["lint"]], "pkg/a") == ["pkg/a", "pkg/common"]
+    # ../common is outside of the repository without a package
+    assert job_inputs([envs["lint"]]) == ["."]
+    assert job_inputs([envs["py38"]], "pkg") == ["pkg"]
+    assert job_inputs([Environment("py38", "python3.8")], "pkg") == ["pkg"]
+
+
+@pytest.mark.parametrize("path, matches", [
+    ("pkg/docs", True),
+    ("pkg/docs/index.rst", True),
+    ("pkg/docsx", False),
+    ("pkg/tox.ini", True),
+    ("pkg/toxxini", False),
+    ("other/pkg/docs", False),
+])
+def test_inputs_pattern(path, matches):
+    pattern = inputs_pattern(["pkg/docs", "pkg/tox.ini"])
+    assert bool(re.match(pattern, path)) is matches
+    if shutil.which("grep") is not None:
+        grep = subprocess.run(["grep", "-qE", pattern],
+                              input=path.encode("utf-8"))
+        assert (grep.returncode == 0) is matches
+
+
+def test_everything_pattern():
+    assert re.match(inputs_pattern(["."]), "anything")
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t"]
+                          + list(args), cwd=cwd, check=True,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def commit(repository, message):
+    git("add", ".", cwd=repository)
+    git("commit", "-qm", message, cwd=repository)
+    return git("rev-parse", "HEAD", cwd=repository)
+
+
+@pytest.fixture()
+def repository(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+    for package in ("a", "b"):
+        directory = tmp_path / "pkg" / package
+        directory.mkdir(parents=True)
+        (directory / "tox.ini").write_text(TOXINI)
+        (directory / "docs").mkdir()
+        (directory / "docs" / "index.rst").write_text("docs\n")
+    git("init", "-q", cwd=tmp_path)
+    return tmp_path
+
+
+def run_actions_selection(repository, base):
+    """Run the step of the generated workflow selecting the jobs."""
+    workflow = yaml.safe_load(
+        (repository / ".github" / "workflows" / "tox.yml").read_text())
+    step = workflow["jobs"]["changes"]["steps"][1]
+    output = repository / "output"
+    output.write_text("")
+    env = dict(os.environ, MATRIX=step["env"]["MATRIX"], BASE=base,
+               GITHUB_OUTPUT=fspath(output))
+    subprocess.run([sys.executable, "-c", step["run"]], cwd=repository,
+                   env=env, check=True, stdout=subprocess.PIPE)
+    outputs = dict(line.partition("=")[::2]
+                   for line in output.read_text().splitlines())
+    assert set(outputs) == {"build"}
+    return sorted((entry["package"], entry["env"])
+                  for entry in json.loads(outputs["build"]))
+
+
+def test_actions_runs_affected_jobs(repository, monkeypatch):
+    monkeypatch.chdir(repository)
+    result = CliRunner().invoke(main, ["--output=actions", "--affected",
+                                       "--no-cache", "batch", "--aggregate"])
+    assert result.exit_code == 0, result.output
+    base = commit(repository, "base")
+
+    (repository / "pkg" / "b" / "docs" / "index.rst").write_text("more\n")
+    commit(repository, "docs")
+    assert run_actions_selection(repository, base) == [
+        ("pkg/b", "docs"), ("pkg/b", "lint"), ("pkg/b", "py38")]
+
+    (repository / "pkg" / "a" / "setup.py").write_text("")
+    commit(repository, "a")
+    assert run_actions_selection(repository, base) == [
+        ("pkg/a", "lint"), ("pkg/a", "py38"),
+        ("pkg/b", "docs"), ("pkg/b", "lint"), ("pkg/b", "py38")]
+
+    # Unknown changes run everything
+    assert len(run_actions_selection(repository, "0" * 40)) == 6
+
+
+def test_actions_skips_unaffected_jobs(repository, monkeypatch):
+    monkeypatch.chdir(repository)
+    CliRunner().invoke(main, ["--output=actions", "--affected", "--no-cache",
+                              "batch", "--aggregate"])
+    base = commit(repository, "base")
+    (repository / "README").write_text("")
+    commit(repository, "readme")
+
+    assert run_actions_selection(repository, base) == []
+
+
+def test_travis_skips_unaffected_jobs(repository, monkeypatch):
+    if shutil.which("bash") is None:
+        pytest.skip("bash is not installed")
+    monkeypatch.chdir(repository)
+    result = CliRunner().invoke(main, ["--affected", "--no-cache", "batch",
+                                       "--aggregate"])
+    assert result.exit_code == 0, result.output
+    base = commit(repository, "base")
+    (repository / "pkg" / "a" / "docs" / "index.rst").write_text("more\n")
+    head = commit(repository, "docs")
+
+    travis = yaml.safe_load((repository / ".travis.yml").read_text())
+    check, = travis["before_install"]
+    ran = []
+    for entry in travis["matrix"]["include"]:
+        # Let bash parse the variables like Travis CI does
+        script = dedent("""\
+        travis_terminate() {{ exit 3; }}
+        export {env}
+        TRAVIS_COMMIT_RANGE={base}...{head}
+        {check}
+        """).format(env=entry["env"], base=base, head=head, check=check)
+        process = subprocess.run(["bash", "-c", script], cwd=repository,
+                                 stdout=subprocess.PIPE,
+                                 universal_newlines=True)
+        if process.returncode == 0:
+            ran.append(re.search(r"TOXENV=(\S+) PACKAGE=(\S+)",
+                                 entry["env"]).group(2, 1))
+        else:
+            assert process.returncode == 3
+    assert sorted(ran) == [("pkg/a", "docs"), ("pkg/a", "lint"),
+                           ("pkg/a", "py38")]
+
+
+def test_affected_is_part_of_plans(tmpdir):
+    (tmpdir / "tox.ini").write_text(TOXINI, "utf-8")
+    plan = Plan.create(fspath(tmpdir / "tox.ini"), parser="fast",
+                       affected=True)
+    loaded = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert loaded.affected
+    assert loaded.render_document("travis") == plan.render_document("travis")
+    assert "TOX_INPUTS=" in plan.render_document("travis")
+    assert (plan.fingerprints !=
+            Plan.create(fspath(tmpdir / "tox.ini"),
+                        parser="fast").fingerprints)
+
+
+def test_without_affected_nothing_changes():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path(getcwd(), "tox.ini").write_text(TOXINI)
+        for output in ("travis", "actions"):
+            result = runner.invoke(main, ["--output", output, "--stdout"])
+            assert result.exit_code == 0, result.output
+            assert "inputs" not in result.stdout.lower()
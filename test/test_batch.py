@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import pytest
+
+
+from click.testing import CliRunner
+from os import fspath
+from textwrap import dedent
+from tox2travis import batch
+from tox2travis.__main__ import main
+
+
+@pytest.fixture()
+def monorepo(tmpdir):
+    for package, envlist in (("a", "py36,py37"), ("libs/b", "py38")):
+        directory = tmpdir.ensure(package, dir=True)
+        (directory / "tox.ini").write_text(dedent("""\
+        [tox]
+        envlist = {}
+        """.format(envlist)), "utf-8")
+    hidden = tmpdir.ensure(".tox/py36", dir=True)
+    (hidden / "tox.ini").write_text("[tox]\nenvlist = py36\n", "utf-8")
+    return tmpdir
+
+
+def test_discover_skips_hidden_directories(monorepo):
+    assert batch.discover(fspath(monorepo)) == [
+        fspath(monorepo / "a" / "tox.ini"),
+        fspath(monorepo / "libs" / "b" / "tox.ini"),
+    ]
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_batch_generates_every_package(monorepo, jobs):
+    result = CliRunner().invoke(main, ["batch", "--root", fspath(monorepo),
+                                       "--jobs", jobs])
+    assert result.exit_code == 0, result.output
+
+    a = (monorepo / "a" / ".travis.yml").read_text("utf-8")
+    b = (monorepo / "libs" / "b" / ".travis.yml").read_text("utf-8")
+    assert "TOXENV=py36" in a and "TOXENV=py37" in a
+    assert "TOXENV=py38" in b and "TOXENV=py36" not in b
+    assert not (monorepo / ".tox" / "py36" / ".travis.yml").exists()
+
+
+def test_batch_reports_errors_per_package(monorepo):
+    broken = monorepo.mkdir("broken")
+    (broken / "tox.ini").write_text("[tox\n", "utf-8")
+
+    result = CliRunner().invoke(main, ["--parser=fast", "batch",
+                                       "--root", fspath(monorepo)])
+
+    assert result.exit_code == 1
+    assert (monorepo / "a" / ".travis.yml").exists()
+    assert (monorepo / "libs" / "b" / ".travis.yml").exists()
+
+
+def test_batch_reads_stdin(monorepo):
+    result = CliRunner().invoke(main, ["batch", "--stdin"],
+                                input=fspath(monorepo / "a") + "\n")
+    assert result.exit_code == 0, result.output
+
+    assert (monorepo / "a" / ".travis.yml").exists()
+    assert not (monorepo / "libs" / "b" / ".travis.yml").exists()
+
+
+def test_batch_aggregate(monorepo):
+    result = CliRunner().invoke(main, ["--output=actions", "batch",
+                                       "--root", fspath(monorepo),
+                                       "--aggregate"])
+    assert result.exit_code == 0, result.output
+
+    workflow = (monorepo / ".github" / "workflows" / "tox.yml").read_text(
+        "utf-8")
+    assert "package: a\n" in workflow
+    assert "package: libs/b\n" in workflow
+    assert "working-directory: ${{ matrix.package }}" in workflow
+
+
+def test_batch_aggregate_parallel(monorepo):
+    result = CliRunner().invoke(main, ["--output=actions", "--parallel=auto",
+                                       "batch", "--root", fspath(monorepo),
+                                       "--aggregate"])
+    assert result.exit_code == 0, result.output
+
+    workflow = (monorepo / ".github" / "workflows" / "tox.yml").read_text(
+        "utf-8")
+    assert "tox -p auto" in workflow
+    package = (monorepo / "a" / ".github" / "workflows" / "tox.yml") \
+        .read_text("utf-8")
+    assert "tox -p auto" in package
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import os
+import pytest
+import sys
+
+
+from os import fspath
+from textwrap import dedent
+from tox2travis import tox2travis
+from tox2travis.cache import Cache
+
+
+def write_toxini(tmpdir, content):
+    toxini = tmpdir / "tox.ini"
+    toxini.write_text(dedent(content), "utf-8")
+    return fspath(toxini)
+
+
+def envnames(basepythons):
+    return {bp.tox_version: [e.envname for e in bp.environments]
+            for bp in basepythons if bp.environments}
+
+
+def test_cache_hit_skips_parsing(tmpdir, cache_dir, monkeypatch):
+    toxini = write_toxini(tmpdir, """\
+    [tox]
+    envlist = py36,py38,flake8
+    """)
+    cache = Cache(fspath(cache_dir))
+    expected = tox2travis.resolve_basepythons(toxini,
+                                              fallback_python="python3.8",
+                                              cache=cache)
+
+    def fail(*args, **kwargs):
+        pytest.fail("The configuration was parsed again")
+
+    monkeypatch.setattr(tox2travis, "get_all_environments", fail)
+    actual = tox2travis.resolve_basepythons(toxini,
+                                            fallback_python="python3.8",
+                                            cache=cache)
+    assert envnames(actual) == envnames(expected)
+
+
+def test_cache_key_changes_with_inputs(tmpdir):
+    toxini = write_toxini(tmpdir, "[tox]\nenvlist = py36\n")
+    key = Cache.key(toxini)
+
+    assert Cache.key(toxini) == key
+    assert Cache.key(toxini, fallback_python="python3.6") != key
+    assert Cache.key(toxini, custom_mapping=[("a", "3.6")]) != key
+    assert Cache.key(toxini, parser="tox") != key
+
+    write_toxini(tmpdir, "[tox]\nenvlist = py37\n")
+    assert Cache.key(toxini) != key
+
+
+def test_cache_key_changes_with_interpreter(tmpdir, monkeypatch):
+    toxini = write_toxini(tmpdir, "[tox]\nenvlist = lint\n")
+    key = Cache.key(toxini)
+
+    monkeypatch.setattr(sys, "executable", "/opt/other/bin/python3")
+    assert Cache.key(toxini) != key
+
+
+def test_environment_substitutions_are_not_cached(tmpdir):
+    toxini = write_toxini(tmpdir, """\
+    [tox]
+    envlist = test
+    [testenv]
+    basepython = {env:PYTHON:python3.7}
+    """)
+    assert Cache.key(toxini) is None
+
+
+def test_broken_entries_are_removed(cache_dir):
+    cache = Cache(fspath(cache_dir))
+    cache.put("key", [])
+    (cache_dir / "key.json").write_text("{not json", "utf-8")
+
+    assert cache.get("key") is None
+    assert not (cache_dir / "key.json").exists()
+
+
+def test_least_recently_used_entries_are_evicted(cache_dir):
+    cache = Cache(fspath(cache_dir))
+    basepythons = []
+    for key in ("old", "used", "new"):
+        cache.put(key, basepythons)
+    size = os.path.getsize(fspath(cache_dir / "old.json"))
+    os.utime(fspath(cache_dir / "old.json"), (1, 1))
+    os.utime(fspath(cache_dir / "used.json"), (2, 2))
+    cache.get("used")
+
+    cache.max_size = 2 * size
+    cache.evict()
+
+    assert sorted(os.listdir(fspath(cache_dir))) == ["new.json", "used.json"]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import pytest
+import yaml
+
+
+from click.testing import CliRunner
+from os import fspath
+from tox2travis.__main__ import main
+from tox2travis.concurrency import (DEFAULT_GROUP, DEFAULT_TIMEOUT_MINUTES,
+                                    Concurrency)
+from tox2travis.plan import Plan
+
+
+@pytest.fixture()
+def project(tmp_path, monkeypatch):
+    (tmp_path / "tox.ini").write_text("[tox]\nenvlist = py38,py39,flake8\n"
+                                      "[testenv:flake8]\nbasepython = "
+                                      "python3.8\n")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def render(*args):
+    result = CliRunner().invoke(main, ["--no-cache", "--stdout"] + list(args))
+    assert result.exit_code == 0, result.output
+    return result.stdout
+
+
+def test_actions_defaults(project):
+    actions = yaml.safe_load(render("--output=actions"))
+    assert actions["concurrency"] == {"group": DEFAULT_GROUP,
+                                      "cancel-in-progress": True}
+    build = actions["jobs"]["build"]
+    assert build["timeout-minutes"] == DEFAULT_TIMEOUT_MINUTES
+    assert "max-parallel" not in build["strategy"]
+
+
+def test_actions_options(project):
+    actions = yaml.safe_load(render(
+        "--output=actions", "--concurrency-group", "tox: ${{ github.ref }}",
+        "--no-cancel-in-progress", "--max-parallel", "4",
+        "--timeout-minutes", "15"))
+    assert actions["concurrency"] == {"group": "tox: ${{ github.ref }}"}
+    build = actions["jobs"]["build"]
+    assert build["timeout-minutes"] == 15
+    assert build["strategy"]["max-parallel"] == 4
+
+
+def test_actions_without_limits(project):
+    actions = yaml.safe_load(render("--output=actions",
+                                    "--concurrency-group", "",
+                                    "--timeout-minutes", "0"))
+    assert "concurrency" not in actions
+    assert "timeout-minutes" not in actions["jobs"]["build"]
+
+
+def test_every_stage_job_is_limited(project):
+    actions = yaml.safe_load(render("--output=actions", "--stages",
+                                    "--max-parallel", "2"))
+    for job in ("quick", "build"):
+        assert actions["jobs"][job]["timeout-minutes"] == \
+            DEFAULT_TIMEOUT_MINUTES
+        assert actions["jobs"][job]["strategy"]["max-parallel"] == 2
+
+
+def test_travis_hints(project):
+    travis = render()
+    assert "Auto Cancellation" in travis
+    assert "Limit concurrent jobs" not in travis
+
+    travis = render("--no-cancel-in-progress", "--max-parallel", "3")
+    assert "Auto Cancellation" not in travis
+    assert '"Limit concurrent jobs" to 3' in travis
+    # The hints are comments
+    assert yaml.safe_load(travis) == yaml.safe_load(render())
+
+
+def test_concurrency_is_part_of_plans(project):
+    plan = Plan.create(fspath(project / "tox.ini"), parser="fast",
+                       max_parallel=2, cancel_in_progress=False)
+    loaded = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert loaded.concurrency.to_dict() == plan.concurrency.to_dict()
+    assert loaded.render_document("actions") == \
+        plan.render_document("actions")
+    assert (plan.fingerprints !=
+            Plan.create(fspath(project / "tox.ini"),
+                        parser="fast").fingerprints)
+
+
+def test_settings_round_trip():
+    concurrency = Concurrency(None, False, 3, 0)
+    assert concurrency.timeout_minutes is None
+    assert Concurrency.from_dict(concurrency.to_dict()).to_dict() == \
+        concurrency.to_dict()
+
+
+def test_check_after_generating(project):
+    runner = CliRunner()
+    args = ["--no-cache", "--output=actions", "--max-parallel", "2"]
+    assert runner.invoke(main, args).exit_code == 0
+    assert runner.invoke(main, args + ["--check"]).exit_code == 0
+    result = runner.invoke(main, args + ["--check", "--timeout-minutes", "5"])
+    assert result.exit_code == 1
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import pytest
+
+
+from os import fspath
+from textwrap import dedent
+from tox2travis import config, tox2travis
+
+
+PARITY_CONFIGS = {
+    "tox.ini": [
+        """\
+        [tox]
+        envlist = py36,py27
+        """,
+        """\
+        [tox]
+        envlist = py{27,36,37,38}-django{22,30}, flake8
+        """,
+        """\
+        [tox]
+        envlist =
+            py{36,37}-{sqlite,postgres}  # a comment
+            pypy3
+            jython
+        [testenv:docs]
+        basepython = python3.7
+        """,
+        """\
+        [tox]
+        envlist = py36,py37,lint
+        [testenv]
+        basepython =
+            lint: python3.8
+        """,
+        """\
+        [tox]
+        envlist = py36
+        [testenv:py{37,38}-cov]
+        deps = coverage
+        """,
+        """\
+        [tox]
+        envlist = py36,flake8
+        ignore_basepython_conflict = true
+        [testenv]
+        basepython = python3.8
+        """,
+        """\
+        [tox]
+        envlist = py38,lint
+        [testenv]
+        deps =
+            -r{toxinidir}/requirements.txt
+            pytest>=5  # the test runner
+            lint: flake8
+        """,
+        """\
+        [tox]
+        envlist = py38,lint,docs,tmp
+        [testenv]
+        commands = pytest {posargs:tests}
+        [testenv:lint]
+        skip_install = true
+        commands =
+            flake8 src \\
+              ../common
+            python {toxinidir}/scripts/check.py --config={toxinidir}/setup.cfg
+        [testenv:docs]
+        skip_install = true
+        changedir = docs
+        commands = sphinx-build -b html . {envtmpdir}/html ../README.md
+        [testenv:tmp]
+        skip_install = true
+        changedir = {envtmpdir}
+        commands = pytest {toxinidir}/tests
+        """,
+        """\
+        [tox]
+        isolated_build = true
+        [testenv:.package]
+        basepython = python3
+        [testenv:py3]
+        """,
+    ],
+    "setup.cfg": [
+        """\
+        [metadata]
+        name = something
+        [tox:tox]
+        envlist = py{35,36}
+        [testenv:flake8]
+        basepython = python3.6
+        """,
+    ],
+    "pyproject.toml": [
+        '''\
+        [tool.tox]
+        legacy_tox_ini = """
+        [tox]
+        envlist = py38,pypy3
+        [testenv:docs]
+        basepython = python3.7
+        """
+        ''',
+    ],
+}
+
+
+def _parity_params():
+    for filename, contents in PARITY_CONFIGS.items():
+        for index, content in enumerate(contents):
+            yield pytest.param(filename, content,
+                               id="{}-{}".format(filename, index))
+
+
+@pytest.mark.parametrize("filename,content", _parity_params())
+def test_fast_parser_matches_tox(tmpdir, filename, content):
+    config_path = fspath(tmpdir / filename)
+    with open(config_path, "w") as fp:
+        fp.write(dedent(content))
+
+    fast = tox2travis.get_all_environments(config_path, parser="fast")
+    slow = tox2travis.get_all_environments(config_path, parser="tox")
+
+    assert ([(e.envname, e.basepython, e.deps, e.inputs) for e in fast] ==
+            [(e.envname, e.basepython, e.deps, e.inputs) for e in slow])
+
+
+@pytest.mark.parametrize("envstr,expected", [
+    ("py27,py36", ["py27", "py36"]),
+    ("py{36,37}-django{22,30}",
+     ["py36-django22", "py36-django30", "py37-django22", "py37-django30"]),
+    ("py{36, 37}\nflake8 # comment", ["py36", "py37", "flake8"]),
+])
+def test_split_env(envstr, expected):
+    assert config.split_env(envstr) == expected
+
+
+@pytest.mark.parametrize("factors,expected", [
+    (["py"], None),
+    (["py3"], "python3"),
+    (["py38", "django30"], "python3.8"),
+    (["py310"], "python3.10"),
+    (["pypy3"], "pypy3"),
+    (["pypy37"], "pypy3.7"),
+    (["jython"], "jython"),
+    (["flake8"], None),
+])
+def test_implied_basepython(factors, expected):
+    assert config.implied_basepython(factors) == expected
+
+
+def test_substitutions_raise(tmpdir):
+    config_path = fspath(tmpdir / "tox.ini")
+    with open(config_path, "w") as fp:
+        fp.write(dedent("""\
+        [tox]
+        envlist = test
+        [testenv]
+        basepython = {env:PYTHON:python3.7}
+        """))
+
+    with pytest.raises(config.UnsupportedConfigError):
+        tox2travis.get_all_environments(config_path, parser="fast")
+
+    envs = tox2travis.get_all_environments(config_path, parser="auto")
+    assert [e.basepython for e in envs] == ["python3.7"]
+
+
+def test_section_references(tmpdir):
+    config_path = fspath(tmpdir / "tox.ini")
+    with open(config_path, "w") as fp:
+        fp.write(dedent("""\
+        [tox]
+        envlist = py38-{a,b},lint
+        [base]
+        deps =
+            pytest
+            a: six
+        python = python3.8
+        [testenv]
+        deps =
+            {[base]deps}
+            {[extra]deps}
+        [extra]
+        deps = coverage
+        [testenv:lint]
+        basepython = {[base]python}
+        deps =
+            {[testenv]deps}
+            flake8
+            {env:EXTRA_DEPS:}
+        """))
+
+    envs = tox2travis.get_all_environments(config_path, parser="fast")
+    assert {e.envname: e.deps for e in envs} == {
+        "lint": ["pytest", "coverage", "flake8", "{env:EXTRA_DEPS:}"],
+        "py38-a": ["pytest", "six", "coverage"],
+        "py38-b": ["pytest", "coverage"],
+    }
+    assert [e.basepython for e in envs if e.envname == "lint"] == \
+        ["python3.8"]
+
+
+@pytest.mark.parametrize("content", [
+    "[testenv]\ndeps = {[missing]deps}\n",
+    "[testenv]\ndeps = {[testenv]deps}\n",
+])
+def test_unresolvable_section_references(tmpdir, content):
+    config_path = fspath(tmpdir / "tox.ini")
+    with open(config_path, "w") as fp:
+        fp.write(content)
+
+    with pytest.raises(config.UnsupportedConfigError):
+        tox2travis.get_all_environments(config_path, parser="fast")
+
+
+def test_find_config_searches_parents(tmpdir):
+    config_path = tmpdir / "tox.ini"
+    config_path.write_text("[tox]\nenvlist = py38\n", "utf-8")
+    subdir = tmpdir.mkdir("sub")
+    (subdir / "setup.cfg").write_text("[metadata]\nname = x\n", "utf-8")
+
+    assert config.find_config(fspath(subdir)) == fspath(config_path)
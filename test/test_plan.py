@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import io
+import pytest
+
+
+from click.testing import CliRunner
+from concurrent.futures import ThreadPoolExecutor
+from os import getcwd
+from pathlib import Path
+from tox2travis import tox2travis
+from tox2travis.__main__ import main
+from tox2travis.plan import InvalidPlan, Plan
+from tox2travis.writers import ALL_WRITERS
+
+
+TOXINI = "[tox]\nenvlist = py{37,38}, lint\n[testenv:lint]\nbasepython = python3.8\n"  # noqa: E501
+
+
+def test_plan_round_trip(tmpdir):
+    (tmpdir / "tox.ini").write_text(TOXINI, "utf-8")
+    plan = Plan.create(str(tmpdir / "tox.ini"), parser="fast")
+    assert set(plan.fingerprints) == set(tox2travis.ALL_WRITER_NAMES)
+
+    saved = io.StringIO()
+    plan.dump(saved)
+    saved.seek(0)
+    loaded = Plan.load(saved)
+
+    assert loaded.to_dict() == plan.to_dict()
+
+
+@pytest.mark.parametrize("content", [
+    "",
+    "[]",
+    '{"version": 0, "basepythons": []}',
+    '{"version": 1}',
+])
+def test_invalid_plan(content):
+    with pytest.raises(InvalidPlan):
+        Plan.load(io.StringIO(content))
+
+
+def test_multiple_outputs_parse_once(monkeypatch):
+    runner = CliRunner()
+    calls = []
+    get_all_environments = tox2travis.get_all_environments
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return get_all_environments(*args, **kwargs)
+
+    monkeypatch.setattr(tox2travis, "get_all_environments", counting)
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        (this_dir / "tox.ini").write_text(TOXINI)
+        args = ["--no-cache"]
+        for writer in ALL_WRITERS:
+            args.append(f"--output={writer.name}")
+
+        result = runner.invoke(main, args)
+        assert result.exit_code == 0, result.output
+        assert len(calls) == 1
+        for writer in ALL_WRITERS:
+            assert (this_dir / writer.filename).exists()
+
+
+def test_render_saved_plan(monkeypatch):
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        (this_dir / "tox.ini").write_text(TOXINI)
+        outputs = [f"--output={writer.name}" for writer in ALL_WRITERS]
+
+        result = runner.invoke(main, outputs)
+        assert result.exit_code == 0, result.output
+        expected = {writer.filename: (this_dir / writer.filename).read_text()
+                    for writer in ALL_WRITERS}
+
+        result = runner.invoke(main, ["plan", "--file", "plan.json"])
+        assert result.exit_code == 0, result.output
+
+        for filename in expected:
+            (this_dir / filename).unlink()
+
+        def fail(*args, **kwargs):
+            pytest.fail("The configuration was parsed")
+
+        monkeypatch.setattr(tox2travis, "get_all_environments", fail)
+        result = runner.invoke(main, ["--plan", "plan.json"] + outputs)
+        assert result.exit_code == 0, result.output
+        for filename, content in expected.items():
+            assert (this_dir / filename).read_text() == content
+
+        result = runner.invoke(main, ["--plan", "plan.json", "--check"] +
+                               outputs)
+        assert result.exit_code == 0, result.output
+
+
+def test_check_reports_every_outdated_output():
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        (Path(getcwd()) / "tox.ini").write_text(TOXINI)
+        args = [f"--output={writer.name}" for writer in ALL_WRITERS]
+
+        result = runner.invoke(main, args + ["--check"])
+        assert result.exit_code == 1
+        for writer in ALL_WRITERS:
+            assert f"{writer.filename} is out of date" in result.output
+
+
+@pytest.mark.parametrize("parser", ["fast", "tox"])
+def test_concurrent_generation(tmp_path, parser):
+    from tox2travis.cache import Cache, MemoryCache
+
+    cwd = getcwd()
+    cache = MemoryCache(Cache(str(tmp_path / "cache")))
+    outputs = [writer.name for writer in ALL_WRITERS]
+    projects = []
+    for number in range(8):
+        project = tmp_path / f"project{number}"
+        project.mkdir()
+        (project / "tox.ini").write_text(
+            f"[tox]\nenvlist = py37, py38-env{number}\n")
+        projects.append(project)
+
+    def generate(project):
+        plan = Plan.create(str(project / "tox.ini"), cache=cache,
+                           parser=parser)
+        return plan.render(outputs, str(project))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        changed = list(executor.map(generate, projects))
+
+    assert changed == [outputs] * len(projects)
+    assert getcwd() == cwd
+    for number, project in enumerate(projects):
+        for writer in ALL_WRITERS:
+            content = (project / writer.filename).read_text()
+            assert f"env{number}" in content
+            assert f"env{(number + 1) % len(projects)}" not in content
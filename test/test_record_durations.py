@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import os
+import pytest
+import shutil
+import subprocess
+import sys
+import time
+import yaml
+
+
+from click.testing import CliRunner
+from os import fspath
+from tox2travis.__main__ import main
+from tox2travis.plan import Plan
+from tox2travis.shard import load_durations
+from tox2travis.writers import RECORD_DURATIONS_SCRIPT
+
+
+TOXINI = "[tox]\nenvlist = py38,py39,flake8\n[testenv:flake8]\nbasepython = python3.8\n"  # noqa: E501
+
+TOX_RESULT = {"reportversion": "1",
+              "testenvs": {"py38": {"setup": [{"elapsed": 1.0}],
+                                    "test": [{"elapsed": 2.5}]}}}
+
+
+@pytest.fixture()
+def project(tmp_path, monkeypatch):
+    (tmp_path / "tox.ini").write_text(TOXINI)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def render(*args):
+    result = CliRunner().invoke(main, ["--no-cache", "--stdout",
+                                       "--record-durations"] + list(args))
+    assert result.exit_code == 0, result.output
+    return yaml.safe_load(result.stdout)
+
+
+def record(tmp_path, envs, started, result=None, env=None):
+    if result is not None:
+        (tmp_path / "result.json").write_text(json.dumps(result))
+    path = tmp_path / "records" / "record.json"
+    env = dict(os.environ, TOX_ENVS=envs, TOX_STARTED=str(started),
+               TOX_RESULT=fspath(tmp_path / "result.json"),
+               TOX_DURATIONS=fspath(path), **(env or {}))
+    subprocess.run([sys.executable, "-c", RECORD_DURATIONS_SCRIPT], env=env,
+                   check=True)
+    return path
+
+
+def test_record(tmp_path):
+    path = record(tmp_path, "py38,flake8", int(time.time()) - 10,
+                  TOX_RESULT)
+    data = json.loads(path.read_text())
+    assert data["envs"] == ["py38", "flake8"]
+    assert data["testenvs"] == TOX_RESULT["testenvs"]
+
+    with path.open() as fp:
+        durations = load_durations([fp])
+    assert durations["py38"] == 3.5
+    assert 6 <= durations["flake8"] <= 8
+
+
+def test_record_without_tox_result(tmp_path):
+    path = record(tmp_path, "py38,py39", int(time.time()) - 10)
+    with path.open() as fp:
+        durations = load_durations([fp])
+    assert durations["py38"] == durations["py39"]
+    assert 4.5 <= durations["py38"] <= 6
+
+
+def test_nothing_is_recorded_before_the_job_started(tmp_path):
+    path = record(tmp_path, "py38", "")
+    assert not path.exists()
+
+
+def test_actions(project):
+    build = render("--output=actions")["jobs"]["build"]
+    assert [entry["durations"]
+            for entry in build["strategy"]["matrix"]["include"]] == [
+        "flake8", "py38", "py39"]
+
+    steps = {step.get("name"): step for step in build["steps"]}
+    assert steps["Create tox environments"]["run"].startswith(
+        'echo "TOX_STARTED=$(date +%s)" >> "$GITHUB_ENV"\n')
+    assert steps["Test with tox"]["run"] == \
+        'tox -e ${{ matrix.env }} --result-json "$RUNNER_TEMP/tox-result.json"\n'  # noqa: E501
+    recording = steps["Record durations"]
+    assert recording["if"] == "${{ always() }}"
+    assert recording["run"] == RECORD_DURATIONS_SCRIPT
+    assert recording["env"]["TOX_DURATIONS"] == \
+        "${{ runner.temp }}/tox-durations/${{ matrix.durations }}.json"
+    upload = build["steps"][-1]
+    assert upload["uses"] == "actions/upload-artifact@v4"
+    # Artifact names have to be unique within a run
+    assert upload["with"] == {
+        "name": "tox-durations-${{ matrix.durations }}",
+        "path": "${{ runner.temp }}/tox-durations"}
+
+
+def test_actions_stages(project):
+    jobs = render("--output=actions", "--stages", "--wheelhouse")["jobs"]
+    for job in ("quick", "build"):
+        steps = {step.get("name"): step for step in jobs[job]["steps"]}
+        assert steps["Test with tox"]["run"].startswith(
+            "tox $TOX_INSTALLPKG -e ${{ matrix.env }} --result-json ")
+        assert "Record durations" in steps
+
+
+def test_travis(project):
+    travis = render()
+    assert "$HOME/tox-durations" in travis["cache"]["directories"]
+    assert travis["install"][1] == "export TOX_STARTED=$(date +%s)"
+    assert travis["script"] == [
+        'travis_retry tox --result-json "$HOME/tox-result.json"']
+    script, = travis["before_cache"]
+    assert RECORD_DURATIONS_SCRIPT in script
+
+
+@pytest.mark.skipif(shutil.which("bash") is None,
+                    reason="bash is not installed")
+def test_travis_before_cache(project):
+    script, = render()["before_cache"]
+    (project / "home").mkdir()
+    (project / "home" / "tox-result.json").write_text(json.dumps(TOX_RESULT))
+    env = dict(os.environ, HOME=fspath(project / "home"), TOXENV="py38",
+               TOX_STARTED=str(int(time.time())),
+               PATH=os.path.dirname(sys.executable) + os.pathsep +
+               os.environ["PATH"])
+    subprocess.run(["bash", "-c", script], env=env, check=True)
+
+    with (project / "home" / "tox-durations" / "py38.json").open() as fp:
+        assert load_durations([fp]) == {"py38": 3.5}
+
+
+def test_aggregate(tmp_path, monkeypatch):
+    for package in ("a", "libs/b"):
+        (tmp_path / package).mkdir(parents=True)
+        (tmp_path / package / "tox.ini").write_text(TOXINI)
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(main, ["--output=actions", "--no-cache",
+                                       "--record-durations", "batch",
+                                       "--aggregate", "--jobs", "1"])
+    assert result.exit_code == 0, result.output
+
+    workflow = yaml.safe_load(
+        (tmp_path / ".github" / "workflows" / "tox.yml").read_text())
+    build = workflow["jobs"]["build"]
+    assert [entry["durations"]
+            for entry in build["strategy"]["matrix"]["include"]] == [
+        "a-flake8", "a-py38", "a-py39",
+        "libs_b-flake8", "libs_b-py38", "libs_b-py39"]
+    test, = [step for step in build["steps"]
+             if step.get("name") == "Test with tox"]
+    assert test["working-directory"] == "${{ matrix.package }}"
+
+
+def test_record_durations_is_part_of_plans(project):
+    plan = Plan.create(fspath(project / "tox.ini"), parser="fast",
+                       record_durations=True)
+    loaded = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert loaded.record_durations
+    assert loaded.render_document("travis") == plan.render_document("travis")
+    assert (plan.fingerprints !=
+            Plan.create(fspath(project / "tox.ini"),
+                        parser="fast").fingerprints)
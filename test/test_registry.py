@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import io
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+
+from click.testing import CliRunner
+from os import getcwd, pathsep
+from pathlib import Path
+from tox2travis import registry
+from tox2travis.__main__ import main
+from tox2travis.registry import (InvalidRegistry, PythonVersion, Registry,
+                                 default_registry, load_registry,
+                                 read_registry_file)
+
+
+def write_registry(path, pythons, version=registry.REGISTRY_FORMAT_VERSION):
+    path.write_text(json.dumps({"version": version, "pythons": pythons}))
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["python3.8", "py38", "3.8"])
+def test_lookup_by_any_name(name):
+    version = default_registry().get(name)
+    assert version == PythonVersion("python3.8", "3.8")
+
+
+def test_lookup_by_ci_names():
+    reg = default_registry()
+    assert reg.by_travis("pypy3.6-7.1.1").tox_version == "pypy3"
+    assert reg.by_actions("pypy3").tox_version == "pypy3"
+    # The first entry wins for names shared by several versions
+    assert reg.by_travis("pypy2.7-6.0").tox_version == "pypy"
+    assert reg.get("python4.0") is None
+
+
+def test_names_contain_tox_names_and_aliases():
+    names = default_registry().names
+    assert "python3.8" in names
+    assert "py38" in names
+    assert len(names) == len(set(names))
+
+
+def test_later_entries_replace_earlier_ones():
+    reg = Registry([
+        {"tox": "python3.8", "travis": "3.8", "aliases": ["py38"]},
+        {"tox": "python3.8", "travis": "3.8-dev", "aliases": ["py38"]},
+    ])
+    assert reg.versions == (PythonVersion("python3.8", "3.8-dev"),)
+    assert reg.get("py38").travis_version == "3.8-dev"
+
+
+def test_digest_changes_with_entries():
+    first = Registry([{"tox": "python3.8", "travis": "3.8"}])
+    second = Registry([{"tox": "python3.8", "travis": "3.8-dev"}])
+    assert first.digest != second.digest
+    assert first.digest == Registry([{"tox": "python3.8",
+                                      "travis": "3.8"}]).digest
+
+
+@pytest.mark.parametrize("content", [
+    "not json",
+    "[]",
+    json.dumps({"version": 0, "pythons": []}),
+])
+def test_invalid_registry_files(content):
+    with pytest.raises(InvalidRegistry):
+        read_registry_file(io.StringIO(content))
+
+
+def test_invalid_entries():
+    with pytest.raises(InvalidRegistry):
+        Registry([{"travis": "3.8"}])
+
+
+def test_extra_registry_files(tmp_path, monkeypatch):
+    extra = write_registry(tmp_path / "extra.json", [
+        {"tox": "python3.15", "travis": "3.15-dev",
+         "actions": "3.15.0-alpha.1", "implementation": "cpython",
+         "development": True, "aliases": ["py315"]},
+    ])
+    monkeypatch.setenv(registry.REGISTRY_ENVIRONMENT_VARIABLE,
+                       pathsep + extra)
+
+    reg = default_registry()
+
+    assert reg.get("py315").actions_version == "3.15.0-alpha.1"
+    assert reg.development == (reg.get("py315"),)
+    assert reg.get("py38") is not None
+    assert reg is default_registry()
+
+
+def test_missing_registry_file(tmp_path):
+    with pytest.raises(InvalidRegistry):
+        load_registry([str(tmp_path / "missing.json")])
+
+
+def test_alias_as_fallback():
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        (this_dir / "tox.ini").write_text("[tox]\nenvlist = flake8\n")
+
+        result = runner.invoke(main, ["--fallback-python", "py38",
+                                      "--stdout"])
+        assert result.exit_code == 0, result.output
+        assert "python: \"3.8\"" in result.stdout
+
+        canonical = runner.invoke(main, ["--fallback-python", "python3.8",
+                                         "--stdout"])
+        assert canonical.stdout == result.stdout
+
+
+def test_fallback_from_extra_registry_file(tmp_path, monkeypatch):
+    extra = write_registry(tmp_path / "extra.json", [
+        {"tox": "python3.15", "travis": "3.15-dev", "aliases": ["py315"]},
+    ])
+    monkeypatch.setenv(registry.REGISTRY_ENVIRONMENT_VARIABLE, extra)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "tox.ini").write_text("[tox]\nenvlist = flake8\n")
+
+    result = CliRunner().invoke(main, ["--no-cache", "--fallback-python",
+                                       "py315", "--stdout"])
+    assert result.exit_code == 0, result.output
+    assert "python: \"3.15-dev\"" in result.stdout
+
+    result = CliRunner().invoke(main, ["--no-cache", "--fallback-python",
+                                       "py999", "--stdout"])
+    assert result.exit_code == 2
+    assert "py999 is not a known basepython" in result.output
+
+
+@pytest.mark.parametrize("content", ["not json", None])
+def test_invalid_registry_is_reported(tmp_path, monkeypatch, content):
+    path = tmp_path / "extra.json"
+    if content is not None:
+        path.write_text(content)
+    monkeypatch.setenv(registry.REGISTRY_ENVIRONMENT_VARIABLE, str(path))
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(main, ["--no-cache", "--stdout"])
+    assert result.exit_code == 1
+    assert "Can't load the python registry" in result.output
+
+
+def test_invalid_registry_allows_help(tmp_path):
+    env = dict(os.environ, **{registry.REGISTRY_ENVIRONMENT_VARIABLE:
+                              str(tmp_path / "missing.json")})
+    result = subprocess.run([sys.executable, "-m", "tox2travis", "--help"],
+                            env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    assert result.returncode == 0, result.stderr
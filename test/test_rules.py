@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import pytest
+
+
+from click.testing import CliRunner
+from io import StringIO
+from tox2travis import tox2travis
+from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.rules import InvalidRule, RuleSet, read_rules
+
+
+@pytest.mark.parametrize("rules,envname,basepython,expected", [
+    ([("docs", "python3.8")], "docs", "python3", "python3.8"),
+    ([("env:lint-*", "python3.8")], "lint-flake8", None, "python3.8"),
+    ([("factor:django*", "python3.7")], "py-django30-sqlite", None,
+     "python3.7"),
+    ([("basepython:re:python3\\.\\d+-dbg", "python3.8")], "test",
+     "python3.10-dbg", "python3.8"),
+    ([("docs", "python3.8")], "docs-spelling", None, None),
+    ([("factor:sqlite", "python3.6"), ("env:*", "python3.8")],
+     "py-sqlite", None, "python3.6"),
+    ([("env:*", "python3.8"), ("factor:sqlite", "python3.6")],
+     "py-sqlite", None, "python3.8"),
+])
+def test_rule_matching(rules, envname, basepython, expected):
+    assert RuleSet(rules).match(envname, basepython) == expected
+
+
+def test_invalid_regex_raises():
+    with pytest.raises(InvalidRule):
+        RuleSet([("re:(", "python3.8")])
+
+
+@pytest.mark.parametrize("rules,envname,expected", [
+    # Each regular expression has its own groups
+    ([("re:(?P<a>x)", "python3.7"), ("re:(?P<a>y)", "python3.8")], "y",
+     "python3.8"),
+    ([("re:b(c)", "python3.7"), ("re:(a)\\1", "python3.8")], "aa",
+     "python3.8"),
+    ([("re:(?i)DOCS", "python3.7"), ("*", "python3.8")], "docs",
+     "python3.7"),
+    ([("*", "python3.8"), ("re:docs", "python3.7")], "docs", "python3.8"),
+])
+def test_regex_rules_are_independent(rules, envname, expected):
+    assert RuleSet(rules).match(envname, None) == expected
+
+
+def test_read_rules():
+    rules = read_rules(StringIO("# comment\n\nfactor:dj* python3.7\n"
+                                "env:re:a b python3.8\n"))
+    assert rules == [("factor:dj*", "python3.7"), ("env:re:a b", "python3.8")]
+
+    with pytest.raises(InvalidRule, match="line 1"):
+        read_rules(StringIO("lonely\n"))
+
+
+def test_many_rules_stay_fast(basepythons):
+    rules = RuleSet([("env:service{}-*".format(i), "python3.8")
+                     for i in range(2000)] +
+                    [("factor:lint", "python3.7")])
+    envs = [Environment("service{}-lint".format(i), None)
+            for i in range(2000)]
+
+    basepythons = tox2travis.fill_basepythons(basepythons, envs, rules=rules)
+
+    for bp in basepythons:
+        if bp.tox_version == "python3.8":
+            assert len(bp.environments) == 2000
+        else:
+            assert not bp.environments
+
+
+def test_unknown_rule_target_raises(basepythons):
+    with pytest.raises(ValueError, match="nothing"):
+        tox2travis.fill_basepythons(basepythons, [],
+                                    rules=RuleSet([("*", "nothing")]))
+
+
+@pytest.mark.parametrize("args, input", [
+    (["--mapping-rule", "py*", "nosuch"], None),
+    (["--mapping-rules", "-"], "py* nosuch\n"),
+])
+def test_cli_rejects_unknown_rule_target(tmpdir, args, input):
+    with tmpdir.as_cwd():
+        result = CliRunner().invoke(main, ["--no-cache", "--stdout"] + args,
+                                    input=input)
+
+    assert result.exit_code == 2
+    assert "nosuch is not a known basepython" in result.output
+
+
+def test_cli_accepts_custom_mapping_rule_target(tmpdir):
+    tmpdir.join("tox.ini").write_text("[tox]\nenvlist = mypy\n", "utf-8")
+    with tmpdir.as_cwd():
+        result = CliRunner().invoke(main, ["--no-cache", "--stdout",
+                                           "--custom-mapping", "mypython",
+                                           "3.8", "--mapping-rule", "mypy",
+                                           "mypython"])
+
+    assert result.exit_code == 0, result.output
+    assert "TOXENV=mypy" in result.stdout
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import io
+import json
+import pytest
+import shlex
+import sys
+
+
+from click.testing import CliRunner
+from os import fspath
+from textwrap import dedent
+from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.run import (JobResult, job_directory_name, plan_jobs,
+                            summary, tox_command, write_junit)
+from tox2travis.shard import load_durations
+from tox2travis.tox2travis import BasePython
+from xml.etree import ElementTree
+
+
+FAKE_TOX = dedent("""\
+import argparse
+import json
+import os
+import sys
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-c")
+parser.add_argument("--workdir")
+parser.add_argument("--result-json")
+parser.add_argument("-e")
+parser.add_argument("-p")
+parser.add_argument("rest", nargs="*")
+args = parser.parse_args()
+os.makedirs(args.workdir)
+envs = args.e.split(",")
+print("running", envs, args.rest)
+with open(args.result_json, "w") as fp:
+    json.dump({"testenvs": {env: {"result": {"duration": 2.5}}
+                            for env in envs if env != "py39"}}, fp)
+sys.exit(1 if "fail" in envs else 0)
+""")
+
+
+@pytest.fixture()
+def project(tmp_path, monkeypatch):
+    (tmp_path / "tox.ini").write_text("[tox]\nenvlist = py38,py39,fail\n"
+                                      "[testenv:fail]\nbasepython = "
+                                      "python3.8\n")
+    (tmp_path / "fake_tox.py").write_text(FAKE_TOX)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def fake_tox(project):
+    return " ".join(shlex.quote(arg) for arg in
+                    [sys.executable, fspath(project / "fake_tox.py")])
+
+
+def test_job_directory_name():
+    assert job_directory_name(["py38", "lint"]) == "py38+lint"
+    assert job_directory_name(["../py38"]) == ".._py38"
+
+
+def test_tox_command():
+    assert tox_command("tox.ini", ["py38", "lint"], "work", "result.json",
+                       "python -m tox", "auto", ["--", "-x"]) == [
+        "python", "-m", "tox", "-c", "tox.ini", "--workdir", "work",
+        "--result-json", "result.json", "-e", "py38,lint", "-p", "auto",
+        "--", "-x"]
+
+
+def test_plan_jobs_starts_longest_first():
+    basepython = BasePython("python3.8", "3.8",
+                            [Environment(envname, "python3.8")
+                             for envname in ("py38", "lint", "docs")])
+    assert plan_jobs([basepython], {"lint": 1, "py38": 10}) == [
+        ("python3.8", ["py38"]), ("python3.8", ["docs"]),
+        ("python3.8", ["lint"])]
+
+
+def test_environment_durations():
+    result = JobResult("python3.8", ["py38", "lint", "docs"], 0, 10.0, "log",
+                       {"py38": 6.0})
+    assert result.environment_durations() == {"py38": 6.0, "lint": 2.0,
+                                              "docs": 2.0}
+
+
+def test_summary_can_be_read_as_durations():
+    results = [JobResult("python3.8", ["py38"], 0, 3.0, "a.log"),
+               JobResult("python3.9", ["py39"], 1, 4.0, "b.log")]
+    data = summary(results)
+    assert data["testenvs"]["py39"]["result"]["success"] is False
+    assert load_durations([io.StringIO(json.dumps(data))]) == {
+        "py38": 3.0, "py39": 4.0}
+
+
+def test_junit_report(tmp_path):
+    log = tmp_path / "fail.log"
+    log.write_text("".join("line {}\n".format(i) for i in range(100)))
+    results = [JobResult("python3.8", ["py38"], 0, 3.0, "a.log"),
+               JobResult("python3.8", ["fail"], 2, 1.0, fspath(log))]
+    fp = io.BytesIO()
+    write_junit(results, fp)
+
+    suite = ElementTree.fromstring(fp.getvalue()).find("testsuite")
+    assert suite.get("tests") == "2"
+    assert suite.get("failures") == "1"
+    passed, failed = suite.findall("testcase")
+    assert passed.find("failure") is None
+    assert failed.get("classname") == "python3.8"
+    assert failed.find("failure").get("message") == "tox exited with 2"
+    assert failed.find("failure").text.startswith("line 50\n")
+
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_run_command(project, jobs):
+    result = CliRunner().invoke(
+        main, ["--no-cache", "run", "--jobs", jobs, "--tox",
+               fake_tox(project), "--json", "summary.json", "--junit",
+               "report.xml", "--", "--", "-k", "slow"])
+    assert result.exit_code == 1
+    assert "[3/3]" in result.stderr
+
+    summary = json.loads((project / "summary.json").read_text())
+    jobs = {tuple(job["envs"]): job for job in summary["jobs"]}
+    assert sorted(jobs) == [("fail",), ("py38",), ("py39",)]
+    assert jobs[("fail",)]["returncode"] == 1
+    assert jobs[("py38",)]["returncode"] == 0
+    assert summary["testenvs"]["py38"]["result"]["duration"] == 2.5
+
+    log = (project / ".tox2travis" / "logs" / "py38.log").read_text()
+    # tox passes arguments after -- on to the commands
+    assert "running ['py38'] ['-k', 'slow']" in log
+    # Every job has its own work directory
+    assert (project / ".tox2travis" / "jobs" / "py39").is_dir()
+    assert (project / "report.xml").exists()
+
+
+def test_run_command_with_shards(project):
+    (project / "tox.ini").write_text("[tox]\nenvlist = py38,py38-lint,py38-docs\n")
+    result = CliRunner().invoke(
+        main, ["--no-cache", "--parallel", "2", "run", "--tox",
+               fake_tox(project), "--json", "-"])
+    assert result.exit_code == 0, result.output
+    job, = json.loads(result.stdout)["jobs"]
+    assert sorted(job["envs"]) == ["py38", "py38-docs", "py38-lint"]
+
+
+def test_run_command_with_durations(project):
+    (project / "durations.json").write_text(
+        json.dumps({"py38": 1, "py39": 5, "fail": 3}))
+    result = CliRunner().invoke(
+        main, ["--no-cache", "--durations", "durations.json", "run",
+               "--jobs", "1", "--tox", fake_tox(project)])
+    assert result.exit_code == 1
+    started = [line.split()[1] for line in result.stderr.splitlines()
+               if line.startswith("[")]
+    assert started == ["py39", "fail", "py38"]
+
+
+def test_missing_tox(project):
+    result = CliRunner().invoke(main, ["--no-cache", "run", "--tox",
+                                       fspath(project / "missing")])
+    assert result.exit_code == 1
+    log = project / ".tox2travis" / "logs" / "py38.log"
+    assert "missing" in log.read_text()
+
+
+def test_no_configuration(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(main, ["run"])
+    assert result.exit_code == 1
+    assert "no tox configuration found" in result.output
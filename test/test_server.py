@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import io
+import pytest
+import sys
+import threading
+
+
+from os import fspath
+from tox2travis import client
+from tox2travis.server import Server
+
+
+@pytest.fixture()
+def server(tmpdir):
+    server = Server(fspath(tmpdir / "tox2travis.sock"))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture()
+def project(tmpdir, monkeypatch):
+    directory = tmpdir.mkdir("project")
+    (directory / "tox.ini").write_text("[tox]\nenvlist = py38\n", "utf-8")
+    monkeypatch.chdir(directory)
+    return directory
+
+
+def test_forward_runs_in_the_clients_directory(server, project):
+    response = client.forward(server.socket_path, ["--output=actions"])
+
+    assert response["exit_code"] == 0, response["stderr"]
+    workflow = (project / ".github" / "workflows" / "tox.yml").read_text(
+        "utf-8")
+    assert "env: py38" in workflow
+
+
+def test_forward_reports_errors(server, project):
+    response = client.forward(server.socket_path, ["--output=nothing"])
+
+    assert response["exit_code"] == 2
+    assert "nothing" in response["stderr"]
+
+
+def test_forward_check(server, project):
+    response = client.forward(server.socket_path, ["--check"])
+    assert response["exit_code"] == 1
+    assert ".travis.yml is out of date" in response["stderr"]
+
+    assert client.forward(server.socket_path, [])["exit_code"] == 0
+    assert client.forward(server.socket_path, ["--check"])["exit_code"] == 0
+
+
+def test_run_falls_back_without_daemon(tmpdir, project, monkeypatch):
+    monkeypatch.setenv(client.SOCKET_ENVIRONMENT_VARIABLE,
+                       fspath(tmpdir / "nothing.sock"))
+
+    with pytest.raises(SystemExit) as excinfo:
+        client.run([])
+
+    assert excinfo.value.code == 0
+    assert (project / ".travis.yml").exists()
+
+
+@pytest.mark.parametrize("args", [["run", "--tox", "false"],
+                                  ["batch", "--jobs", "1"]])
+def test_long_commands_run_locally(server, project, monkeypatch, args):
+    def forward(*_):
+        pytest.fail("{} was sent to the daemon".format(args[0]))
+
+    monkeypatch.setenv(client.SOCKET_ENVIRONMENT_VARIABLE,
+                       server.socket_path)
+    monkeypatch.setattr(client, "forward", forward)
+    with pytest.raises(SystemExit):
+        client.run(["--no-cache"] + args)
+
+
+@pytest.mark.parametrize("args", [["--mapping-rules=-"], ["--plan=-"],
+                                  ["--durations=-"], ["--plan", "-"]])
+def test_stdin_runs_locally(server, project, monkeypatch, args):
+    def forward(*_):
+        pytest.fail("{} was sent to the daemon".format(args))
+
+    monkeypatch.setenv(client.SOCKET_ENVIRONMENT_VARIABLE,
+                       server.socket_path)
+    monkeypatch.setattr(client, "forward", forward)
+    monkeypatch.setattr(sys, "stdin", io.StringIO(""))
+    with pytest.raises(SystemExit):
+        client.run(["--no-cache"] + args)
+
+
+def test_second_server_is_refused(server):
+    with pytest.raises(OSError, match="already listening"):
+        Server(server.socket_path)
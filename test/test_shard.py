@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import io
+import json
+import pytest
+
+
+from click.testing import CliRunner
+from os import getcwd
+from pathlib import Path
+from tox2travis.__main__ import main
+from tox2travis.cache import dump_basepythons, load_basepythons
+from tox2travis.config import Environment
+from tox2travis.shard import load_durations, pack, read_durations
+from tox2travis.tox2travis import BasePython
+
+
+TOX4_RESULT = {
+    "reportversion": "1",
+    "testenvs": {
+        "py38": {"result": {"success": True, "duration": 12.5}},
+        "lint": {"setup": [{"elapsed": 1.5}],
+                 "test": [{"elapsed": 2.0}, {"elapsed": 0.5}]},
+        "docs": {"test": [{"retcode": 0}]},
+    },
+}
+
+TOX3_RESULT = {
+    "reportversion": "1",
+    "toxversion": "3.28.0",
+    "testenvs": {"py38": {"test": [{"command": ["pytest"], "retcode": 0}]}},
+}
+
+
+def environments(*envnames):
+    return [Environment(envname, "python3.8") for envname in envnames]
+
+
+def envnames(groups):
+    return [[env.envname for env in group] for group in groups]
+
+
+@pytest.mark.parametrize("data, expected", [
+    (TOX4_RESULT, {"py38": 12.5, "lint": 4.0}),
+    (TOX3_RESULT, {}),
+    ({"py38": 3, "lint": 1.5}, {"py38": 3.0, "lint": 1.5}),
+    # Job records written by --record-durations
+    (dict(TOX4_RESULT, version=1, envs=["py38", "lint", "docs"],
+          duration=20.5), {"py38": 12.5, "lint": 4.0, "docs": 4.0}),
+    (dict(TOX3_RESULT, version=1, envs=["py38", "py39"], duration=9),
+     {"py38": 4.5, "py39": 4.5}),
+])
+def test_read_durations(data, expected):
+    assert read_durations(io.StringIO(json.dumps(data))) == expected
+
+
+def test_read_durations_rejects_lists():
+    with pytest.raises(ValueError):
+        read_durations(io.StringIO("[]"))
+
+
+def test_load_durations_averages():
+    fps = [io.StringIO(json.dumps({"py38": 2, "lint": 1})),
+           io.StringIO(json.dumps({"py38": 4}))]
+    assert load_durations(fps) == {"py38": 3.0, "lint": 1.0}
+
+
+def test_pack_minimizes_longest_job():
+    envs = environments("a", "b", "c", "d", "e", "f")
+    durations = {"a": 10, "b": 1, "c": 1, "d": 4, "e": 3, "f": 3}
+
+    groups = pack(envs, 2, durations)
+
+    assert envnames(groups) == [["a", "b"], ["c", "d", "e", "f"]]
+    assert [sum(durations[env.envname] for env in group)
+            for group in groups] == [11, 11]
+
+
+def test_pack_without_durations_balances_counts():
+    groups = pack(environments(*"abcdefg"), 3, {})
+    assert sorted(len(group) for group in groups) == [2, 2, 3]
+
+
+def test_pack_never_creates_empty_jobs():
+    assert envnames(pack(environments("a", "b"), 5, {})) == [["a"], ["b"]]
+
+
+def test_jobs_survive_serialization():
+    basepython = BasePython("python3.8", "3.8", environments("a", "b", "c"))
+    basepython.jobs = pack(basepython.environments, 2, {"a": 5})
+
+    loaded, = load_basepythons(dump_basepythons([basepython]))
+
+    assert loaded.sharded
+    assert envnames(loaded.jobs) == [["a"], ["b", "c"]]
+
+
+def test_sharded_output():
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        (this_dir / "tox.ini").write_text(
+            "[tox]\nenvlist = py38-{a,b,c,d}\n")
+        (this_dir / "durations.json").write_text(
+            json.dumps({"py38-a": 10, "py38-b": 4, "py38-c": 3,
+                        "py38-d": 3}))
+
+        result = runner.invoke(main, ["--shards", "2",
+                                      "--durations", "durations.json"])
+        assert result.exit_code == 0, result.output
+        travis_yml = (this_dir / ".travis.yml").read_text()
+        assert "env: TOXENV=py38-a TOX_DEPS=" in travis_yml
+        assert "env: TOXENV=py38-b,py38-c,py38-d TOX_DEPS=" in travis_yml
+
+        result = runner.invoke(main, ["--shards", "2",
+                                      "--durations", "durations.json",
+                                      "--check"])
+        assert result.exit_code == 0, result.output
+        result = runner.invoke(main, ["--check"])
+        assert result.exit_code == 1
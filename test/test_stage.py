@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import os
+import pytest
+import subprocess
+import sys
+import yaml
+
+
+from click.testing import CliRunner
+from os import fspath, getcwd
+from pathlib import Path
+from textwrap import dedent
+from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.plan import Plan
+from tox2travis.rules import InvalidRule
+from tox2travis.stage import QUICK_STAGE, TEST_STAGE, Staging
+
+
+TOXINI = dedent("""\
+[tox]
+envlist = py38,py39,flake8,docs
+[testenv:flake8]
+basepython = python3.8
+[testenv:docs]
+basepython = python3.9
+""")
+
+
+def environments(*envnames):
+    return [Environment(envname, "python3.8") for envname in envnames]
+
+
+@pytest.mark.parametrize("envname, quick", [
+    ("flake8", True),
+    ("py38-lint", True),
+    ("docs", True),
+    ("pre-commit", True),
+    ("py38", False),
+    ("linting", False),
+])
+def test_default_quick_environments(envname, quick):
+    env, = environments(envname)
+    assert Staging().is_quick(env) is quick
+
+
+def test_quick_patterns_and_durations():
+    staging = Staging(["re:type.*"], {"py38": 30, "py39": 61})
+    assert staging.is_quick(environments("typecheck")[0])
+    assert staging.is_quick(environments("py38")[0])
+    assert not staging.is_quick(environments("py39")[0])
+    assert not Staging(durations={"py38": 30},
+                       quick_duration=10).is_quick(environments("py38")[0])
+
+
+def test_jobs_are_only_quick_if_all_environments_are():
+    staging = Staging()
+    assert staging.stage(environments("flake8", "docs")) == QUICK_STAGE
+    assert staging.stage(environments("flake8", "py38")) == TEST_STAGE
+
+
+def test_sort_key_orders_by_stage_then_duration():
+    staging = Staging(durations={"py38": 300, "py39": 100, "flake8": 90})
+    jobs = [environments("py38"), environments("flake8"), environments("py39"),
+            environments("docs")]
+    ordered = sorted(jobs, key=staging.sort_key)
+    # docs has no known duration, it takes the average one
+    assert [job[0].envname for job in ordered] == ["flake8", "docs", "py39",
+                                                   "py38"]
+
+
+def test_invalid_pattern():
+    with pytest.raises(InvalidRule):
+        Staging(["re:("])
+
+
+def test_staging_round_trip():
+    staging = Staging(["typecheck"], {"py38": 1.0}, 5.0)
+    loaded = Staging.from_dict(json.loads(json.dumps(staging.to_dict())))
+    assert loaded.to_dict() == staging.to_dict()
+
+
+def run(*args):
+    result = CliRunner().invoke(main, ["--no-cache", "--stdout"] + list(args))
+    assert result.exit_code == 0, result.output
+    return yaml.safe_load(result.stdout)
+
+
+@pytest.fixture()
+def project(tmp_path, monkeypatch):
+    (tmp_path / "tox.ini").write_text(TOXINI)
+    (tmp_path / "durations.json").write_text(json.dumps({"py38": 300,
+                                                         "py39": 100}))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_travis_stages(project):
+    travis = run("--stages", "--durations", "durations.json")
+    assert travis["stages"] == [QUICK_STAGE, TEST_STAGE]
+    assert [(entry["stage"], entry["env"].split()[0])
+            for entry in travis["matrix"]["include"]] == [
+        (QUICK_STAGE, "TOXENV=flake8"),
+        (QUICK_STAGE, "TOXENV=docs"),
+        (TEST_STAGE, "TOXENV=py39"),
+        (TEST_STAGE, "TOXENV=py38"),
+    ]
+    assert "fast_finish" not in travis["matrix"]
+
+
+@pytest.mark.parametrize("option, value", [
+    ("--fail-fast", True),
+    ("--no-fail-fast", False),
+])
+def test_fail_fast(project, option, value):
+    assert run(option)["matrix"]["fast_finish"] is value
+    actions = run("--output=actions", option)
+    assert actions["jobs"]["build"]["strategy"]["fail-fast"] is value
+
+
+def test_actions_stages(project):
+    actions = run("--output=actions", "--stages")
+    quick, build = actions["jobs"]["quick"], actions["jobs"]["build"]
+    assert "needs" not in quick
+    assert build["needs"] == "quick"
+    assert [entry["env"] for entry in quick["strategy"]["matrix"]["include"]] \
+        == ["flake8", "docs"]
+    assert [entry["env"] for entry in build["strategy"]["matrix"]["include"]] \
+        == ["py38", "py39"]
+    assert quick["steps"] == build["steps"]
+
+
+def test_only_quick_environments(project):
+    (project / "tox.ini").write_text("[tox]\nenvlist = py38-flake8\n")
+    actions = run("--output=actions", "--stages")
+    assert list(actions["jobs"]) == ["quick"]
+    assert run("--stages")["stages"] == [QUICK_STAGE]
+
+
+def test_actions_stages_with_affected(project):
+    actions = run("--output=actions", "--stages", "--affected")
+    changes = actions["jobs"]["changes"]
+    assert set(changes["outputs"]) == {"quick", "build"}
+    assert actions["jobs"]["build"]["needs"] == ["changes", "quick"]
+    # A skipped quick job doesn't skip the build job
+    assert "!failure()" in actions["jobs"]["build"]["if"]
+
+    step = changes["steps"][1]
+    output = project / "output"
+    output.write_text("")
+    env = dict(os.environ, MATRIX=step["env"]["MATRIX"], BASE="0" * 40,
+               GITHUB_OUTPUT=fspath(output))
+    subprocess.run([sys.executable, "-c", step["run"]], env=env, check=True,
+                   stdout=subprocess.PIPE)
+    outputs = dict(line.partition("=")[::2]
+                   for line in output.read_text().splitlines())
+    assert [entry["env"] for entry in json.loads(outputs["quick"])] == [
+        "flake8", "docs"]
+    assert len(json.loads(outputs["build"])) == 2
+
+
+def test_without_stages_nothing_changes(project):
+    travis = run()
+    assert "stages" not in travis
+    assert all("stage" not in entry for entry in travis["matrix"]["include"])
+    assert list(run("--output=actions")["jobs"]) == ["build"]
+
+
+def test_staging_is_part_of_plans(project):
+    plan = Plan.create(fspath(project / "tox.ini"), parser="fast", stages=True,
+                       quick_envs=["py39"], fail_fast=False)
+    loaded = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert loaded.fail_fast is False
+    assert loaded.staging.patterns == ["py39"]
+    for output in ("travis", "actions"):
+        assert loaded.render_document(output) == plan.render_document(output)
+    fingerprints = {Plan.fingerprint("travis", fspath(project), parser="fast",
+                                     **options)
+                    for options in ({}, {"fail_fast": False},
+                                    {"fail_fast": True}, {"stages": True})}
+    assert len(fingerprints) == 4
+
+
+@pytest.mark.parametrize("args", [
+    ["--stages", "--quick-env", "py39", "--fail-fast"],
+    ["--parallel", "auto"],
+])
+def test_check_after_generating(project, args):
+    runner = CliRunner()
+    result = runner.invoke(main, ["--no-cache"] + args)
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(main, ["--no-cache", "--check"] + args)
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(main, ["--no-cache", "--check"])
+    assert result.exit_code == 1
+
+
+def test_invalid_quick_env():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path(getcwd(), "tox.ini").write_text(TOXINI)
+        result = runner.invoke(main, ["--stages", "--quick-env", "re:("])
+        assert result.exit_code == 2
+        assert "--quick-env" in result.output
+
+
+def test_batch_aggregate_stages(tmp_path, monkeypatch):
+    for package in ("a", "b"):
+        (tmp_path / package).mkdir()
+        (tmp_path / package / "tox.ini").write_text(TOXINI)
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(main, ["--stages", "--no-cache", "batch",
+                                       "--aggregate", "--jobs", "1"])
+    assert result.exit_code == 0, result.output
+
+    travis = yaml.safe_load((tmp_path / ".travis.yml").read_text())
+    stages = [entry["stage"] for entry in travis["matrix"]["include"]]
+    assert stages == [QUICK_STAGE] * 4 + [TEST_STAGE] * 4
+    package = yaml.safe_load((tmp_path / "a" / ".travis.yml").read_text())
+    assert package["stages"] == [QUICK_STAGE, TEST_STAGE]
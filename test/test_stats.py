@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import pstats
+import time
+
+
+from click.testing import CliRunner
+from os import getcwd
+from pathlib import Path
+from tox2travis.__main__ import main
+from tox2travis.stats import Stats
+
+
+def test_nested_phases_are_excluded():
+    stats = Stats()
+    with stats.phase("writing"):
+        with stats.phase("rendering"):
+            time.sleep(0.05)
+
+    assert stats.phases["rendering"]["wall"] >= 0.05
+    assert stats.phases["writing"]["wall"] < 0.05
+
+
+def test_repeated_phases_are_summed():
+    stats = Stats()
+    stats.add("rendering", 1.0, 0.5)
+    stats.add("rendering", 2.0, 1.0)
+
+    assert stats.phases["rendering"]["wall"] == 3.0
+    assert stats.phases["rendering"]["cpu"] == 1.5
+
+
+def test_cli_stats_and_profile():
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        (this_dir / "tox.ini").write_text("[tox]\nenvlist = py37,py38-{a,b}\n")
+
+        result = runner.invoke(main, ["--output=travis", "--output=actions",
+                                      "--shards=1", "--timings",
+                                      "--stats=stats.json",
+                                      "--profile=profile.out"])
+        assert result.exit_code == 0, result.output
+        assert "rendering" in result.output
+
+        stats = json.loads((this_dir / "stats.json").read_text())
+        assert set(stats["phases"]) == {"import", "parse", "bucketing",
+                                        "rendering", "writing"}
+        assert stats["basepythons"]["python3.8"] == {"environments": 2,
+                                                     "jobs": 1}
+        assert stats["environments"] == 3
+        assert stats["jobs"] == 2
+        assert stats["bytes_written"] == sum(
+            (this_dir / output["path"]).stat().st_size
+            for output in stats["outputs"].values())
+
+        assert pstats.Stats(str(this_dir / "profile.out")).total_calls > 0
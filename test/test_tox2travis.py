@@ -2,7 +2,11 @@
 # coding: utf-8
 # Copyright © 2017, 2018, 2019 Wieland Hoffmann
 # License: MIT, see LICENSE for details
+import io
+import os
 import pytest
+import subprocess
+import sys
 
 
 from click.testing import CliRunner
@@ -10,11 +14,21 @@ from os import fspath, getcwd
 from os.path import join
 from pathlib import Path
 from textwrap import dedent
-from tox2travis import tox2travis
+from tox2travis import tox2travis, writers
 from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.plan import Plan
+from tox2travis.writers import ALL_WRITERS
 
 
-@pytest.fixture(params=tox2travis.ALL_WRITERS)
+#: The maximum time in microseconds importing the CLI may take
+IMPORT_TIME_BUDGET = 150000
+
+#: Modules that must not be imported before they're needed
+LAZY_MODULES = ["tox", "tox.config", "tox2travis.config", "tox2travis.writers"]
+
+
+@pytest.fixture(params=ALL_WRITERS)
 def output(request):
     return request.param
 
@@ -75,6 +89,8 @@ def test_fallback_is_used(basepythons, tmpdir, fallback):
     basepythons = tox2travis.fill_basepythons(basepythons,
                                               configs,
                                               fallback)
+    # Aliases like py38 are valid fallbacks as well
+    fallback = tox2travis.canonical_basepython(fallback)
     for bp in basepythons:
         if bp.tox_version == fallback:
             assert bp.environments[0].envname == "flake8"
@@ -88,79 +104,299 @@ def test_fallback_is_used(basepythons, tmpdir, fallback):
         assert len(bp.environments) == 0
 
 
+def render_snapshot(toxini, output, **options):
+    """Render `output` like ``tox2travis --stdout`` in the directory of
+    `toxini` does, without changing the current directory.
+    """
+    plan = Plan.create(toxini, parser="auto", **options)
+    return plan.render_document(output.name)
+
+
 @pytest.mark.parametrize("basepython", tox2travis.ALL_KNOWN_BASEPYTHONS)
-def test_simple_case(basepython, output, snapshot):
+def test_simple_case(basepython, output, snapshot, tmp_path):
+    toxini = get_toxini_path_with_content(tmp_path, dedent("""\
+    [tox]
+    envlist = test
+    [testenv:test]
+    basepython={python}
+    """.format(python=basepython.tox_version)))
+
+    actual = render_snapshot(toxini, output)
+
+    snapshot.snapshot_dir = f"snapshots/{output.name}_simple"
+    snapshot.assert_match(actual, f"{basepython.tox_version}")
+
+@pytest.mark.parametrize("custom_target1", (tox2travis.ALL_KNOWN_BASEPYTHONS))
+@pytest.mark.parametrize("custom_target2", (tox2travis.ALL_KNOWN_BASEPYTHONS))
+def test_custom_mapping_unspecified(custom_target1, custom_target2, output, snapshot, tmp_path):
+    toxini = get_toxini_path_with_content(tmp_path, dedent("""\
+    [tox]
+    envlist = flake8,test
+    [testenv:flake8]
+    basepython=pythonsomething.something
+    [testenv:test]
+    basepython=pythonsomething.somethingelse
+    """))
+
+    actual = render_snapshot(toxini, output)
+
+    snapshot.snapshot_dir = f"snapshots/{output.name}_two_custom_unspecified"
+    snapshot.assert_match(actual, f"{custom_target1.travis_version}_{custom_target2.travis_version}.yml")
+
+@pytest.mark.parametrize("custom_target1", (tox2travis.ALL_KNOWN_BASEPYTHONS))
+@pytest.mark.parametrize("custom_target2", (tox2travis.ALL_KNOWN_BASEPYTHONS))
+def test_custom_mapping(custom_target1, custom_target2, output, snapshot, tmp_path):
+    toxini = get_toxini_path_with_content(tmp_path, dedent("""\
+    [tox]
+    envlist = flake8,test
+    [testenv:flake8]
+    basepython=pythonsomething.something
+    [testenv:test]
+    basepython=pythonsomething.somethingelse
+    """))
+
+    actual = render_snapshot(toxini, output, custom_mapping=(
+        ("pythonsomething.something", custom_target1.travis_version),
+        ("pythonsomething.somethingelse", custom_target2.travis_version)))
+
+    snapshot.snapshot_dir = f"snapshots/{output.name}_two_custom"
+    snapshot.assert_match(actual, f"{custom_target1.travis_version}_{custom_target2.travis_version}.yml")
+
+
+def test_cli_import_time():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "from tox2travis.__main__ import main; main(['--help'])"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, time, name = line.split("|")
+        if time.strip().isdigit():
+            cumulative[name.strip()] = int(time)
+
+    for module in LAZY_MODULES:
+        assert module not in cumulative
+    assert cumulative["tox2travis.__main__"] < IMPORT_TIME_BUDGET
+
+
+def test_unchanged_output_is_not_rewritten(output):
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        get_toxini_path_with_content(this_dir, "[tox]\nenvlist = py38\n")
+
+        result = runner.invoke(main, f"--output={output.name}")
+        assert result.exit_code == 0, result.output
+        outfile = this_dir / output.filename
+        os.utime(fspath(outfile), (1, 1))
+
+        result = runner.invoke(main, f"--output={output.name}")
+        assert result.exit_code == 0, result.output
+        assert outfile.stat().st_mtime == 1
+
+
+def test_check(output, monkeypatch):
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        this_dir = Path(getcwd())
+        get_toxini_path_with_content(this_dir, "[tox]\nenvlist = py38\n")
+        args = [f"--output={output.name}", "--check"]
+
+        result = runner.invoke(main, args)
+        assert result.exit_code == 1
+
+        result = runner.invoke(main, f"--output={output.name}")
+        assert result.exit_code == 0, result.output
+        expected = read_file(this_dir, output.filename)
+
+        def fail(*args, **kwargs):
+            pytest.fail("The configuration was parsed")
+
+        with monkeypatch.context() as m:
+            m.setattr(tox2travis, "get_all_environments", fail)
+            result = runner.invoke(main, args)
+            assert result.exit_code == 0, result.output
+
+        get_toxini_path_with_content(this_dir, "[tox]\nenvlist = py37\n")
+        result = runner.invoke(main, args)
+        assert result.exit_code == 1
+        assert read_file(this_dir, output.filename) == expected
+
+
+def test_check_without_fingerprint(output):
     runner = CliRunner()
-    actual = None
 
     with runner.isolated_filesystem():
         this_dir = Path(getcwd())
         get_toxini_path_with_content(this_dir, dedent("""\
         [tox]
         envlist = test
-        [testenv:test]
-        basepython={python}
-        """.format(python=basepython.tox_version)))
+        [testenv]
+        basepython = {env:PYTHON:python3.7}
+        """))
+        args = [f"--output={output.name}", "--check"]
 
         result = runner.invoke(main, f"--output={output.name}")
         assert result.exit_code == 0, result.output
+        assert runner.invoke(main, args).exit_code == 0
 
-        actual = read_file(this_dir, output.filename)
+        (this_dir / output.filename).write_text("outdated")
+        assert runner.invoke(main, args).exit_code == 1
 
-    snapshot.snapshot_dir = f"snapshots/{output.name}_simple"
-    snapshot.assert_match(actual, f"{basepython.tox_version}")
 
-@pytest.mark.parametrize("custom_target1", (tox2travis.ALL_KNOWN_BASEPYTHONS))
-@pytest.mark.parametrize("custom_target2", (tox2travis.ALL_KNOWN_BASEPYTHONS))
-def test_custom_mapping_unspecified(custom_target1, custom_target2, output, snapshot):
+def test_environments_are_deduplicated_by_name():
+    basepython = tox2travis.BasePython("python3.8", "3.8")
+    for envname in ("py38", "lint", "py38"):
+        basepython.add_environment(Environment(envname, "python3.8"))
+
+    assert [e.envname for e in basepython.environments] == ["py38", "lint"]
+
+
+class _CountingName(str):
+    """An environment name counting how often it is compared."""
+
+    comparisons = 0
+
+    def __eq__(self, other):
+        type(self).comparisons += 1
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
+
+def test_fill_basepythons_scales_linearly(monkeypatch):
+    count = 10000
+    basepythons = tox2travis.ALL_KNOWN_BASEPYTHONS
+    tox_versions = [bp.tox_version for bp in basepythons]
+    envs = [Environment(_CountingName("env{}".format(i)), tox_versions[i % 3])
+            for i in range(count)]
+    monkeypatch.setattr(_CountingName, "comparisons", 0)
+
+    basepythons = tox2travis.fill_basepythons(basepythons, envs)
+
+    assert sum(len(bp.environments) for bp in basepythons) == count
+    # Looking for duplicates among all environments already added would
+    # compare every new name with the previous ones
+    assert _CountingName.comparisons < count
+
+
+def test_parallel(output):
     runner = CliRunner()
-    actual = None
 
     with runner.isolated_filesystem():
         this_dir = Path(getcwd())
         get_toxini_path_with_content(this_dir, dedent("""\
         [tox]
-        envlist = flake8,test
-        [testenv:flake8]
-        basepython=pythonsomething.something
-        [testenv:test]
-        basepython=pythonsomething.somethingelse
+        envlist = py37, py38-{a,b}, lint
+        [testenv:lint]
+        basepython = python3.8
         """))
 
-        result = runner.invoke(main, f"--output={output.name}")
+        result = runner.invoke(main, [f"--output={output.name}",
+                                      "--parallel=auto"])
         assert result.exit_code == 0, result.output
-        actual = read_file(this_dir, output.filename)
+        content = read_file(this_dir, output.filename)
+        assert content.count("py37") == 1
+        assert "lint,py38-a,py38-b" in content
+        assert "tox -p auto" in content
 
-    snapshot.snapshot_dir = f"snapshots/{output.name}_two_custom_unspecified"
-    snapshot.assert_match(actual, f"{custom_target1.travis_version}_{custom_target2.travis_version}.yml")
 
-@pytest.mark.parametrize("custom_target1", (tox2travis.ALL_KNOWN_BASEPYTHONS))
-@pytest.mark.parametrize("custom_target2", (tox2travis.ALL_KNOWN_BASEPYTHONS))
-def test_custom_mapping(custom_target1, custom_target2, output, snapshot):
+@pytest.mark.parametrize("value", ["0", "-1", "all"])
+def test_parallel_rejects_invalid_values(value):
+    result = CliRunner().invoke(main, ["--parallel", value])
+    assert result.exit_code == 2
+
+
+@pytest.mark.parametrize("deps, package, expected", [
+    (["pytest"], None, []),
+    (["-rrequirements.txt", "-c {toxinidir}/constraints.txt"], None,
+     ["constraints.txt", "requirements.txt"]),
+    (["--requirement=docs/requirements.txt"], "pkg",
+     ["pkg/docs/requirements.txt"]),
+    (["-r/etc/requirements.txt", "-r{env:REQUIREMENTS}"], None, []),
+])
+def test_dependency_files(deps, package, expected):
+    job = [Environment("py38", "python3.8", deps)]
+    assert writers.dependency_files(job, package) == expected
+
+
+def test_dependency_key_changes_with_deps():
+    def key(basepython, deps):
+        return writers.dependency_key([Environment("py38", basepython, deps)])
+
+    assert key("python3.8", ["pytest"]) == key("python3.8", ["pytest"])
+    assert key("python3.8", ["pytest"]) != key("python3.8", ["pytest<6"])
+    assert key("python3.8", ["pytest"]) != key("python3.7", ["pytest"])
+
+
+def test_actions_caches_dependency_files():
     runner = CliRunner()
-    actual = None
 
     with runner.isolated_filesystem():
         this_dir = Path(getcwd())
         get_toxini_path_with_content(this_dir, dedent("""\
         [tox]
-        envlist = flake8,test
-        [testenv:flake8]
-        basepython=pythonsomething.something
-        [testenv:test]
-        basepython=pythonsomething.somethingelse
+        envlist = py38,lint
+        [testenv]
+        deps = pytest
+        [testenv:lint]
+        basepython = python3.8
+        deps = -r{toxinidir}/requirements-lint.txt
         """))
 
-        result = runner.invoke(main, ["--custom-mapping",
-                                      "pythonsomething.something",
-                                      custom_target1.travis_version,
-                                      "--custom-mapping",
-                                      "pythonsomething.somethingelse",
-                                      custom_target2.travis_version,
-                                      f"--output={output.name}"])
-
+        result = runner.invoke(main, "--output=actions")
         assert result.exit_code == 0, result.output
-        actual = read_file(this_dir, output.filename)
+        content = read_file(this_dir, writers.ActionsWriter.filename)
+        assert content.count("tox-deps: ") == 2
+        assert content.count('tox-dep-files: "requirements-lint.txt"') == 1
+        assert "tox -e ${{ matrix.env }} --notest" in content
 
-    snapshot.snapshot_dir = f"snapshots/{output.name}_two_custom"
-    snapshot.assert_match(actual, f"{custom_target1.travis_version}_{custom_target2.travis_version}.yml")
+
+def test_render_config_matches_written_file(basepythons, output, tmpdir):
+    basepythons[0].add_environment(Environment("py27", "python2.7"))
+    directory = fspath(tmpdir)
+
+    tox2travis.write_config(basepythons, output.name, directory, "sha256:0")
+    rendered = tox2travis.render_config(basepythons, output.name,
+                                        fingerprint="sha256:0")
+
+    assert rendered == read_file(directory, output.filename)
+    assert os.listdir(directory) == [output.filename.split("/")[0]]
+
+
+def test_render_config_streams(basepythons, output):
+    stream = io.StringIO()
+
+    assert tox2travis.render_config(basepythons, output.name, stream) is None
+    assert stream.getvalue() == tox2travis.render_config(basepythons,
+                                                         output.name)
+
+
+def test_stdout_with_several_outputs_fails():
+    result = CliRunner().invoke(main, ["--output=travis", "--output=actions",
+                                       "--stdout"])
+    assert result.exit_code == 2
+
+
+def test_registry_is_shared_and_unmodified(tmpdir):
+    toxini = get_toxini_path_with_content(tmpdir, "[tox]\nenvlist = py38\n")
+    registry = tox2travis.ALL_KNOWN_BASEPYTHONS
+
+    first = tox2travis.resolve_basepythons(toxini)
+    second = tox2travis.resolve_basepythons(toxini)
+
+    assert tox2travis.ALL_KNOWN_BASEPYTHONS is registry
+    assert all(isinstance(version, tox2travis.PythonVersion)
+               for version in registry)
+    assert first[0] is not second[0]
+    for bucket in first:
+        assert not hasattr(bucket, "__dict__")
+        for environment in bucket.environments:
+            assert not hasattr(environment, "__dict__")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import pytest
+import sys
+import threading
+
+
+from os import fspath
+from tox2travis import watch
+from tox2travis.config import CONFIG_CANDIDATES
+
+
+WATCHERS = [watch.PollingWatcher]
+if sys.platform.startswith("linux"):
+    WATCHERS.append(watch.InotifyWatcher)
+
+
+@pytest.fixture(params=WATCHERS)
+def watcher(request, tmpdir):
+    if request.param is watch.PollingWatcher:
+        watcher = watch.PollingWatcher(fspath(tmpdir), CONFIG_CANDIDATES,
+                                       interval=0.01)
+    else:
+        watcher = request.param(fspath(tmpdir), CONFIG_CANDIDATES)
+    yield watcher
+    watcher.close()
+
+
+def test_watcher_sees_changes(watcher, tmpdir):
+    assert not watcher.wait(0.05)
+
+    (tmpdir / "unrelated.txt").write_text("", "utf-8")
+    assert not watcher.wait(0.05)
+
+    (tmpdir / "tox.ini").write_text("[tox]\n", "utf-8")
+    assert watcher.wait(1)
+
+
+def test_watch_regenerates(watcher, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    toxini = tmpdir / "tox.ini"
+    toxini.write_text("[tox]\nenvlist = py36\n", "utf-8")
+    regenerated = threading.Event()
+    stop = threading.Event()
+    regenerator = watch.Regenerator(["travis"], parser="fast")
+    changes = []
+
+    def callback():
+        changes.append(regenerator())
+        regenerated.set()
+
+    thread = threading.Thread(target=watch.watch,
+                              args=(watcher, callback, 0.05, stop))
+    thread.start()
+    try:
+        toxini.write_text("[tox]\nenvlist = py36,py37\n", "utf-8")
+        assert regenerated.wait(5)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert changes == [["python3.6", "python3.7"]]
+    assert "TOXENV=py37" in (tmpdir / ".travis.yml").read_text("utf-8")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import json
+import os
+import pytest
+import shlex
+import shutil
+import subprocess
+import sys
+import yaml
+
+
+from click.testing import CliRunner
+from os import fspath
+from textwrap import dedent
+from tox2travis.__main__ import main
+from tox2travis.config import Environment
+from tox2travis.plan import Plan
+from tox2travis.writers import wheel_dependencies
+
+
+TOXINI = dedent("""\
+[tox]
+envlist = py38,py39,flake8
+[testenv]
+deps =
+    -r{toxinidir}/requirements.txt
+    pytest>=6
+    -e.
+[testenv:flake8]
+basepython = python3.8
+deps = flake8
+""")
+
+
+@pytest.fixture()
+def project(tmp_path, monkeypatch):
+    (tmp_path / "tox.ini").write_text(TOXINI)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def render(*args):
+    result = CliRunner().invoke(main, ["--no-cache", "--stdout",
+                                       "--output=actions", "--wheelhouse"]
+                                + list(args))
+    assert result.exit_code == 0, result.output
+    return yaml.safe_load(result.stdout)
+
+
+def test_wheel_dependencies():
+    environment = Environment("py38", "python3.8",
+                              ["-r {toxinidir}/requirements.txt", "pytest",
+                               "-e .", "--editable=.", "{posargs}",
+                               "django >= 3",
+                               'mock; python_version < "3.3"',
+                               "--index-url https://example.com/simple"])
+    assert wheel_dependencies([environment]) == [
+        ("-r", "requirements.txt"), ("pytest",), ("django >= 3",),
+        ('mock; python_version < "3.3"',),
+        ("--index-url", "https://example.com/simple")]
+
+
+def test_prepare_job_quotes_specifiers_and_markers(project):
+    (project / "tox.ini").write_text(dedent("""\
+    [tox]
+    envlist = py38
+    [testenv]
+    deps =
+        pytest >= 6
+        mock; python_version < "3.3"
+    """))
+    prepare = render()["jobs"]["prepare"]["strategy"]["matrix"]["include"]
+    assert shlex.split(prepare[0]["wheel-deps"]) == [
+        "pytest >= 6", 'mock; python_version < "3.3"']
+
+
+def test_prepare_job(project):
+    jobs = render()["jobs"]
+    prepare = jobs["prepare"]["strategy"]["matrix"]["include"]
+    assert prepare == [
+        {"python-version": "3.8", "wheelhouse": "wheelhouse-3.8",
+         "wheel-deps": "flake8 -rrequirements.txt 'pytest>=6'"},
+        {"python-version": "3.9", "wheelhouse": "wheelhouse-3.9",
+         "wheel-deps": "-rrequirements.txt 'pytest>=6'"},
+    ]
+    upload = jobs["prepare"]["steps"][-1]
+    assert upload["uses"] == "actions/upload-artifact@v4"
+    assert upload["with"] == {"name": "${{ matrix.wheelhouse }}",
+                              "path": "wheelhouse"}
+
+    build = jobs["build"]
+    assert build["needs"] == "prepare"
+    assert {entry["wheelhouse"]
+            for entry in build["strategy"]["matrix"]["include"]} == {
+        "wheelhouse-3.8", "wheelhouse-3.9"}
+    assert build["steps"][-1]["run"] == \
+        "tox $TOX_INSTALLPKG -e ${{ matrix.env }}\n"
+
+
+def test_stage_jobs_need_prepare(project):
+    jobs = render("--stages")["jobs"]
+    assert jobs["quick"]["needs"] == "prepare"
+    assert jobs["build"]["needs"] == ["prepare", "quick"]
+
+    jobs = render("--affected")["jobs"]
+    assert jobs["build"]["needs"] == ["changes", "prepare"]
+
+
+@pytest.mark.skipif(shutil.which("bash") is None,
+                    reason="bash is not installed")
+def test_use_the_wheelhouse(project):
+    step, = [step for step in render()["jobs"]["build"]["steps"]
+             if step.get("name") == "Use the wheelhouse"]
+    (project / "wheelhouse" / "package").mkdir(parents=True)
+    (project / "wheelhouse" / "package" / "pkg-1.0-py3-none-any.whl") \
+        .write_text("")
+    (project / "home").mkdir()
+    github_env = project / "github_env"
+    env = dict(os.environ, HOME=fspath(project / "home"),
+               GITHUB_ENV=fspath(github_env), PIP_CONFIG_FILE="",
+               PATH=os.path.dirname(sys.executable) + os.pathsep +
+               os.environ["PATH"])
+    env.pop("XDG_CONFIG_HOME", None)
+    subprocess.run(["bash", "-c", step["run"].replace(
+        "pip config", "{} -m pip config".format(sys.executable))],
+        env=env, check=True, stdout=subprocess.PIPE)
+
+    assert github_env.read_text() == "TOX_INSTALLPKG=--installpkg {}\n" \
+        .format(project / "wheelhouse" / "package" /
+                "pkg-1.0-py3-none-any.whl")
+    config = (project / "home" / ".config" / "pip" / "pip.conf").read_text()
+    assert fspath(project / "wheelhouse") in config
+
+
+def test_aggregate(tmp_path, monkeypatch):
+    for package in ("a", "libs/b"):
+        (tmp_path / package).mkdir(parents=True)
+        (tmp_path / package / "tox.ini").write_text(TOXINI)
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(main, ["--output=actions", "--wheelhouse",
+                                       "--no-cache", "batch", "--aggregate",
+                                       "--jobs", "1"])
+    assert result.exit_code == 0, result.output
+
+    workflow = yaml.safe_load(
+        (tmp_path / ".github" / "workflows" / "tox.yml").read_text())
+    prepare = workflow["jobs"]["prepare"]
+    assert [(entry["package"], entry["wheelhouse"])
+            for entry in prepare["strategy"]["matrix"]["include"]] == [
+        ("a", "wheelhouse-3.8-a"), ("a", "wheelhouse-3.9-a"),
+        ("libs/b", "wheelhouse-3.8-libs_b"),
+        ("libs/b", "wheelhouse-3.9-libs_b")]
+    build, upload = prepare["steps"][-2:]
+    assert build["working-directory"] == "${{ matrix.package }}"
+    assert upload["with"]["path"] == "${{ matrix.package }}/wheelhouse"
+    download = workflow["jobs"]["build"]["steps"][2]
+    assert download["uses"] == "actions/download-artifact@v4"
+    assert download["with"]["path"] == "${{ matrix.package }}/wheelhouse"
+    assert workflow["jobs"]["build"]["steps"][3]["working-directory"] == \
+        "${{ matrix.package }}"
+
+
+def test_wheelhouse_is_part_of_plans(project):
+    plan = Plan.create(fspath(project / "tox.ini"), parser="fast",
+                       wheelhouse=True)
+    loaded = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert loaded.wheelhouse
+    assert loaded.render_document("actions") == \
+        plan.render_document("actions")
+    assert (plan.fingerprints !=
+            Plan.create(fspath(project / "tox.ini"),
+                        parser="fast").fingerprints)
+
+
+def test_travis_is_unchanged(project, caplog):
+    runner = CliRunner()
+    result = runner.invoke(main, ["--no-cache", "--stdout", "--wheelhouse"])
+    assert result.exit_code == 0, result.output
+    assert "only supported for GitHub Actions" in caplog.text
+    assert "wheelhouse" not in result.stdout
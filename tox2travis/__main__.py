@@ -2,51 +2,535 @@
 # coding: utf-8
 # Copyright © 2017, 2018, 2020 Wieland Hoffmann
 # License: MIT, see LICENSE for details
-import click
-import logging
+from time import perf_counter, process_time
 
+# When importing the command line started, see _start_stats
+_IMPORT_STARTED = (perf_counter(), process_time())
 
-from .tox2travis import (get_all_environments,
-                         fill_basepythons,
-                         ALL_VALID_FALLBACKS, BasePython, ALL_KNOWN_BASEPYTHONS,
-                         ALL_WRITERS)
-from copy import deepcopy
+import click  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
 
 
-@click.command()
+from collections import OrderedDict  # noqa: E402
+
+
+from .concurrency import DEFAULT_GROUP, DEFAULT_TIMEOUT_MINUTES  # noqa: E402
+from .tox2travis import (canonical_basepython, get_writer,  # noqa: E402
+                         ALL_PARSERS, ALL_WRITER_NAMES)
+
+
+class ParallelType(click.ParamType):
+    """Either ``auto`` or a positive number of processes."""
+
+    name = "parallel"
+
+    def convert(self, value, param, ctx):  # noqa: D102
+        if value == "auto":
+            return value
+        if str(value).isdigit() and int(value) > 0:
+            return str(int(value))
+        self.fail("{!r} is neither auto nor a positive number".format(value),
+                  param, ctx)
+
+
+@click.group(invoke_without_command=True)
 @click.option("--custom-mapping", nargs=2, multiple=True)
-@click.option("--fallback-python", type=click.Choice(ALL_VALID_FALLBACKS))
-@click.option("--output",
-              default=ALL_WRITERS[0].name,
+@click.option("--fallback-python", metavar="BASEPYTHON",
+              help="The basepython of environments with an unknown one, a "
+                   "tox name or an alias of a known python version.")
+@click.option("--mapping-rule", nargs=2, multiple=True,
+              metavar="PATTERN BASEPYTHON",
+              help="Map environments matching PATTERN to BASEPYTHON.")
+@click.option("--mapping-rules", type=click.File(),
+              help="Read additional mapping rules from a file.")
+@click.option("--output", "outputs",
+              default=ALL_WRITER_NAMES[:1],
+              multiple=True,
               show_default=True,
-              type=click.Choice([w.name for w in ALL_WRITERS]))
+              type=click.Choice(ALL_WRITER_NAMES),
+              help="The CI configuration to write, can be given more than "
+                   "once.")
+@click.option("--plan", "plan_file", type=click.File(),
+              help="Render a plan saved with `tox2travis plan` instead of "
+                   "reading the tox configuration.")
+@click.option("--parser",
+              default=ALL_PARSERS[0],
+              show_default=True,
+              type=click.Choice(ALL_PARSERS))
+@click.option("--shards", type=click.IntRange(min=1),
+              help="Run the environments of each basepython in at most this "
+                   "many jobs instead of one job per environment.")
+@click.option("--durations", type=click.File(), multiple=True,
+              help="A `tox --result-json` file or a JSON object mapping "
+                   "environment names to seconds, used to balance --shards "
+                   "and to find quick environments for --stages. Can be "
+                   "given more than once.")
+@click.option("--parallel", type=ParallelType(),
+              help="Run all environments of a basepython in one job with "
+                   "`tox -p PARALLEL`. `auto` uses all cores of the runner.")
+@click.option("--affected", is_flag=True,
+              help="Only run the jobs whose inputs changed, according to "
+                   "`git diff`. The inputs are the directory an environment "
+                   "runs in, paths in its commands, its requirement files "
+                   "and, unless it skips installing it, the package.")
+@click.option("--stages", is_flag=True,
+              help="Run quick jobs, like linters, in a first stage that has "
+                   "to pass before the other jobs start, and order jobs "
+                   "shortest first.")
+@click.option("--quick-env", "quick_envs", multiple=True, metavar="PATTERN",
+              help="Also run environments matching PATTERN in the quick "
+                   "stage. Can be given more than once.")
+@click.option("--quick-duration", type=click.FloatRange(min=0),
+              help="Also run environments that took at most this many "
+                   "seconds according to --durations in the quick stage.  "
+                   "[default: 60]")
+@click.option("--fail-fast/--no-fail-fast", default=None,
+              help="Whether a failing job cancels the other jobs of the "
+                   "build, defaults to the behaviour of the CI.")
+@click.option("--concurrency-group", default=DEFAULT_GROUP,
+              show_default=True,
+              help="The concurrency group of GitHub Actions runs, an empty "
+                   "one doesn't use any.")
+@click.option("--cancel-in-progress/--no-cancel-in-progress", default=True,
+              show_default=True,
+              help="Whether a new run in the concurrency group cancels the "
+                   "one in progress.")
+@click.option("--max-parallel", type=click.IntRange(min=1),
+              help="The number of matrix entries of a GitHub Actions job "
+                   "running at the same time.")
+@click.option("--timeout-minutes", type=click.IntRange(min=0),
+              default=DEFAULT_TIMEOUT_MINUTES, show_default=True,
+              help="Cancel GitHub Actions jobs running longer than this, 0 "
+                   "keeps the default of six hours.")
+@click.option("--wheelhouse", is_flag=True,
+              help="Build the package and wheels of all dependencies once "
+                   "per python version in a `prepare` job, and install "
+                   "them from there in the jobs running tox. Only supported "
+                   "for GitHub Actions.")
+@click.option("--record-durations", is_flag=True,
+              help="Make every job record the durations of its "
+                   "environments, uploaded as a `tox-durations-*` artifact "
+                   "per job on GitHub Actions and cached in "
+                   "$HOME/tox-durations on Travis CI. The records can be "
+                   "passed to --durations.")
+@click.option("--no-cache", is_flag=True,
+              help="Don't use or update the cache of resolved environments.")
+@click.option("--check", is_flag=True,
+              help="Don't write anything, exit with 1 if the output is out "
+                   "of date.")
+@click.option("--stdout", "to_stdout", is_flag=True,
+              help="Write the configuration to stdout instead of its file.")
+@click.option("--watch", is_flag=True,
+              help="Keep running and regenerate the output whenever the tox "
+                   "configuration changes.")
+@click.option("--timings", is_flag=True,
+              help="Report the time and memory spent in each phase on "
+                   "stderr.")
+@click.option("--profile", "profile_path",
+              type=click.Path(dir_okay=False, writable=True),
+              help="Save cProfile statistics of the run to this file.")
+@click.option("--stats", "stats_path",
+              type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help="Save statistics about the run as JSON to this file, `-` "
+                   "for stdout.")
 @click.option("--verbose", is_flag=True)
 # @click.option("outfile", type=click.File("w"), default=TRAVIS_YAML)
-def main(custom_mapping, fallback_python, output, verbose):  # noqa: D103
+@click.pass_context
+def main(ctx, custom_mapping, fallback_python, mapping_rule, mapping_rules, outputs, plan_file, parser, shards, durations, parallel, affected, stages, quick_envs, quick_duration, fail_fast, concurrency_group, cancel_in_progress, max_parallel, timeout_minutes, wheelhouse, record_durations, no_cache, check, to_stdout, watch, timings, profile_path, stats_path, verbose):  # noqa: D103,E501
     if verbose:
         logging.basicConfig(level=logging.DEBUG)
     else:
         logging.basicConfig(level=logging.INFO)
 
-    envs = get_all_environments()
+    from .registry import InvalidRegistry, default_registry
+
+    # Everything else uses the registry as well, report a broken one once
+    try:
+        registry = default_registry()
+    except InvalidRegistry as e:
+        raise click.ClickException("Can't load the python registry: {}"
+                                   .format(e))
+
+    stats = None
+    if timings or stats_path is not None:
+        stats = _start_stats(ctx)
+    profiler = None
+    if profile_path is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if stats is not None or profiler is not None:
+        ctx.call_on_close(lambda: _report(stats, timings, stats_path,
+                                          profiler, profile_path))
+
+    cache = None
+    if not no_cache:
+        # A daemon passes its own, in-memory cache
+        cache = (ctx.obj or {}).get("cache")
+        if cache is None:
+            from .cache import Cache
+
+            cache = Cache()
+
+    rules = list(mapping_rule)
+    if rules or mapping_rules is not None:
+        from .rules import InvalidRule, RuleSet, read_rules
+
+        try:
+            if mapping_rules is not None:
+                rules.extend(read_rules(mapping_rules))
+            RuleSet(rules)
+        except InvalidRule as e:
+            raise click.BadParameter(str(e), param_hint="mapping rules")
+        known = set(registry.names)
+        known.update(basepython for basepython, _ in custom_mapping)
+        for pattern, target in rules:
+            if target not in known:
+                raise click.BadParameter(
+                    "{} is not a known basepython, but was specified as the "
+                    "target of {}".format(target, pattern),
+                    param_hint="mapping rules")
+
+    if quick_envs:
+        from .rules import InvalidRule
+        from .stage import Staging
+
+        try:
+            Staging(quick_envs)
+        except InvalidRule as e:
+            raise click.BadParameter(str(e), param_hint="--quick-env")
+
+    duration_data = None
+    # `run` orders the jobs by them, even without --shards or --stages
+    if durations:
+        from .shard import load_durations
+
+        try:
+            duration_data = load_durations(durations)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise click.BadParameter(str(e), param_hint="--durations")
+
+    if fallback_python is not None:
+        if fallback_python not in registry.names:
+            raise click.BadParameter(
+                "{} is not a known basepython".format(fallback_python),
+                param_hint="--fallback-python")
+        # py38 and 3.8 are the same fallback as python3.8
+        fallback_python = canonical_basepython(fallback_python)
+
+    if wheelhouse and "travis" in outputs:
+        logging.warning("--wheelhouse is only supported for GitHub Actions, "
+                        "the Travis CI configuration doesn't use it")
+
+    # The only place looking at the current directory, everything else gets
+    # explicit paths
+    root = os.getcwd()
+    fingerprint_options = dict(toxini=root,
+                               custom_mapping=custom_mapping,
+                               fallback_python=fallback_python,
+                               parser=parser,
+                               mapping_rules=rules,
+                               shards=shards,
+                               durations=duration_data,
+                               parallel=parallel,
+                               affected=affected,
+                               stages=stages,
+                               quick_envs=list(quick_envs),
+                               quick_duration=quick_duration,
+                               fail_fast=fail_fast,
+                               concurrency_group=concurrency_group,
+                               cancel_in_progress=cancel_in_progress,
+                               max_parallel=max_parallel,
+                               timeout_minutes=timeout_minutes,
+                               wheelhouse=wheelhouse,
+                               record_durations=record_durations)
+    options = dict(fingerprint_options, cache=cache)
+    # Writing the same file twice is pointless
+    outputs = list(OrderedDict.fromkeys(outputs))
+    if ctx.invoked_subcommand is not None:
+        if plan_file is not None:
+            raise click.UsageError("--plan can't be used with subcommands")
+        ctx.obj = dict(options, outputs=outputs)
+        return
+
+    from .plan import InvalidPlan, Plan
+
+    plan = None
+    if plan_file is not None:
+        if watch:
+            raise click.UsageError("--plan can't be used with --watch")
+        try:
+            plan = Plan.load(plan_file)
+        except InvalidPlan as e:
+            raise click.BadParameter(str(e), param_hint="--plan")
+
+    if to_stdout:
+        if len(outputs) > 1 or check or watch:
+            raise click.UsageError("--stdout can only be used with a single "
+                                   "--output and neither --check nor "
+                                   "--watch")
+        if plan is None:
+            plan = Plan.create(stats=stats, **options)
+        plan.render_document(outputs[0], sys.stdout)
+        return
+
+    if check:
+        out_of_date = _check(outputs, plan, fingerprint_options, options,
+                             root, stats)
+        for path in out_of_date:
+            click.echo("{} is out of date".format(path), err=True)
+        if out_of_date:
+            sys.exit(1)
+        return
+
+    if plan is None:
+        plan = Plan.create(stats=stats, **options)
+    plan.render(outputs, root, stats=stats)
+
+    if watch:
+        _watch(outputs, plan.basepythons, options, root)
+
+
+def _start_stats(ctx):
+    from .stats import Stats
+
+    stats = Stats()
+    # A daemon passes an initial context object, it imported everything
+    # long before this run
+    if ctx.obj is None:
+        wall, cpu = _IMPORT_STARTED
+        stats.add("import", perf_counter() - wall, process_time() - cpu)
+    return stats
+
+
+def _report(stats, timings, stats_path, profiler, profile_path):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+    if stats is None:
+        return
+    if timings:
+        click.echo(stats.format_timings(), err=True)
+    if stats_path is not None:
+        import json
+
+        with click.open_file(stats_path, "w") as fp:
+            json.dump(stats.to_dict(), fp, indent=2)
+            fp.write("\n")
+
+
+def _check(outputs, plan, fingerprint_options, options, directory,
+           stats=None):
+    """Return the paths of the files in `outputs` that are out of date."""
+    from os.path import join
+    from .plan import Plan
+    from .writers import read_fingerprint
+
+    out_of_date = []
+    for output in outputs:
+        path = get_writer(output).filename
+        if plan is not None:
+            fingerprint = plan.fingerprints.get(output)
+        else:
+            fingerprint = Plan.fingerprint(output, **fingerprint_options)
+        if fingerprint is not None:
+            # The fingerprint is part of the output, so the file is out of
+            # date if they differ
+            up_to_date = (read_fingerprint(join(directory, path)) ==
+                          fingerprint)
+        else:
+            if plan is None:
+                plan = Plan.create(stats=stats, **options)
+            up_to_date = not plan.render([output], directory, check=True,
+                                         stats=stats)
+        if not up_to_date:
+            out_of_date.append(path)
+    return out_of_date
+
+
+def _watch(outputs, basepythons, options, directory):
+    from os.path import dirname
+    from .config import CONFIG_CANDIDATES, find_config
+    from .watch import Regenerator, create_watcher, watch
+
+    if options["parser"] != "fast":
+        # Keep tox imported so falling back to it doesn't pay for that on
+        # every change
+        try:
+            import tox.config  # noqa: F401
+        except ImportError:
+            pass
+
+    config_path = find_config(options["toxini"])
+    config_directory = dirname(config_path) if config_path else directory
+    watcher = create_watcher(config_directory, CONFIG_CANDIDATES)
+    logging.info("Watching %s for changes", config_directory)
+    try:
+        watch(watcher, Regenerator(outputs, basepythons,
+                                   directory=directory, **options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+@main.command()
+@click.option("--root", default=".", show_default=True,
+              type=click.Path(exists=True, file_okay=False),
+              help="The directory to search for tox.ini files.")
+@click.option("--stdin", "from_stdin", is_flag=True,
+              help="Read tox.ini files or package directories from stdin "
+                   "instead of searching --root.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1),
+              help="The number of processes, defaults to the number of "
+                   "CPUs.")
+@click.option("--aggregate", is_flag=True,
+              help="Also write a single configuration for all packages to "
+                   "--root.")
+@click.pass_obj
+def batch(options, root, from_stdin, jobs, aggregate):
+    """Generate the configuration of every package in a monorepo."""
+    from .batch import (discover, generate_packages, read_paths,
+                        write_aggregate)
+    from .concurrency import Concurrency
+
+    outputs = options.pop("outputs")
+    # Every package is generated from its own configuration
+    options.pop("toxini")
+    if from_stdin:
+        toxinis = read_paths(click.get_text_stream("stdin"))
+    else:
+        toxinis = discover(root)
+
+    results = generate_packages(toxinis, outputs, jobs, **options)
+
+    failed = [result for result in results if result.error is not None]
+    for result in results:
+        if result.error is None:
+            logging.info("Generated %s", result.directory)
+        else:
+            logging.error("Failed to generate %s:\n%s", result.directory,
+                          result.error)
+
+    if aggregate:
+        staging = None
+        if options.get("stages"):
+            from .stage import Staging
+
+            staging = Staging(options["quick_envs"], options["durations"],
+                              options["quick_duration"])
+        concurrency = Concurrency(options["concurrency_group"],
+                                  options["cancel_in_progress"],
+                                  options["max_parallel"],
+                                  options["timeout_minutes"])
+        for output in outputs:
+            write_aggregate(results, output, root, options.get("parallel"),
+                            options.get("affected"), staging,
+                            options.get("fail_fast"), concurrency,
+                            options.get("wheelhouse"),
+                            options.get("record_durations"))
+
+    if failed:
+        logging.error("%d of %d packages failed", len(failed), len(results))
+        sys.exit(1)
+
+
+@main.command("plan")
+@click.option("--file", "plan_file", type=click.File("w"),
+              help="The file to save the plan to, defaults to stdout.")
+@click.pass_obj
+def plan_command(options, plan_file):
+    """Save the matrix plan as JSON instead of rendering it.
+
+    Render it later with `tox2travis --plan FILE`.
+    """
+    from .plan import Plan
+
+    options.pop("outputs")
+    Plan.create(**options).dump(plan_file or sys.stdout)
+
+
+@main.command("run")
+@click.option("--jobs", "-j", type=click.IntRange(min=1),
+              help="The number of jobs to run at the same time, defaults to "
+                   "the number of CPUs.")
+@click.option("--workdir", default=".tox2travis", show_default=True,
+              type=click.Path(file_okay=False),
+              help="The directory for the tox work directories and logs of "
+                   "the jobs.")
+@click.option("--tox", "tox", default="tox", show_default=True,
+              help="The command running tox.")
+@click.option("--junit", "junit_file", type=click.File("wb"),
+              help="Write a JUnit XML report to this file.")
+@click.option("--json", "json_file", type=click.File("w"),
+              help="Write a JSON summary to this file, `-` for stdout. It "
+                   "can be passed to --durations.")
+@click.argument("tox_args", nargs=-1, type=click.UNPROCESSED)
+@click.pass_obj
+def run_command(options, jobs, workdir, tox, junit_file, json_file, tox_args):  # noqa: E501
+    """Run the jobs the CI would run on this machine.
+
+    Every job runs in its own tox work directory. Arguments after `--` are
+    passed on to tox.
+    """
+    from .config import find_config
+    from .plan import Plan
+    from .run import plan_jobs, run_jobs, write_json, write_junit
+
+    options.pop("outputs")
+    config_path = find_config(options["toxini"])
+    if config_path is None:
+        raise click.ClickException("no tox configuration found")
+    plan = Plan.create(**options)
+    planned = plan_jobs(plan.basepythons, options.get("durations"))
+    logging.info("Running %d jobs in %s", len(planned), workdir)
+
+    def progress(result, done, total):
+        status = "passed" if result.passed else "failed"
+        click.echo("[{}/{}] {} {} in {:.1f}s ({})".format(
+            done, total, result.name, status, result.duration, result.log),
+            err=True)
+
+    results = run_jobs(planned, config_path, workdir, jobs, tox,
+                       plan.parallel, tox_args, progress)
+    if junit_file is not None:
+        write_junit(results, junit_file)
+    if json_file is not None:
+        write_json(results, json_file)
+
+    failed = [result.name for result in results if not result.passed]
+    if failed:
+        logging.error("%d of %d jobs failed: %s", len(failed), len(results),
+                      ", ".join(failed))
+        sys.exit(1)
 
-    basepythons = deepcopy(ALL_KNOWN_BASEPYTHONS)
-    for mapping in custom_mapping:
-        basepython, travis_version = mapping
-        basepythons.append(BasePython(basepython, travis_version))
 
-    basepythons = fill_basepythons(basepythons, envs, fallback_python)
+@main.command()
+@click.option("--socket", "socket_path",
+              help="The path of the socket to listen on, defaults to "
+                   "$TOX2TRAVIS_SOCKET or $XDG_RUNTIME_DIR/tox2travis.sock.")
+def serve(socket_path):
+    """Keep tox2travis loaded and serve requests on a Unix socket.
 
-    writer = None
-    for w in ALL_WRITERS:
-        if w.name == output:
-            writer = w
-            break
+    Point $TOX2TRAVIS_SOCKET at the socket to have tox2travis invocations
+    run in this daemon.
+    """
+    from .server import Server, default_socket_path
 
-    with w() as writer:
-        writer.header()
-        writer.generate_matrix_specifications(basepythons)
-        writer.footer()
+    socket_path = socket_path or default_socket_path()
+    try:
+        server = Server(socket_path)
+    except OSError as e:
+        raise click.ClickException(str(e))
+    logging.info("Listening on %s", socket_path)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == "__main__":
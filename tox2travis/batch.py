@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Generate the CI configuration of many packages at once."""
+import logging
+import os
+import traceback
+
+
+from concurrent.futures import ProcessPoolExecutor
+from os.path import abspath, dirname, isdir, join, relpath
+
+
+#: Directory names that are never searched for tox configuration files
+SKIPPED_DIRECTORIES = {"node_modules", "__pycache__", "build", "dist",
+                       "venv"}
+
+
+def discover(root):
+    """Find all ``tox.ini`` files below `root`.
+
+    Hidden directories (like ``.git`` or ``.tox``) and the directories in
+    :data:`SKIPPED_DIRECTORIES` are not searched.
+
+    :param str root:
+    :rtype: [str]
+    """
+    toxinis = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith(".") and
+                             d not in SKIPPED_DIRECTORIES)
+        if "tox.ini" in filenames:
+            toxinis.append(join(dirpath, "tox.ini"))
+    return toxinis
+
+
+def read_paths(stream):
+    """Read tox configuration files or package directories from `stream`,
+    one per line.
+
+    :param stream: A file-like object
+    :rtype: [str]
+    """
+    paths = []
+    for line in stream:
+        path = line.strip()
+        if not path:
+            continue
+        if isdir(path):
+            path = join(path, "tox.ini")
+        paths.append(path)
+    return paths
+
+
+class PackageResult:
+    """The outcome of generating the configuration of a single package."""
+
+    def __init__(self, toxini, basepythons=None, error=None):  # noqa: D400
+        """
+        :param str toxini:
+        :param list basepythons: The resolved basepythons, as returned by
+                                 :func:`tox2travis.cache.dump_basepythons`
+        :param str error: The formatted exception, if generation failed
+        """
+        self.toxini = toxini
+        self.basepythons = basepythons
+        self.error = error
+
+    @property
+    def directory(self):
+        """Return the directory of the package.
+
+        :rtype: str
+        """
+        return dirname(self.toxini)
+
+
+def generate_package(toxini, outputs, **options):
+    """Write the CI configurations for the package configured by `toxini`.
+
+    Errors are not raised but returned in the result.
+
+    :param str toxini:
+    :param [str] outputs: Names of writers
+    :param options: Passed on to
+                    :func:`tox2travis.tox2travis.resolve_basepythons`
+    :rtype: PackageResult
+    """
+    from .cache import dump_basepythons
+    from .plan import Plan
+
+    try:
+        plan = Plan.create(toxini, **options)
+        plan.render(outputs, dirname(toxini))
+    except (Exception, SystemExit):
+        return PackageResult(toxini, error=traceback.format_exc())
+    return PackageResult(toxini,
+                         basepythons=dump_basepythons(plan.basepythons))
+
+
+def generate_packages(toxinis, outputs, jobs=None, **kwargs):
+    """Call :func:`generate_package` for all `toxinis` in `jobs` processes.
+
+    :param [str] toxinis:
+    :param [str] outputs:
+    :param int jobs: The number of processes, defaults to the number of CPUs
+    :param kwargs: Passed on to :func:`generate_package`
+    :rtype: [PackageResult]
+    """
+    toxinis = [abspath(toxini) for toxini in toxinis]
+    if jobs == 1 or len(toxinis) < 2:
+        return [generate_package(toxini, outputs, **kwargs)
+                for toxini in toxinis]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(generate_package, toxini, outputs,
+                                   **kwargs)
+                   for toxini in toxinis]
+        return [future.result() for future in futures]
+
+
+def write_aggregate(results, output, root, parallel=None, affected=False,
+                    staging=None, fail_fast=None, concurrency=None,
+                    wheelhouse=False, record_durations=False):
+    """Write a single CI configuration in `root` for all packages in
+    `results`.
+
+    :param [PackageResult] results:
+    :param str output: The name of a writer
+    :param str root:
+    :param str parallel: Run the environments of each job in parallel with
+                         ``tox -p parallel``
+    :param bool affected: Only run the jobs whose inputs changed
+    :param tox2travis.stage.Staging staging: Run the jobs in stages
+    :param bool fail_fast: Whether a failing job cancels the build
+    :param tox2travis.concurrency.Concurrency concurrency:
+    :param bool wheelhouse: Build the packages and wheels of all
+                            dependencies once, before running tox
+    :param bool record_durations: Record the durations of the environments
+                                  of every job
+    """
+    from .cache import load_basepythons
+    from .tox2travis import get_writer
+
+    with get_writer(output)(root, parallel=parallel, aggregate=True,
+                            affected=affected, staging=staging,
+                            fail_fast=fail_fast, concurrency=concurrency,
+                            wheelhouse=wheelhouse,
+                            record_durations=record_durations) as writer:
+        writer.header()
+        for result in results:
+            if result.error is not None:
+                continue
+            package = relpath(result.directory, root)
+            logging.debug("Adding %s to the aggregated configuration",
+                          package)
+            writer.generate_matrix_specifications(
+                load_basepythons(result.basepythons), package)
+        writer.footer()
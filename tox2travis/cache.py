@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""An on-disk cache of resolved environments.
+
+Entries are keyed by a hash of everything that influences the result of
+:func:`tox2travis.tox2travis.get_all_environments` and
+:func:`tox2travis.tox2travis.fill_basepythons`: the contents of all tox
+configuration files next to the one in use, the custom mappings and fallback
+python, the parser, the running interpreter (the default basepython of
+environments without one) and the versions of tox and tox2travis. Changing
+any of those produces a different key, so stale entries are never used, they
+just age out of the cache. Configurations that depend on the environment
+(through ``{env:...}`` substitutions) are never cached.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+
+
+from collections import OrderedDict
+from os.path import expanduser, getmtime, getsize, join
+from tempfile import NamedTemporaryFile
+
+
+#: Bump this whenever the format of cache entries changes
+CACHE_FORMAT_VERSION = 3
+
+#: The maximum size of all cache entries in bytes
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Return the directory cache entries are stored in.
+
+    :rtype: str
+    """
+    cache_dir = os.environ.get("TOX2TRAVIS_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    cache_home = (os.environ.get("XDG_CACHE_HOME") or
+                  join(expanduser("~"), ".cache"))
+    return join(cache_home, "tox2travis")
+
+
+def _distribution_version(name):
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        return None
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def _tox2travis_version():
+    try:
+        from .version import version
+    except ImportError:
+        return None
+    return version
+
+
+class Cache:
+    """A size-bounded, least recently used cache of resolved environments."""
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):  # noqa: D400,E501
+        """
+        :param str directory: Defaults to :func:`default_cache_dir`
+        :param int max_size: The maximum size of all entries in bytes
+        """
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+
+    @staticmethod
+    def key(config_path, **options):
+        """Return the cache key for the given inputs.
+
+        :param str config_path: The tox configuration file in use
+        :param options: The arguments of
+                        :func:`tox2travis.tox2travis.resolve_basepythons`
+                        influencing the result
+        :rtype: str or None
+        :return: None if the configuration can't be cached
+        """
+        from .config import hash_config_files
+
+        inputs = {
+            "format": CACHE_FORMAT_VERSION,
+            "tox2travis": _tox2travis_version(),
+            "tox": _distribution_version("tox"),
+            "python": sys.executable,
+            "config_path": config_path,
+            "options": options,
+        }
+        inputs["config_files"] = hash_config_files(config_path)
+        if inputs["config_files"] is None:
+            return None
+        serialized = json.dumps(inputs, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(serialized).hexdigest()
+
+    def _path(self, key):
+        return join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Return the basepythons stored for `key`.
+
+        :param str key:
+        :rtype: [tox2travis.tox2travis.BasePython] or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as fp:
+                data = json.load(fp)
+            basepythons = load_basepythons(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.debug("Removing broken cache entry %s: %s", path, e)
+            self._remove(path)
+            return None
+        # Mark this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logging.debug("Using cached environments from %s", path)
+        return basepythons
+
+    def put(self, key, basepythons):
+        """Store `basepythons` for `key`.
+
+        :param str key:
+        :param [tox2travis.tox2travis.BasePython] basepythons:
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with NamedTemporaryFile("w", dir=self.directory,
+                                    suffix=".tmp", delete=False,
+                                    encoding="utf-8") as fp:
+                json.dump(dump_basepythons(basepythons), fp)
+            os.replace(fp.name, self._path(key))
+        except OSError as e:
+            logging.debug("Could not write cache entry: %s", e)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits into
+        :attr:`max_size`.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = join(self.directory, name)
+            try:
+                entries.append((getmtime(path), getsize(path), path))
+            except OSError:
+                continue
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_size:
+                self._remove(path)
+
+    def clear(self):
+        """Remove all entries."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith((".json", ".tmp")):
+                self._remove(join(self.directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class MemoryCache:
+    """A least recently used cache of resolved environments in memory, for
+    long running processes. Misses are looked up in `backend`.
+    """
+
+    key = staticmethod(Cache.key)
+
+    def __init__(self, backend=None, max_entries=128):  # noqa: D400
+        """
+        :param Cache backend: A cache to consult on misses and to store
+                              entries in as well
+        :param int max_entries:
+        """
+        self.backend = backend
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Threads generating different projects may share a cache
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the basepythons stored for `key`.
+
+        :param str key:
+        :rtype: [tox2travis.tox2travis.BasePython] or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            return load_basepythons(entry)
+        if self.backend is None:
+            return None
+        basepythons = self.backend.get(key)
+        if basepythons is not None:
+            self._store(key, basepythons)
+        return basepythons
+
+    def put(self, key, basepythons):
+        """Store `basepythons` for `key`.
+
+        :param str key:
+        :param [tox2travis.tox2travis.BasePython] basepythons:
+        """
+        self._store(key, basepythons)
+        if self.backend is not None:
+            self.backend.put(key, basepythons)
+
+    def _store(self, key, basepythons):
+        # Entries are stored serialized so callers can't modify them
+        entry = dump_basepythons(basepythons)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _dump_environment(env):
+    data = {"envname": env.envname, "basepython": env.basepython}
+    deps = getattr(env, "deps", None)
+    if deps:
+        data["deps"] = [str(dep) for dep in deps]
+    inputs = getattr(env, "inputs", None)
+    if inputs is not None:
+        data["inputs"] = list(inputs)
+    return data
+
+
+def dump_basepythons(basepythons):
+    """Return a JSON serializable representation of `basepythons`.
+
+    :param [tox2travis.tox2travis.BasePython] basepythons:
+    :rtype: list
+    """
+    data = []
+    for bp in basepythons:
+        entry = {"tox_version": bp.tox_version,
+                 "travis_version": bp.travis_version,
+                 "actions_version": bp.actions_version,
+                 "environments": [_dump_environment(env)
+                                  for env in bp.environments]}
+        if bp.sharded:
+            entry["jobs"] = [[env.envname for env in job] for job in bp.jobs]
+        data.append(entry)
+    return data
+
+
+def load_basepythons(data):
+    """Create :class:`~tox2travis.tox2travis.BasePython` objects from `data`.
+
+    :param list data: As returned by :func:`dump_basepythons`
+    :rtype: [tox2travis.tox2travis.BasePython]
+    """
+    from .config import Environment
+    from .tox2travis import BasePython
+
+    basepythons = []
+    for entry in data:
+        bp = BasePython(entry["tox_version"], entry["travis_version"],
+                        [Environment(env["envname"], env["basepython"],
+                                     env.get("deps", ()), env.get("inputs"))
+                         for env in entry["environments"]],
+                        entry["actions_version"])
+        if "jobs" in entry:
+            environments = {env.envname: env for env in bp.environments}
+            bp.jobs = [[environments[envname] for envname in job]
+                       for job in entry["jobs"]]
+        basepythons.append(bp)
+    return basepythons
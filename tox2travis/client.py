@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""The ``tox2travis`` entry point.
+
+If ``$TOX2TRAVIS_SOCKET`` points to the socket of a running
+``tox2travis serve``, the invocation is forwarded to it. Otherwise (or if no
+daemon is listening) it runs in this process. This module deliberately
+imports as little as possible, forwarding should be cheap.
+"""
+import json
+import os
+import socket
+import sys
+
+
+#: The environment variable pointing to the daemon's socket
+SOCKET_ENVIRONMENT_VARIABLE = "TOX2TRAVIS_SOCKET"
+
+#: Invocations containing these arguments always run in this process, ``-``
+#: reads from stdin. ``run`` and ``batch`` take long and would block the
+#: daemon for every other client.
+_LOCAL_ONLY_ARGUMENTS = {"serve", "run", "batch", "--watch", "--stdin",
+                         "--help", "-"}
+
+
+def _runs_locally(argv):
+    """Return whether the command line `argv` has to run in this process.
+
+    Besides :data:`_LOCAL_ONLY_ARGUMENTS` that's the case for options reading
+    a file from stdin like ``--plan=-``, the daemon would read its own.
+
+    :param [str] argv:
+    :rtype: bool
+    """
+    return any(arg in _LOCAL_ONLY_ARGUMENTS or
+               (arg.startswith("-") and arg.endswith("=-"))
+               for arg in argv)
+
+
+def forward(socket_path, argv):
+    """Run the command line `argv` in the daemon listening on `socket_path`.
+
+    :param str socket_path:
+    :param [str] argv: The arguments, without the program name
+    :rtype: dict
+    :return: The response containing ``exit_code``, ``stdout`` and
+             ``stderr``
+    :raises OSError: if no daemon is listening on `socket_path`
+    """
+    request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as fp:
+            response = fp.readline()
+    if not response:
+        raise ConnectionError("the daemon closed the connection")
+    return json.loads(response.decode("utf-8"))
+
+
+def run(argv=None):
+    """Run tox2travis, in the daemon if possible.
+
+    :param [str] argv: The arguments, defaults to :data:`sys.argv`
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    socket_path = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE)
+    if socket_path and not _runs_locally(argv):
+        try:
+            response = forward(socket_path, argv)
+        except (OSError, ValueError):
+            pass
+        else:
+            sys.stdout.write(response["stdout"])
+            sys.stderr.write(response["stderr"])
+            sys.exit(response["exit_code"])
+
+    from .__main__ import main
+
+    main(argv)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Limit how many runners a build occupies and for how long.
+
+On GitHub Actions, all runs of the workflow for the same pull request (or
+branch) share a concurrency group, and a new run cancels the one in
+progress, so runners go to the newest commit. Jobs also get a timeout and
+optionally a limit on the number of their matrix entries running at the
+same time. Travis CI only has repository settings for these.
+"""
+
+#: The concurrency group of a run, shared by all runs for the same pull
+#: request or branch
+DEFAULT_GROUP = ("${{ github.workflow }}-"
+                 "${{ github.event.pull_request.number || github.ref }}")
+
+#: The time after which a job is cancelled, GitHub Actions' default is six
+#: hours
+DEFAULT_TIMEOUT_MINUTES = 60
+
+
+class Concurrency:
+    """The concurrency settings of the generated jobs."""
+
+    def __init__(self, group=DEFAULT_GROUP, cancel_in_progress=True,
+                 max_parallel=None, timeout_minutes=DEFAULT_TIMEOUT_MINUTES):  # noqa: D400,E501
+        """
+        :param str group: The concurrency group of a run, ``None`` doesn't
+                          use one
+        :param bool cancel_in_progress: Whether a new run in `group` cancels
+                                        the one in progress
+        :param int max_parallel: The number of matrix entries of a job
+                                 running at the same time, ``None`` doesn't
+                                 limit it
+        :param int timeout_minutes: Cancel jobs running longer than this,
+                                    ``None`` keeps the default of the CI
+        """
+        self.group = group or None
+        self.cancel_in_progress = cancel_in_progress
+        self.max_parallel = max_parallel
+        self.timeout_minutes = timeout_minutes or None
+
+    def to_dict(self):
+        """Return a JSON serializable representation of these settings.
+
+        :rtype: dict
+        """
+        return {"group": self.group,
+                "cancel_in_progress": self.cancel_in_progress,
+                "max_parallel": self.max_parallel,
+                "timeout_minutes": self.timeout_minutes}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create the settings from `data`.
+
+        :param dict data: As returned by :meth:`to_dict`
+        :rtype: Concurrency
+        """
+        return cls(data.get("group"), data.get("cancel_in_progress", False),
+                   data.get("max_parallel"), data.get("timeout_minutes"))
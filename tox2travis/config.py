@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""A fast reader for the parts of a tox configuration tox2travis needs.
+
+This module does not import tox. It only understands the subset of the tox
+configuration format that is necessary to find all environments and their
+basepython and deps: the envlist (including generative envlists like
+``py{36,37}-django{22,30}``), generative section names, factor conditional
+settings and the implicit basepython derived from factors. Anything it can't
+resolve on its own (for example substitutions in ``basepython`` or ``deps``)
+raises :class:`UnsupportedConfigError`, so callers can fall back to tox itself.
+"""
+import hashlib
+import itertools
+import re
+import shlex
+import sys
+
+
+from configparser import ConfigParser, Error as ConfigParserError
+from os import getcwd, sep
+from os.path import (abspath, basename, dirname, isdir, isfile, join,
+                     normpath, relpath)
+
+
+#: Config file names in the order tox looks for them
+CONFIG_CANDIDATES = ("pyproject.toml", "tox.ini", "setup.cfg")
+
+TESTENV_PREFIX = "testenv:"
+
+# These mirror the patterns tox uses for the same purpose
+_FACTOR_LINE_PATTERN = re.compile(r"^([\w{}.!,-]+):\s+(.+)")
+_ENVSTR_SPLIT_PATTERN = re.compile(r"((?:{[^}]+})+)|,")
+_ENVSTR_EXPAND_PATTERN = re.compile(r"{([^}]+)}")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_SECTION_FACTOR_PATTERN = re.compile(r"{\s*([\w\s,-]+)\s*}")
+_SECTION_SPLIT_PATTERN = re.compile(r"\s*,\s*")
+PY_FACTORS_RE = re.compile("^(?!py$)(py|pypy|jython)([2-9][0-9]?[0-9]?)?$")
+_INLINE_COMMENT_PATTERN = re.compile(r"\s+#.*$")
+_POSARGS_PATTERN = re.compile(r"\{posargs(?::([^}]*))?\}|\[\]")
+_SECTION_REFERENCE_PATTERN = re.compile(r"\{\[([^\]{}]+)\]([^}]+)\}")
+
+#: How the tox configuration directory appears in dependencies
+TOXINIDIR = "{toxinidir}"
+
+#: Substitutions that make a configuration depend on more than its files
+_ENVIRONMENT_DEPENDENT_MARKERS = (b"{env:",)
+
+
+class UnsupportedConfigError(Exception):
+    """Exception raised when a configuration can't be handled without tox."""
+
+
+class Environment:
+    """A tox environment, as far as tox2travis is concerned."""
+
+    __slots__ = ("envname", "basepython", "deps", "inputs")
+
+    def __init__(self, envname, basepython, deps=(), inputs=None):  # noqa: D400,E501
+        """
+        :param str envname:
+        :param str basepython:
+        :param [str] deps: The dependencies, with the tox configuration
+                           directory as :data:`TOXINIDIR`
+        :param [str] inputs: The paths the environment depends on, see
+                             :func:`environment_inputs`. None if they are
+                             unknown.
+        """
+        self.envname = envname
+        self.basepython = basepython
+        self.deps = list(deps)
+        self.inputs = None if inputs is None else list(inputs)
+
+    def __repr__(self):
+        if not self.deps:
+            return "Environment({!r}, {!r})".format(self.envname,
+                                                    self.basepython)
+        return "Environment({!r}, {!r}, {!r})".format(self.envname,
+                                                      self.basepython,
+                                                      self.deps)
+
+
+def normalize_dep(dep, toxinidir):
+    """Replace the absolute tox configuration directory in `dep`, as tox
+    substitutes it, with :data:`TOXINIDIR`.
+
+    This keeps dependencies independent of where the repository is checked
+    out.
+
+    :param str dep:
+    :param str toxinidir:
+    :rtype: str
+    """
+    return dep.replace(toxinidir, TOXINIDIR)
+
+
+def minimal_paths(paths):
+    """Return the sorted `paths` without those inside of another one.
+
+    :param [str] paths: Normalized relative paths, ``.`` contains all others
+                        that don't start with ``..``
+    :rtype: [str]
+    """
+    result = []
+    for path in sorted(set(paths), key=lambda path: (path.count("/"), path)):
+        if any(path == other or path.startswith(other + "/") or
+               (other == "." and not path.startswith(".."))
+               for other in result):
+            continue
+        result.append(path)
+    return sorted(result)
+
+
+def _inside(path, directory):
+    rel = relpath(path, directory)
+    return not (rel == ".." or rel.startswith(".." + sep))
+
+
+def _command_path(arg, changedir, toxinidir):
+    """Return the absolute path `arg` of a command refers to, or None if
+    it's no path tox2travis can resolve.
+    """
+    if arg.startswith("-"):
+        # --option=path
+        arg = arg.partition("=")[2]
+    arg = arg.replace(TOXINIDIR, toxinidir)
+    if not arg or "{" in arg or "$" in arg or "://" in arg:
+        return None
+    return normpath(join(changedir, arg))
+
+
+def environment_inputs(config_path, changedir, commands, installs_package,
+                       workdir=None):
+    """Return the paths an environment depends on.
+
+    These are the tox configuration, the directory its commands run in and
+    the paths its commands reference. If it installs the package, which can
+    be anywhere, that's the whole configuration directory. Requirement files
+    are not included, see :func:`tox2travis.writers.dependency_files`.
+
+    Guessing which arguments of commands are paths only ever adds inputs, so
+    the result errs on the side of too many.
+
+    :param str config_path: The absolute path of the tox configuration
+    :param str changedir: The absolute directory the commands run in, None
+                          if it's unknown
+    :param [[str]] commands: The arguments of every command, paths may be
+                             absolute, relative to `changedir` or start with
+                             :data:`TOXINIDIR`
+    :param bool installs_package:
+    :param str workdir: The absolute path of tox's working directory,
+                        defaults to ``.tox`` in the configuration directory
+    :rtype: [str]
+    :return: Normalized paths relative to the configuration directory,
+             ``.`` being the whole directory
+    """
+    toxinidir = dirname(config_path)
+    workdir = workdir or join(toxinidir, ".tox")
+    inputs = [basename(config_path)]
+    if installs_package or changedir is None or _inside(changedir, workdir):
+        # Commands running in tox's working directory (like {envtmpdir})
+        # can't be told apart from those using the whole directory
+        inputs.append(".")
+        changedir = changedir or toxinidir
+    else:
+        inputs.append(relpath(changedir, toxinidir))
+    for argv in commands:
+        for arg in argv:
+            path = _command_path(arg, changedir, toxinidir)
+            if path is not None and not _inside(path, workdir):
+                inputs.append(relpath(path, toxinidir))
+    return minimal_paths(inputs)
+
+
+def find_config(path=None):
+    """Find the configuration file tox would use for `path`.
+
+    Like tox, this looks for ``pyproject.toml``, ``tox.ini`` and
+    ``setup.cfg`` in `path` and all of its parents, skipping files that don't
+    contain a tox configuration.
+
+    :param str path: A file or directory, defaults to the current directory
+    :rtype: str or None
+    """
+    if path is not None and isfile(path):
+        return abspath(path)
+    folder = abspath(path if path is not None else getcwd())
+    if not isdir(folder):
+        return None
+    for candidate in CONFIG_CANDIDATES:
+        current = folder
+        while True:
+            config_path = join(current, candidate)
+            if isfile(config_path) and _has_tox_section(config_path):
+                return config_path
+            parent = dirname(current)
+            if parent == current:
+                break
+            current = parent
+    return None
+
+
+def hash_config_files(config_path):
+    """Return a hash of the contents of all tox config files in the
+    directory of `config_path`.
+
+    :param str config_path:
+    :rtype: str or None
+    :return: None if the configuration depends on environment variables
+    """
+    hasher = hashlib.sha256()
+    for candidate in CONFIG_CANDIDATES:
+        path = join(dirname(config_path), candidate)
+        if not isfile(path):
+            continue
+        with open(path, "rb") as fp:
+            content = fp.read()
+        if any(marker in content
+               for marker in _ENVIRONMENT_DEPENDENT_MARKERS):
+            return None
+        hasher.update(candidate.encode("utf-8"))
+        hasher.update(hashlib.sha256(content).digest())
+    return hasher.hexdigest()
+
+
+def _has_tox_section(config_path):
+    name = basename(config_path)
+    if name == "pyproject.toml":
+        try:
+            return read_ini_content(config_path) is not None
+        except UnsupportedConfigError:
+            # Let tox decide what to do with this file
+            return True
+    if name == "setup.cfg":
+        with open(config_path, encoding="utf-8") as fp:
+            return any(line.strip() == "[tox:tox]" for line in fp)
+    return True
+
+
+def _load_toml(fp):
+    try:
+        import tomllib as toml
+    except ImportError:
+        try:
+            import tomli as toml
+        except ImportError:
+            raise UnsupportedConfigError("no TOML parser available")
+    return toml.load(fp)
+
+
+def read_ini_content(config_path):
+    """Return the ini-style tox configuration contained in `config_path`.
+
+    :param str config_path:
+    :rtype: str or None
+    """
+    if basename(config_path) == "pyproject.toml":
+        with open(config_path, "rb") as fp:
+            data = _load_toml(fp)
+        try:
+            return data["tool"]["tox"]["legacy_tox_ini"]
+        except KeyError:
+            return None
+    with open(config_path, encoding="utf-8") as fp:
+        return fp.read()
+
+
+def split_env(envstr):
+    """Split and expand an envlist into a list of environment names.
+
+    :param str envstr:
+    :rtype: [str]
+    """
+    envs = [e.split("#", 1)[0].strip() for e in envstr.split("\n")]
+    return expand_envstr(",".join(e for e in envs if e))
+
+
+def expand_envstr(envstr):
+    """Expand a single generative envlist like ``py{36,37}-django{22,30}``.
+
+    :param str envstr:
+    :rtype: [str]
+    """
+    tokens = _ENVSTR_SPLIT_PATTERN.split(envstr)
+    envlist = ["".join(g).strip()
+               for k, g in itertools.groupby(tokens, key=bool) if k]
+
+    result = []
+    for env in envlist:
+        tokens = _ENVSTR_EXPAND_PATTERN.split(env)
+        parts = [_WHITESPACE_PATTERN.sub("", token).split(",")
+                 for token in tokens]
+        result.extend("".join(variant)
+                      for variant in itertools.product(*parts))
+    return result
+
+
+def _split_factor_expr(expr):
+    result = []
+    for env in expand_envstr(expr):
+        raw = env.split("-")
+        included = {f for f in raw if not f.startswith("!")}
+        excluded = {f[1:] for f in raw if f.startswith("!")}
+        result.append((included, excluded))
+    return result
+
+
+def apply_factors(value, factors):
+    """Filter factor conditional lines in `value` for `factors`.
+
+    :param str value:
+    :param set factors:
+    :rtype: str
+    """
+    lines = []
+    for line in value.strip().splitlines():
+        match = _FACTOR_LINE_PATTERN.search(line)
+        if not match:
+            lines.append(line)
+            continue
+        expr, line = match.groups()
+        if any(included <= factors and not any(x in factors for x in excluded)
+               for included, excluded in _split_factor_expr(expr)):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def implied_basepython(factors):
+    """Return the basepython tox derives from an environments `factors`.
+
+    :param [str] factors:
+    :rtype: str or None
+    """
+    for factor in factors:
+        match = PY_FACTORS_RE.match(factor)
+        if match:
+            base_exe = {"py": "python"}.get(match.group(1), match.group(1))
+            version = match.group(2) or ""
+            if len(version) > 1:
+                version = "{}.{}".format(version[0], version[1:])
+            return base_exe + version
+    return None
+
+
+class ToxConfig:
+    """The sections of a tox configuration file."""
+
+    def __init__(self, config_path, content=None):  # noqa: D400
+        """
+        :param str config_path:
+        :param str content: The ini content, read from `config_path` if not
+                            given
+        """
+        self.path = config_path
+        if content is None:
+            content = read_ini_content(config_path)
+        if content is None:
+            raise UnsupportedConfigError("{} contains no tox configuration"
+                                         .format(config_path))
+        parser = ConfigParser(interpolation=None, strict=False,
+                              default_section="\0")
+        parser.optionxform = str
+        try:
+            parser.read_string(content, source=config_path)
+        except ConfigParserError as e:
+            raise UnsupportedConfigError(str(e))
+        self._sections = self._expand_section_names(
+            {name: dict(parser.items(name)) for name in parser.sections()})
+        if basename(config_path) == "setup.cfg":
+            self.tox_section = "tox:tox"
+        else:
+            self.tox_section = "tox"
+
+    @staticmethod
+    def _expand_section_names(sections):
+        expanded = {}
+        for name, values in sections.items():
+            split = _SECTION_FACTOR_PATTERN.split(name)
+            for parts in itertools.product(*map(_SECTION_SPLIT_PATTERN.split,
+                                                split)):
+                expanded.setdefault("".join(parts), values)
+        return expanded
+
+    def get(self, section, key, default=None):
+        """Return the raw value of `key` in `section`.
+
+        :param str section:
+        :param str key:
+        :param str default:
+        :rtype: str
+        """
+        return self._sections.get(section, {}).get(key, default)
+
+    def get_testenv(self, envname, key, default=None):
+        """Return the value of `key` for the environment `envname`.
+
+        Factor conditional lines are already applied to the value.
+
+        :param str envname:
+        :param str key:
+        :param str default:
+        :rtype: str
+        """
+        value = self.get(TESTENV_PREFIX + envname, key)
+        if value is None:
+            value = self.get("testenv", key)
+        if value is None:
+            return default
+        return self.substitute_sections(value, set(envname.split("-")))
+
+    def substitute_sections(self, value, factors, seen=()):
+        """Replace the references to other values (``{[section]key}``) in
+        `value` and filter its factor conditional lines for `factors`, like
+        tox does.
+
+        :param str value:
+        :param set factors:
+        :param seen: The references being replaced, to detect cycles
+        :rtype: str
+        :raises UnsupportedConfigError: if a reference can't be resolved
+        """
+        def replace(match):
+            reference = (match.group(1).strip(), match.group(2).strip())
+            if reference in seen:
+                raise UnsupportedConfigError("{{[{}]{}}} refers to itself"
+                                             .format(*reference))
+            referenced = self.get(*reference)
+            if referenced is None:
+                raise UnsupportedConfigError("{{[{}]{}}} doesn't exist"
+                                             .format(*reference))
+            return self.substitute_sections(referenced, factors,
+                                            seen + (reference,))
+
+        return _SECTION_REFERENCE_PATTERN.sub(replace,
+                                              apply_factors(value, factors))
+
+    def getbool(self, section, key, default=False):
+        """Return the boolean value of `key` in `section`.
+
+        :param str section:
+        :param str key:
+        :param bool default:
+        :rtype: bool
+        """
+        value = self.get(section, key)
+        if value is None:
+            return default
+        return value.strip().lower() == "true"
+
+    @property
+    def envnames(self):
+        """Return the names of all environments, like tox would.
+
+        :rtype: [str]
+        """
+        envs = dict.fromkeys(split_env(self.get(self.tox_section, "envlist",
+                                                "")))
+        package_env = None
+        if self.getbool(self.tox_section, "isolated_build"):
+            package_env = self.get(self.tox_section, "isolated_build_env",
+                                   ".package").strip()
+        for section in self._sections:
+            if section.startswith(TESTENV_PREFIX):
+                envname = section[len(TESTENV_PREFIX):]
+                if envname != package_env:
+                    envs[envname] = None
+        if not envs:
+            envs["python"] = None
+        # tox configures the packaging environment like any other one
+        if package_env is not None:
+            envs[package_env] = None
+        return list(envs)
+
+    def basepython(self, envname):
+        """Return the basepython of the environment `envname`.
+
+        :param str envname:
+        :rtype: str
+        """
+        implied = implied_basepython(envname.split("-"))
+        if (implied is not None and
+            self.getbool(self.tox_section, "ignore_basepython_conflict")):
+            return implied
+        value = self.get_testenv(envname, "basepython")
+        if value is None:
+            return implied or sys.executable
+        value = value.strip()
+        if "{" in value:
+            raise UnsupportedConfigError("basepython of {} uses substitutions"
+                                         .format(envname))
+        return value
+
+    def deps(self, envname):
+        """Return the dependencies of the environment `envname`.
+
+        References to other values are replaced, other substitutions are
+        left alone. Configurations using ``{env:...}`` are never cached,
+        see :func:`hash_config_files`.
+
+        :param str envname:
+        :rtype: [str]
+        """
+        deps = []
+        for line in self.get_testenv(envname, "deps", "").splitlines():
+            line = _INLINE_COMMENT_PATTERN.sub("", line).strip()
+            if not line or line.startswith("#"):
+                continue
+            deps.append(line)
+        return deps
+
+    def commands(self, envname):
+        """Return the arguments of every command of the environment
+        `envname`.
+
+        ``{posargs}`` is replaced by its default, other substitutions are
+        left alone.
+
+        :param str envname:
+        :rtype: [[str]]
+        """
+        value = self.get_testenv(envname, "commands", "")
+        commands = []
+        for line in value.replace("\\\n", " ").splitlines():
+            line = _POSARGS_PATTERN.sub(lambda match: match.group(1) or "",
+                                        line).strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                commands.append(shlex.split(line))
+            except ValueError:
+                commands.append(line.split())
+        return commands
+
+    def inputs(self, envname):
+        """Return the paths the environment `envname` depends on, see
+        :func:`environment_inputs`.
+
+        :param str envname:
+        :rtype: [str]
+        """
+        toxinidir = dirname(self.path)
+        changedir = self.get_testenv(envname, "changedir")
+        if changedir is None:
+            changedir = toxinidir
+        else:
+            changedir = changedir.strip().replace(TOXINIDIR, toxinidir)
+            changedir = (None if "{" in changedir
+                         else normpath(join(toxinidir, changedir)))
+        workdir = self.get(self.tox_section, "toxworkdir")
+        if workdir is not None:
+            workdir = workdir.strip().replace(TOXINIDIR, toxinidir)
+            workdir = (None if "{" in workdir
+                       else normpath(join(toxinidir, workdir)))
+        skip_install = self.get_testenv(envname, "skip_install", "false")
+        installs_package = not (
+            self.getbool(self.tox_section, "skipsdist") or
+            skip_install.strip().lower() == "true")
+        return environment_inputs(self.path, changedir,
+                                  self.commands(envname), installs_package,
+                                  workdir)
+
+
+def parse_environments(config_path):
+    """Return all environments defined in the tox config at `config_path`.
+
+    :param str config_path:
+    :rtype: [Environment]
+    """
+    config = ToxConfig(config_path)
+    return [Environment(envname, config.basepython(envname),
+                        config.deps(envname), config.inputs(envname))
+            for envname in config.envnames]
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""The matrix plan, the intermediate representation between parsing the tox
+configuration and rendering CI configurations.
+
+A plan contains the resolved basepythons with their environments and CI
+versions, and the input fingerprint of every output. It can be saved as JSON
+and rendered later, without looking at the tox configuration again::
+
+    {
+        "version": 1,
+        "fingerprints": {"travis": "sha256:...", "actions": "sha256:..."},
+        "basepythons": [
+            {"tox_version": "python3.8", "travis_version": "3.8",
+             "actions_version": "3.8",
+             "environments": [{"envname": "py38", "basepython": "python3.8"}]}
+        ]
+    }
+"""
+import json
+
+
+from .concurrency import DEFAULT_GROUP, DEFAULT_TIMEOUT_MINUTES
+
+
+#: Bump this whenever the structure of saved plans changes
+PLAN_FORMAT_VERSION = 1
+
+
+class InvalidPlan(ValueError):
+    """Exception raised when a saved plan can't be loaded."""
+
+
+class Plan:
+    """The resolved basepythons of one tox configuration and the
+    fingerprints of the outputs generated from them.
+    """
+
+    def __init__(self, basepythons, fingerprints=None, parallel=None,
+                 affected=False, staging=None, fail_fast=None,
+                 concurrency=None, wheelhouse=False,
+                 record_durations=False):  # noqa: D400
+        """
+        :param [tox2travis.tox2travis.BasePython] basepythons:
+        :param dict fingerprints: The fingerprint of each output, by the
+                                  name of its writer
+        :param str parallel: Run the environments of each job in parallel
+                             with this many processes, or ``auto``
+        :param bool affected: Only run the jobs whose inputs changed
+        :param tox2travis.stage.Staging staging: Run the jobs in stages
+        :param bool fail_fast: Whether a failing job cancels the build
+        :param tox2travis.concurrency.Concurrency concurrency:
+        :param bool wheelhouse: Build the package and wheels of all
+                                dependencies once, before running tox
+        :param bool record_durations: Record the durations of the
+                                      environments of every job
+        """
+        self.basepythons = basepythons
+        self.fingerprints = fingerprints or {}
+        self.parallel = parallel
+        self.affected = affected
+        self.staging = staging
+        self.fail_fast = fail_fast
+        self.concurrency = concurrency
+        self.wheelhouse = wheelhouse
+        self.record_durations = record_durations
+
+    @staticmethod
+    def fingerprint(output, toxini=None, shards=None, durations=None,
+                    parallel=None, affected=False, stages=False,
+                    quick_envs=(), quick_duration=None, fail_fast=None,
+                    concurrency_group=DEFAULT_GROUP, cancel_in_progress=True,
+                    max_parallel=None,
+                    timeout_minutes=DEFAULT_TIMEOUT_MINUTES, wheelhouse=False,
+                    record_durations=False, **options):
+        """Return the input fingerprint of the output of the writer `output`
+        for a plan created with the same arguments.
+
+        Only the options that influence the output are part of it, see
+        :meth:`create`.
+
+        :param str output: The name of a writer
+        :rtype: str or None
+        """
+        from .tox2travis import input_fingerprint
+
+        if parallel and not shards:
+            shards = 1
+        if not (shards or stages):
+            durations = None
+        if not stages:
+            quick_envs, quick_duration = (), None
+        if fail_fast is not None:
+            # False would be left out like an option that is not set
+            fail_fast = "true" if fail_fast else "false"
+        return input_fingerprint(toxini, output=output, shards=shards,
+                                 durations=durations, parallel=parallel,
+                                 affected=affected, stages=stages,
+                                 quick_envs=list(quick_envs),
+                                 quick_duration=quick_duration,
+                                 fail_fast=fail_fast,
+                                 concurrency_group=concurrency_group,
+                                 cancel_in_progress=cancel_in_progress,
+                                 max_parallel=max_parallel,
+                                 timeout_minutes=timeout_minutes,
+                                 wheelhouse=wheelhouse,
+                                 record_durations=record_durations,
+                                 **options)
+
+    @classmethod
+    def create(cls, toxini=None, cache=None, shards=None, durations=None,
+               parallel=None, affected=False, stages=False, quick_envs=(),
+               quick_duration=None, fail_fast=None,
+               concurrency_group=DEFAULT_GROUP, cancel_in_progress=True,
+               max_parallel=None, timeout_minutes=DEFAULT_TIMEOUT_MINUTES,
+               wheelhouse=False, record_durations=False, stats=None,
+               **options):
+        """Resolve the tox configuration at `toxini` into a plan.
+
+        Nothing but the default of `toxini` depends on the current
+        directory, so plans of different projects can be created
+        concurrently in threads.
+
+        :param str toxini: A tox config file or a directory to start looking
+                           for one, defaults to the current directory
+        :param tox2travis.cache.Cache cache:
+        :param int shards: Split the environments of each basepython into at
+                           most this many jobs, see :mod:`tox2travis.shard`
+        :param {str: float} durations: The durations used for sharding
+        :param str parallel: Run the environments of each job in parallel
+                             with this many processes, or ``auto``. Unless
+                             `shards` is given, this runs all environments
+                             of a basepython in a single job.
+        :param bool affected: Only run the jobs whose inputs changed, see
+                              :func:`tox2travis.writers.job_inputs`
+        :param bool stages: Run quick jobs in a first stage and order jobs
+                            shortest first, see :mod:`tox2travis.stage`
+        :param [str] quick_envs: Patterns of additional quick environments
+        :param float quick_duration: Environments taking at most this many
+                                     seconds according to `durations` are
+                                     quick
+        :param bool fail_fast: Whether a failing job cancels the build,
+                               ``None`` keeps the default of the CI
+        :param str concurrency_group: The concurrency group of a run
+        :param bool cancel_in_progress: Whether a new run cancels the one in
+                                        progress
+        :param int max_parallel: The number of matrix entries of a job
+                                 running at the same time
+        :param int timeout_minutes: Cancel jobs running longer than this
+        :param bool wheelhouse: Build the package and wheels of all
+                                dependencies once, before running tox
+        :param bool record_durations: Record the durations of the
+                                      environments of every job, see
+                                      :mod:`tox2travis.shard`
+        :param tox2travis.stats.Stats stats: Measure the phases in this
+        :param options: Passed on to
+                        :func:`tox2travis.tox2travis.resolve_basepythons`
+        :rtype: Plan
+        """
+        from .concurrency import Concurrency
+        from .config import find_config
+        from .stats import phase
+        from .tox2travis import resolve_basepythons, ALL_WRITER_NAMES
+
+        # Everything below only sees the absolute path of the configuration
+        toxini = find_config(toxini) or toxini
+        basepythons = resolve_basepythons(toxini, cache=cache, stats=stats,
+                                          **options)
+        if parallel and not shards:
+            shards = 1
+        if shards:
+            from .shard import shard_basepythons
+
+            with phase(stats, "bucketing"):
+                shard_basepythons(basepythons, shards, durations)
+        staging = None
+        if stages:
+            from .stage import Staging
+
+            staging = Staging(quick_envs, durations, quick_duration)
+        fingerprints = {}
+        for output in ALL_WRITER_NAMES:
+            fingerprint = cls.fingerprint(output, toxini, shards, durations,
+                                          parallel, affected, stages,
+                                          quick_envs, quick_duration,
+                                          fail_fast, concurrency_group,
+                                          cancel_in_progress, max_parallel,
+                                          timeout_minutes, wheelhouse,
+                                          record_durations, **options)
+            if fingerprint is not None:
+                fingerprints[output] = fingerprint
+        concurrency = Concurrency(concurrency_group, cancel_in_progress,
+                                  max_parallel, timeout_minutes)
+        return cls(basepythons, fingerprints, parallel, affected, staging,
+                   fail_fast, concurrency, wheelhouse, record_durations)
+
+    def render(self, outputs, directory=None, check=False, stats=None):
+        """Write the CI configuration of every writer in `outputs`.
+
+        Files are only written if their content changes.
+
+        :param [str] outputs: Names of writers
+        :param str directory: The directory to write to, defaults to the
+                              current directory
+        :param bool check: Don't write anything, only check for changes
+        :param tox2travis.stats.Stats stats: Measure the phases in this
+        :rtype: [str]
+        :return: The names of the writers whose file changed (or would
+                 change, with `check`)
+        """
+        from .tox2travis import write_config
+
+        if stats is not None:
+            stats.record_basepythons(self.basepythons)
+        return [output for output in outputs
+                if write_config(self.basepythons, output, directory,
+                                self.fingerprints.get(output), check,
+                                self.parallel, stats, self.affected,
+                                self.staging, self.fail_fast,
+                                self.concurrency, self.wheelhouse,
+                                self.record_durations)]
+
+    def render_document(self, output, stream=None):
+        """Render the CI configuration of the writer `output` without
+        touching the filesystem.
+
+        :param str output: The name of a writer
+        :param stream: A file-like object to write the configuration to
+        :rtype: str or None
+        :return: The configuration, unless it was written to `stream`
+        """
+        from .tox2travis import render_config
+
+        return render_config(self.basepythons, output, stream,
+                             self.fingerprints.get(output), self.parallel,
+                             self.affected, self.staging, self.fail_fast,
+                             self.concurrency, self.wheelhouse,
+                             self.record_durations)
+
+    def to_dict(self):
+        """Return a JSON serializable representation of this plan.
+
+        :rtype: dict
+        """
+        from .cache import dump_basepythons
+
+        data = {"version": PLAN_FORMAT_VERSION,
+                "fingerprints": self.fingerprints,
+                "basepythons": dump_basepythons(self.basepythons)}
+        if self.parallel is not None:
+            data["parallel"] = self.parallel
+        if self.affected:
+            data["affected"] = True
+        if self.staging is not None:
+            data["staging"] = self.staging.to_dict()
+        if self.fail_fast is not None:
+            data["fail_fast"] = self.fail_fast
+        if self.concurrency is not None:
+            data["concurrency"] = self.concurrency.to_dict()
+        if self.wheelhouse:
+            data["wheelhouse"] = True
+        if self.record_durations:
+            data["record_durations"] = True
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a plan from `data`.
+
+        :param dict data: As returned by :meth:`to_dict`
+        :rtype: Plan
+        :raises InvalidPlan:
+        """
+        from .cache import load_basepythons
+        from .concurrency import Concurrency
+        from .stage import Staging
+
+        try:
+            version = data["version"]
+        except (KeyError, TypeError):
+            raise InvalidPlan("not a tox2travis plan")
+        if version != PLAN_FORMAT_VERSION:
+            raise InvalidPlan("unsupported plan version {}".format(version))
+        try:
+            staging = data.get("staging")
+            if staging is not None:
+                staging = Staging.from_dict(staging)
+            concurrency = data.get("concurrency")
+            if concurrency is not None:
+                concurrency = Concurrency.from_dict(concurrency)
+            return cls(load_basepythons(data["basepythons"]),
+                       dict(data.get("fingerprints", {})),
+                       data.get("parallel"), data.get("affected", False),
+                       staging, data.get("fail_fast"), concurrency,
+                       data.get("wheelhouse", False),
+                       data.get("record_durations", False))
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidPlan("malformed plan: {!r}".format(e))
+
+    def dump(self, fp):
+        """Save this plan as JSON to `fp`.
+
+        :param fp: A file-like object
+        """
+        json.dump(self.to_dict(), fp, indent=2, sort_keys=True)
+        fp.write("\n")
+
+    @classmethod
+    def load(cls, fp):
+        """Load a plan saved with :meth:`dump` from `fp`.
+
+        :param fp: A file-like object
+        :rtype: Plan
+        :raises InvalidPlan:
+        """
+        try:
+            data = json.load(fp)
+        except ValueError as e:
+            raise InvalidPlan("not valid JSON: {}".format(e))
+        return cls.from_dict(data)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""The registry of python versions known to tox, Travis CI and GitHub
+Actions.
+
+The versions are read from ``pythons.json`` next to this module::
+
+    {
+        "version": 1,
+        "pythons": [
+            {"tox": "python3.8", "travis": "3.8", "actions": "3.8",
+             "implementation": "cpython", "aliases": ["py38", "3.8"]}
+        ]
+    }
+
+``actions`` defaults to ``travis``. Additional registry files in the same
+format can be listed in ``$TOX2TRAVIS_PYTHONS`` (separated by
+:data:`os.pathsep`), their entries replace entries with the same ``tox``
+name and are added otherwise.
+"""
+import hashlib
+import json
+import os
+
+
+from collections import namedtuple
+from functools import lru_cache
+from os.path import dirname, join
+
+
+#: Bump this whenever the structure of registry files changes
+REGISTRY_FORMAT_VERSION = 1
+
+#: The registry shipped with tox2travis
+DEFAULT_REGISTRY_PATH = join(dirname(__file__), "pythons.json")
+
+#: The environment variable listing additional registry files
+REGISTRY_ENVIRONMENT_VARIABLE = "TOX2TRAVIS_PYTHONS"
+
+
+class InvalidRegistry(ValueError):
+    """Exception raised when a registry file can't be loaded."""
+
+
+class PythonVersion(namedtuple("PythonVersion", ["tox_version",
+                                                 "travis_version",
+                                                 "actions_version"])):
+    """A python version known to tox, Travis CI and GitHub Actions.
+
+    These are immutable and shared, :class:`tox2travis.tox2travis.BasePython`
+    buckets are created from them for every run.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, tox_version, travis_version, actions_version=None):  # noqa: D400,E501
+        """
+        :param str tox_version:
+        :param str travis_version:
+        :param str actions_version: Defaults to `travis_version`
+        """
+        return super().__new__(cls, tox_version, travis_version,
+                               actions_version or travis_version)
+
+
+class Registry:
+    """Python versions indexed by their tox, Travis CI and GitHub Actions
+    names and aliases.
+    """
+
+    def __init__(self, entries):  # noqa: D400
+        """
+        :param [dict] entries: The ``pythons`` of registry files, later
+                               entries replace earlier ones with the same
+                               ``tox`` name
+        :raises InvalidRegistry:
+        """
+        by_tox = {}
+        for entry in entries:
+            try:
+                version = PythonVersion(entry["tox"], entry["travis"],
+                                        entry.get("actions"))
+            except (KeyError, TypeError, AttributeError) as e:
+                raise InvalidRegistry("invalid entry {!r}: {!r}"
+                                      .format(entry, e))
+            by_tox[version.tox_version] = (version, entry)
+
+        #: All versions in the order of the registry files
+        self.versions = tuple(version for version, _ in by_tox.values())
+        #: The CPython versions, by their Travis CI name
+        self.cpythons = tuple(version.travis_version
+                              for version, entry in by_tox.values()
+                              if entry.get("implementation") == "cpython")
+        #: The PyPy versions
+        self.pypys = tuple(version for version, entry in by_tox.values()
+                           if entry.get("implementation") == "pypy")
+        #: The development versions
+        self.development = tuple(version
+                                 for version, entry in by_tox.values()
+                                 if entry.get("development"))
+
+        self._by_tox = {version.tox_version: version
+                        for version in self.versions}
+        self._by_alias = {}
+        self._by_travis = {}
+        self._by_actions = {}
+        for version, entry in by_tox.values():
+            for alias in entry.get("aliases", ()):
+                self._by_alias.setdefault(alias, version)
+            self._by_travis.setdefault(version.travis_version, version)
+            self._by_actions.setdefault(version.actions_version, version)
+
+        serialized = json.dumps([entry for _, entry in by_tox.values()],
+                                sort_keys=True).encode("utf-8")
+        #: A hash of all entries, changes whenever the registry does
+        self.digest = "sha256:" + hashlib.sha256(serialized).hexdigest()
+
+    @property
+    def names(self):
+        """Return all tox names and aliases.
+
+        :rtype: [str]
+        """
+        names = [version.tox_version for version in self.versions]
+        names.extend(alias for alias in self._by_alias
+                     if alias not in self._by_tox)
+        return names
+
+    def by_tox(self, name):
+        """Return the version called `name` in tox.
+
+        :param str name:
+        :rtype: PythonVersion or None
+        """
+        return self._by_tox.get(name)
+
+    def by_travis(self, name):
+        """Return the (first) version called `name` on Travis CI.
+
+        :param str name:
+        :rtype: PythonVersion or None
+        """
+        return self._by_travis.get(name)
+
+    def by_actions(self, name):
+        """Return the (first) version called `name` on GitHub Actions.
+
+        :param str name:
+        :rtype: PythonVersion or None
+        """
+        return self._by_actions.get(name)
+
+    def get(self, name):
+        """Return the version `name` refers to.
+
+        `name` is looked up as a tox name, an alias, a Travis CI name and a
+        GitHub Actions name, in that order.
+
+        :param str name:
+        :rtype: PythonVersion or None
+        """
+        for index in (self._by_tox, self._by_alias, self._by_travis,
+                      self._by_actions):
+            version = index.get(name)
+            if version is not None:
+                return version
+        return None
+
+
+def read_registry_file(fp):
+    """Return the entries of the registry file `fp`.
+
+    :param fp: A file-like object
+    :rtype: [dict]
+    :raises InvalidRegistry:
+    """
+    try:
+        data = json.load(fp)
+    except ValueError as e:
+        raise InvalidRegistry("not valid JSON: {}".format(e))
+    if not isinstance(data, dict) or "pythons" not in data:
+        raise InvalidRegistry("not a python registry")
+    if data.get("version") != REGISTRY_FORMAT_VERSION:
+        raise InvalidRegistry("unsupported registry version {}"
+                              .format(data.get("version")))
+    return data["pythons"]
+
+
+def load_registry(paths):
+    """Load the registry files at `paths`.
+
+    :param [str] paths:
+    :rtype: Registry
+    :raises InvalidRegistry:
+    """
+    entries = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as fp:
+                entries.extend(read_registry_file(fp))
+        except OSError as e:
+            raise InvalidRegistry(str(e))
+        except InvalidRegistry as e:
+            raise InvalidRegistry("{}: {}".format(path, e))
+    return Registry(entries)
+
+
+def registry_paths():
+    """Return the shipped registry file and those in
+    ``$TOX2TRAVIS_PYTHONS``.
+
+    :rtype: [str]
+    """
+    paths = [DEFAULT_REGISTRY_PATH]
+    extra = os.environ.get(REGISTRY_ENVIRONMENT_VARIABLE, "")
+    paths.extend(path for path in extra.split(os.pathsep) if path)
+    return paths
+
+
+@lru_cache(maxsize=None)
+def _load_default_registry(paths):
+    return load_registry(paths)
+
+
+def shipped_registry():
+    """Return the registry shipped with tox2travis, ignoring
+    ``$TOX2TRAVIS_PYTHONS``.
+
+    :rtype: Registry
+    """
+    return _load_default_registry((DEFAULT_REGISTRY_PATH,))
+
+
+def default_registry():
+    """Return the registry made of the files in :func:`registry_paths`.
+
+    Each combination of files is only loaded once.
+
+    :rtype: Registry
+    """
+    return _load_default_registry(tuple(registry_paths()))
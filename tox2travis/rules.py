@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Pattern based rules mapping environments to basepythons.
+
+A rule is a pair of a pattern and a target basepython. Patterns have the
+form ``kind:pattern`` where `kind` is one of :data:`RULE_KINDS` and
+`pattern` is a glob, or a regular expression if it starts with ``re:``::
+
+    env:docs            python3.8
+    factor:django*      python3.7
+    basepython:re:.*dbg python3.8
+
+A pattern without a kind matches environment names. Rules are tried in the
+order they're given, the first matching one wins.
+"""
+import re
+
+
+from fnmatch import translate
+
+
+#: What a rule can match on
+RULE_KINDS = ("env", "factor", "basepython")
+
+_REGEX_PREFIX = "re:"
+_GLOB_SPECIAL_CHARS = re.compile(r"[*?[]")
+
+
+class InvalidRule(ValueError):
+    """Exception raised when a rule can't be parsed."""
+
+
+def parse_pattern(pattern):
+    """Split `pattern` into its kind, a regular expression, the literal
+    prefix every match starts with and whether that prefix is all there is
+    to the pattern.
+
+    The prefix of regular expressions is None, they are used as they are.
+
+    :param str pattern:
+    :rtype: (str, str, str or None, bool)
+    """
+    kind, sep, rest = pattern.partition(":")
+    if not sep or kind not in RULE_KINDS:
+        kind, rest = "env", pattern
+    if rest.startswith(_REGEX_PREFIX):
+        regex = rest[len(_REGEX_PREFIX):]
+        try:
+            re.compile(regex)
+        except re.error as e:
+            raise InvalidRule("{} is not a valid regular expression: {}"
+                              .format(regex, e))
+        return kind, regex, None, False
+    prefix = _GLOB_SPECIAL_CHARS.split(rest, 1)[0]
+    return kind, translate(rest), prefix, prefix == rest
+
+
+def read_rules(fp):
+    """Read rules from `fp`, one ``pattern target`` pair per line.
+
+    Empty lines and lines starting with ``#`` are ignored.
+
+    :param fp: A file-like object
+    :rtype: [(str, str)]
+    """
+    rules = []
+    for number, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            pattern, target = line.rsplit(None, 1)
+        except ValueError:
+            raise InvalidRule("line {}: expected a pattern and a target, got "
+                              "{!r}".format(number, line))
+        rules.append((pattern.strip(), target))
+    return rules
+
+
+class _PatternIndex:
+    """The patterns of one kind, indexed for finding the first match.
+
+    Glob patterns are indexed by their literal prefix, patterns without one
+    are compiled into one alternation in rule order. Finding the first
+    matching rule for a subject therefore only tests the patterns whose
+    prefix it starts with plus the alternation, instead of every single
+    rule. Regular expressions are tested one by one, their groups,
+    backreferences and flags would interfere with each other in an
+    alternation.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixed = {}
+        self.regexes = []
+        self._alternatives = []
+        self._regex = None
+
+    def add(self, index, regex, prefix, exact):
+        if exact:
+            self.exact.setdefault(prefix, index)
+        elif prefix is None:
+            self.regexes.append((index, re.compile(regex)))
+        elif prefix:
+            self.prefixed.setdefault(prefix, []).append(
+                (index, re.compile(regex)))
+        else:
+            self._alternatives.append("(?P<_r{}>(?:{}))".format(index, regex))
+
+    def compile(self):
+        if self._alternatives:
+            try:
+                self._regex = re.compile("|".join(self._alternatives))
+            except re.error as e:
+                raise InvalidRule("the patterns can't be combined: {}"
+                                  .format(e))
+
+    def first(self, subject):
+        best = self.exact.get(subject)
+        if self.prefixed:
+            for end in range(len(subject) + 1):
+                for index, regex in self.prefixed.get(subject[:end], ()):
+                    if best is not None and index >= best:
+                        break
+                    if regex.fullmatch(subject):
+                        best = index
+                        break
+        if self._regex is not None:
+            match = self._regex.fullmatch(subject)
+            if match is not None:
+                index = int(match.lastgroup[2:])
+                if best is None or index < best:
+                    best = index
+        for index, regex in self.regexes:
+            if best is not None and index >= best:
+                break
+            if regex.fullmatch(subject):
+                best = index
+                break
+        return best
+
+
+class RuleSet:
+    """A list of rules, compiled so that finding the first matching rule
+    doesn't get slower with every rule added.
+    """
+
+    def __init__(self, rules):  # noqa: D400
+        """
+        :param [(str, str)] rules: Pairs of patterns and target basepythons
+        :raises InvalidRule:
+        """
+        self.rules = list(rules)
+        self.targets = [target for _, target in self.rules]
+        self._indexes = {}
+        for index, (pattern, _) in enumerate(self.rules):
+            kind, regex, prefix, exact = parse_pattern(pattern)
+            self._indexes.setdefault(kind, _PatternIndex()).add(
+                index, regex, prefix, exact)
+        for pattern_index in self._indexes.values():
+            pattern_index.compile()
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def _first(self, kind, subject):
+        pattern_index = self._indexes.get(kind)
+        if pattern_index is None or subject is None:
+            return None
+        return pattern_index.first(subject)
+
+    def match(self, envname, basepython):
+        """Return the target of the first rule matching an environment.
+
+        :param str envname:
+        :param str basepython:
+        :rtype: str or None
+        """
+        candidates = [self._first("env", envname),
+                      self._first("basepython", basepython)]
+        if "factor" in self._indexes:
+            candidates.extend(self._first("factor", factor)
+                              for factor in envname.split("-"))
+        matches = [index for index in candidates if index is not None]
+        if not matches:
+            return None
+        return self.targets[min(matches)]
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Run the jobs of a plan on this machine instead of a CI.
+
+Every job runs ``tox -e`` with the environments it would run in CI, in its
+own tox work directory so concurrent jobs don't share (and break) the
+package build or environments. The output of each job goes to its own log
+file. The summary written by :func:`write_json` contains the durations of
+the environments like a tox result file, so it can be passed to
+``--durations``::
+
+    {
+        "version": 1,
+        "jobs": [{"basepython": "python3.8", "envs": ["py38"],
+                  "returncode": 0, "duration": 12.3,
+                  "log": ".tox2travis/logs/py38.log"}],
+        "testenvs": {"py38": {"result": {"success": true,
+                                         "duration": 12.3}}}
+    }
+"""
+import json
+import os
+import re
+import shlex
+import subprocess
+
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os.path import join
+from time import perf_counter
+
+
+#: Bump this whenever the structure of summaries changes
+SUMMARY_FORMAT_VERSION = 1
+
+#: The directory the work directories and logs of the jobs are kept in
+DEFAULT_WORKDIR = ".tox2travis"
+
+# Characters not allowed in the names of the work directories and logs
+_UNSAFE_CHARACTERS = re.compile(r"[^\w.+-]")
+
+
+class JobResult:
+    """The outcome of running a single job."""
+
+    def __init__(self, basepython, envnames, returncode, duration, log,
+                 durations=None):  # noqa: D400
+        """
+        :param str basepython: The tox version of the basepython of the job
+        :param [str] envnames:
+        :param int returncode: The exit code of tox
+        :param float duration: The time tox took, in seconds
+        :param str log: The path of the log file
+        :param {str: float} durations: The durations of the environments,
+                                       as recorded by tox
+        """
+        self.basepython = basepython
+        self.envnames = envnames
+        self.returncode = returncode
+        self.duration = duration
+        self.log = log
+        self.durations = durations or {}
+
+    @property
+    def name(self):
+        """Return the name of the job, the value of ``tox -e`` running it.
+
+        :rtype: str
+        """
+        return ",".join(self.envnames)
+
+    @property
+    def passed(self):
+        """Return whether all environments of the job passed.
+
+        :rtype: bool
+        """
+        return self.returncode == 0
+
+    def environment_durations(self):
+        """Return the duration of each environment of the job.
+
+        Environments tox didn't record a duration for get an equal share of
+        the rest of the job.
+
+        :rtype: {str: float}
+        """
+        from .shard import job_durations
+
+        return job_durations(self.envnames, self.duration, self.durations)
+
+
+def job_directory_name(envnames):
+    """Return a name for the work directory and log of the job running
+    `envnames`.
+
+    :param [str] envnames:
+    :rtype: str
+    """
+    return _UNSAFE_CHARACTERS.sub("_", "+".join(envnames))
+
+
+def tox_command(config_path, envnames, workdir, result_json, tox="tox",
+                parallel=None, args=()):
+    """Return the command line running `envnames`.
+
+    :param str config_path: The tox configuration file
+    :param [str] envnames:
+    :param str workdir: The tox work directory of the job
+    :param str result_json: The path tox writes its result file to
+    :param str tox: The command running tox, split like a shell would
+    :param str parallel: Run the environments with ``tox -p parallel``
+    :param [str] args: Additional arguments for tox
+    :rtype: [str]
+    """
+    command = shlex.split(tox) + ["-c", config_path, "--workdir", workdir,
+                                  "--result-json", result_json,
+                                  "-e", ",".join(envnames)]
+    if parallel is not None:
+        command.extend(["-p", parallel])
+    return command + list(args)
+
+
+def plan_jobs(basepythons, durations=None):
+    """Return the jobs of `basepythons`, longest first.
+
+    Starting the longest jobs first keeps a few long jobs from running
+    alone at the end.
+
+    :param [tox2travis.tox2travis.BasePython] basepythons:
+    :param {str: float} durations: The durations of environments
+    :rtype: [(str, [str])]
+    :return: The tox version of the basepython and the environment names of
+             each job
+    """
+    from .stage import Staging
+
+    staging = Staging(durations=durations)
+    jobs = [(basepython.tox_version, job)
+            for basepython in basepythons
+            for job in basepython.jobs]
+    jobs.sort(key=lambda item: -staging.duration(item[1]))
+    return [(basepython, [environment.envname for environment in job])
+            for basepython, job in jobs]
+
+
+def run_job(basepython, envnames, config_path, workdir, tox="tox",
+            parallel=None, args=()):
+    """Run the job running `envnames` and wait for it to finish.
+
+    :param str basepython:
+    :param [str] envnames:
+    :param str config_path: The tox configuration file
+    :param str workdir: The directory containing the work directories and
+                        logs of all jobs
+    :param str tox: The command running tox
+    :param str parallel: Run the environments with ``tox -p parallel``
+    :param [str] args: Additional arguments for tox
+    :rtype: JobResult
+    """
+    from .shard import read_durations
+
+    name = job_directory_name(envnames)
+    log = join(workdir, "logs", name + ".log")
+    result_json = join(workdir, "results", name + ".json")
+    command = tox_command(config_path, envnames, join(workdir, "jobs", name),
+                          result_json, tox, parallel, args)
+    try:
+        # Left over from a previous run
+        os.remove(result_json)
+    except OSError:
+        pass
+    started = perf_counter()
+    command_line = " ".join(shlex.quote(arg) for arg in command)
+    with open(log, "w", encoding="utf-8") as fp:
+        fp.write("$ {}\n".format(command_line))
+        fp.flush()
+        try:
+            returncode = subprocess.call(command, stdin=subprocess.DEVNULL,
+                                         stdout=fp, stderr=subprocess.STDOUT)
+        except OSError as e:
+            fp.write("{}\n".format(e))
+            returncode = 127
+    duration = round(perf_counter() - started, 3)
+
+    durations = None
+    try:
+        with open(result_json, encoding="utf-8") as fp:
+            durations = read_durations(fp)
+    except (OSError, ValueError, TypeError, AttributeError):
+        pass
+    return JobResult(basepython, envnames, returncode, duration, log,
+                     durations)
+
+
+def run_jobs(jobs, config_path, workdir=DEFAULT_WORKDIR, processes=None,
+             tox="tox", parallel=None, args=(), progress=None):
+    """Run all `jobs` with at most `processes` running at the same time.
+
+    :param [(str, [str])] jobs: As returned by :func:`plan_jobs`
+    :param str config_path: The tox configuration file
+    :param str workdir: The directory to keep the work directories and logs
+                        of the jobs in
+    :param int processes: Defaults to the number of CPUs
+    :param str tox: The command running tox
+    :param str parallel: Run the environments of each job with
+                         ``tox -p parallel``
+    :param [str] args: Additional arguments for tox
+    :param progress: Called with each :class:`JobResult`, the number of
+                     finished jobs and the number of all jobs as soon as a
+                     job finishes
+    :rtype: [JobResult]
+    :return: The results, in the order of `jobs`
+    """
+    for directory in ("jobs", "logs", "results"):
+        os.makedirs(join(workdir, directory), exist_ok=True)
+
+    # Every job is a tox process, the threads only wait for them
+    with ThreadPoolExecutor(max_workers=processes or os.cpu_count()) \
+            as executor:
+        futures = {executor.submit(run_job, basepython, envnames,
+                                   config_path, workdir, tox, parallel,
+                                   args): index
+                   for index, (basepython, envnames) in enumerate(jobs)}
+        results = [None] * len(jobs)
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results[futures[future]] = result
+            if progress is not None:
+                progress(result, done, len(jobs))
+    return results
+
+
+def summary(results):
+    """Return a JSON serializable summary of `results`.
+
+    :param [JobResult] results:
+    :rtype: dict
+    """
+    testenvs = {}
+    for result in results:
+        for envname, duration in result.environment_durations().items():
+            testenvs[envname] = {"result": {"success": result.passed,
+                                            "duration": duration}}
+    return {"version": SUMMARY_FORMAT_VERSION,
+            "jobs": [{"basepython": result.basepython,
+                      "envs": result.envnames,
+                      "returncode": result.returncode,
+                      "duration": result.duration,
+                      "log": result.log}
+                     for result in results],
+            "testenvs": testenvs}
+
+
+def write_json(results, fp):
+    """Write the summary of `results` as JSON to `fp`.
+
+    :param [JobResult] results:
+    :param fp: A file-like object
+    """
+    json.dump(summary(results), fp, indent=2, sort_keys=True)
+    fp.write("\n")
+
+
+def _log_tail(path, lines=50):
+    try:
+        with open(path, encoding="utf-8", errors="replace") as fp:
+            return "".join(fp.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+def write_junit(results, fp):
+    """Write `results` as a JUnit XML report to `fp`.
+
+    Every job is a test case, the end of the log of failed jobs is part of
+    their failure.
+
+    :param [JobResult] results:
+    :param fp: A binary file-like object
+    """
+    from xml.etree import ElementTree
+
+    failures = [result for result in results if not result.passed]
+    testsuites = ElementTree.Element("testsuites")
+    testsuite = ElementTree.SubElement(
+        testsuites, "testsuite", name="tox2travis", tests=str(len(results)),
+        failures=str(len(failures)), errors="0",
+        time="{:.3f}".format(sum(result.duration for result in results)))
+    for result in results:
+        testcase = ElementTree.SubElement(
+            testsuite, "testcase", classname=result.basepython,
+            name=result.name, time="{:.3f}".format(result.duration))
+        if not result.passed:
+            failure = ElementTree.SubElement(
+                testcase, "failure",
+                message="tox exited with {}".format(result.returncode))
+            failure.text = _log_tail(result.log)
+    ElementTree.ElementTree(testsuites).write(fp, encoding="utf-8",
+                                              xml_declaration=True)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""A daemon that keeps tox2travis loaded and serves requests over a Unix
+socket, see :mod:`tox2travis.client` for the other side.
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+
+
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from os.path import join
+
+
+def default_socket_path():
+    """Return the socket path used if none is given.
+
+    :rtype: str
+    """
+    from .client import SOCKET_ENVIRONMENT_VARIABLE
+
+    path = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return join(runtime_dir, "tox2travis.sock")
+    return "/tmp/tox2travis-{}.sock".format(os.getuid())
+
+
+def _run_command(argv, obj):
+    """Run the command line `argv` and capture its result.
+
+    :param [str] argv:
+    :param dict obj: The initial click context object
+    :rtype: dict
+    """
+    import click
+    from .__main__ import main
+
+    stdout, stderr = StringIO(), StringIO()
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    # Let main() set up logging to the captured stderr
+    root.handlers = []
+    exit_code = 0
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                main.main(argv, prog_name="tox2travis", obj=obj,
+                          standalone_mode=False)
+            except click.exceptions.Exit as e:
+                exit_code = e.exit_code
+            except click.ClickException as e:
+                e.show()
+                exit_code = e.exit_code
+            except click.Abort:
+                exit_code = 1
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                logging.exception("Generation failed")
+                exit_code = 1
+    finally:
+        root.handlers = handlers
+    return {"exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue()}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Somebody just checked whether we're listening
+            return
+        try:
+            request = json.loads(line.decode("utf-8"))
+            argv, cwd = request["argv"], request["cwd"]
+            env = request.get("env")
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"exit_code": 2, "stdout": "",
+                        "stderr": "Invalid request: {}\n".format(e)}
+        else:
+            response = self.server.execute(argv, cwd, env)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class Server(socketserver.UnixStreamServer):
+    """Serves requests one at a time, each of them runs in the working
+    directory and environment of the client.
+    """
+
+    def __init__(self, socket_path):  # noqa: D400
+        """:param str socket_path:"""
+        from .cache import Cache, MemoryCache
+
+        _remove_stale_socket(socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.socket_path = socket_path
+        self.cache = MemoryCache(Cache())
+        self._warm_up()
+
+    @staticmethod
+    def _warm_up():
+        from . import __main__, config, writers  # noqa: F401
+
+        try:
+            import tox.config  # noqa: F401
+        except ImportError:
+            pass
+
+    def execute(self, argv, cwd, env=None):
+        """Run the command line `argv` in `cwd` with the environment `env`.
+
+        :param [str] argv:
+        :param str cwd:
+        :param dict env:
+        :rtype: dict
+        """
+        old_cwd = os.getcwd()
+        old_env = dict(os.environ)
+        try:
+            os.chdir(cwd)
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+            return _run_command(argv, {"cache": self.cache})
+        except OSError as e:
+            return {"exit_code": 1, "stdout": "", "stderr": str(e) + "\n"}
+        finally:
+            os.environ.clear()
+            os.environ.update(old_env)
+            os.chdir(old_cwd)
+
+    def server_close(self):
+        """Stop listening and remove the socket file."""
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(socket_path):
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError("{} exists and is not a socket".format(socket_path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise OSError("Another daemon is already listening on {}"
+                  .format(socket_path))
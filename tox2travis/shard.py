@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Split the environments of each basepython into a few CI jobs of similar
+duration.
+
+Durations are read from the files written by ``tox --result-json`` or from a
+JSON object mapping environment names to seconds. tox 3 doesn't record any
+timings in its result files, so with tox 3 the latter has to be used.
+
+The files recorded by jobs generated with ``--record-durations`` (see
+:data:`tox2travis.writers.RECORD_DURATIONS_SCRIPT`) and the summaries of
+``tox2travis run`` contain the tox results of a job together with the
+environments it ran and its duration. Environments tox didn't record a
+duration for get an equal share of the rest of the job::
+
+    {"version": 1, "envs": ["py38", "flake8"], "duration": 42.0,
+     "testenvs": {...}}
+"""
+import heapq
+import json
+
+
+#: The duration (in seconds) assumed for environments if no durations are
+#: known at all
+DEFAULT_DURATION = 1.0
+
+
+def _result_duration(testenv):
+    """Return the duration of one environment in a tox result file, or None
+    if it didn't record any.
+
+    :param dict testenv:
+    :rtype: float or None
+    """
+    result = testenv.get("result")
+    if isinstance(result, dict) and "duration" in result:
+        return float(result["duration"])
+    elapsed = [float(entry["elapsed"])
+               for key in ("setup", "test")
+               for entry in testenv.get(key) or []
+               if isinstance(entry, dict) and "elapsed" in entry]
+    if not elapsed:
+        return None
+    return sum(elapsed)
+
+
+def job_durations(envnames, duration, durations):
+    """Return the duration of each of `envnames`, which ran in a single job
+    taking `duration` seconds.
+
+    Environments without an entry in `durations` get an equal share of the
+    rest of the job.
+
+    :param [str] envnames:
+    :param float duration:
+    :param {str: float} durations: The durations recorded by tox
+    :rtype: {str: float}
+    """
+    result = {envname: durations[envname] for envname in envnames
+              if envname in durations}
+    missing = [envname for envname in envnames if envname not in result]
+    if missing:
+        rest = max(duration - sum(result.values()), 0.0)
+        for envname in missing:
+            result[envname] = round(rest / len(missing), 3)
+    return result
+
+
+def read_durations(fp):
+    """Read the duration of each environment from `fp`.
+
+    :param fp: A file-like object containing the output of
+               ``tox --result-json``, a job record or a JSON object mapping
+               environment names to seconds
+    :rtype: {str: float}
+    :raises ValueError: if `fp` contains neither
+    """
+    data = json.load(fp)
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    if "testenvs" not in data:
+        return {envname: float(seconds) for envname, seconds in data.items()}
+    durations = {}
+    for envname, testenv in data["testenvs"].items():
+        if not isinstance(testenv, dict):
+            continue
+        duration = _result_duration(testenv)
+        if duration is not None:
+            durations[envname] = duration
+    if "envs" in data and "duration" in data:
+        durations.update(job_durations(data["envs"], float(data["duration"]),
+                                       durations))
+    return durations
+
+
+def load_durations(fps):
+    """Read the durations from all of `fps` and average them per
+    environment.
+
+    :param fps: File-like objects, see :func:`read_durations`
+    :rtype: {str: float}
+    """
+    totals = {}
+    counts = {}
+    for fp in fps:
+        for envname, duration in read_durations(fp).items():
+            totals[envname] = totals.get(envname, 0.0) + duration
+            counts[envname] = counts.get(envname, 0) + 1
+    return {envname: round(total / counts[envname], 3)
+            for envname, total in totals.items()}
+
+
+def pack(environments, shards, durations, default=DEFAULT_DURATION):
+    """Split `environments` into at most `shards` groups with the duration
+    of the longest group as short as possible.
+
+    This uses the longest processing time first heuristic: environments are
+    assigned, longest first, to the group with the shortest total so far.
+    Each group keeps the environments in their original order.
+
+    :param list environments: Objects with an ``envname``
+    :param int shards:
+    :param {str: float} durations:
+    :param float default: The duration of environments not in `durations`
+    :rtype: [list]
+    """
+    if shards < 1:
+        raise ValueError("the number of shards must be at least 1")
+
+    def duration(env):
+        return durations.get(env.envname, default)
+
+    shards = min(shards, len(environments))
+    longest_first = sorted(enumerate(environments),
+                           key=lambda item: (-duration(item[1]),
+                                             item[1].envname))
+
+    # (total duration, shard number) so ties go to the lowest shard
+    heap = [(0.0, number) for number in range(shards)]
+    groups = [[] for _ in range(shards)]
+    for position, env in longest_first:
+        total, number = heapq.heappop(heap)
+        groups[number].append((position, env))
+        heapq.heappush(heap, (total + duration(env), number))
+
+    groups = sorted(sorted(group) for group in groups if group)
+    return [[env for _, env in group] for group in groups]
+
+
+def shard_basepythons(basepythons, shards, durations=None):
+    """Split the environments of each of `basepythons` into at most `shards`
+    jobs, see :func:`pack`.
+
+    Environments without a known duration are assumed to take as long as
+    the average known one.
+
+    :param [tox2travis.tox2travis.BasePython] basepythons:
+    :param int shards:
+    :param {str: float} durations:
+    """
+    durations = durations or {}
+    default = DEFAULT_DURATION
+    if durations:
+        default = sum(durations.values()) / len(durations)
+    for basepython in basepythons:
+        environments = basepython.environments
+        if environments:
+            basepython.jobs = pack(environments, shards, durations, default)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Run quick jobs, like linters, in a first stage and order jobs shortest
+first, so a broken linter stops the CI before the expensive jobs start.
+
+A job is quick if all of its environments match one of the quick patterns
+(see :mod:`tox2travis.rules` for their syntax) or took at most
+:data:`DEFAULT_QUICK_DURATION` seconds according to the durations read with
+:func:`tox2travis.shard.load_durations`.
+"""
+from .shard import DEFAULT_DURATION
+
+
+#: The stage of the quick jobs
+QUICK_STAGE = "quick"
+#: The stage of all other jobs, named like Travis CI's default stage
+TEST_STAGE = "test"
+#: All stages, in the order they run
+STAGES = (QUICK_STAGE, TEST_STAGE)
+
+#: Environments that are quick without knowing their duration
+DEFAULT_QUICK_PATTERNS = ("factor:lint", "factor:flake8", "factor:pylint",
+                          "factor:mypy", "factor:isort", "factor:black",
+                          "factor:docs", "pre-commit")
+
+#: Environments taking at most this many seconds are quick
+DEFAULT_QUICK_DURATION = 60.0
+
+
+class Staging:
+    """Assigns jobs to stages and estimates their duration."""
+
+    def __init__(self, patterns=(), durations=None, quick_duration=None):  # noqa: D400,E501
+        """
+        :param [str] patterns: Patterns of quick environments, in addition
+                               to :data:`DEFAULT_QUICK_PATTERNS`
+        :param {str: float} durations: The durations of environments
+        :param float quick_duration: Defaults to
+                                     :data:`DEFAULT_QUICK_DURATION`
+        :raises tox2travis.rules.InvalidRule:
+        """
+        from .rules import RuleSet
+
+        self.patterns = list(patterns)
+        self.durations = durations or {}
+        self.quick_duration = quick_duration
+        if quick_duration is None:
+            self.quick_duration = DEFAULT_QUICK_DURATION
+        self._rules = RuleSet((pattern, QUICK_STAGE)
+                              for pattern in (DEFAULT_QUICK_PATTERNS +
+                                              tuple(self.patterns)))
+        # Environments without a known duration take as long as the
+        # average known one, like when sharding
+        self._default = DEFAULT_DURATION
+        if self.durations:
+            self._default = (sum(self.durations.values()) /
+                             len(self.durations))
+
+    def is_quick(self, environment):
+        """Return whether `environment` belongs into the quick stage.
+
+        :param environment: An object with an ``envname`` and a
+                            ``basepython``
+        :rtype: bool
+        """
+        duration = self.durations.get(environment.envname)
+        if duration is not None and duration <= self.quick_duration:
+            return True
+        return self._rules.match(environment.envname,
+                                 environment.basepython) is not None
+
+    def stage(self, job):
+        """Return the stage of `job`.
+
+        :param job: A list of environments
+        :rtype: str
+        """
+        if job and all(self.is_quick(environment) for environment in job):
+            return QUICK_STAGE
+        return TEST_STAGE
+
+    def duration(self, job):
+        """Return the estimated duration of `job` in seconds.
+
+        :param job: A list of environments
+        :rtype: float
+        """
+        return sum(self.durations.get(environment.envname, self._default)
+                   for environment in job)
+
+    def sort_key(self, job):
+        """Return a key ordering jobs by stage and then shortest first.
+
+        :param job: A list of environments
+        """
+        return STAGES.index(self.stage(job)), self.duration(job)
+
+    def to_dict(self):
+        """Return a JSON serializable representation of this staging.
+
+        :rtype: dict
+        """
+        return {"patterns": self.patterns, "durations": self.durations,
+                "quick_duration": self.quick_duration}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a staging from `data`.
+
+        :param dict data: As returned by :meth:`to_dict`
+        :rtype: Staging
+        """
+        return cls(data.get("patterns", ()), data.get("durations"),
+                   data.get("quick_duration"))
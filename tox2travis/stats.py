@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Measure how long the phases of a run take and collect statistics about
+what it generated.
+"""
+import sys
+import time
+
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+#: The phases of a run, in the order they happen
+PHASES = ("import", "parse", "bucketing", "rendering", "writing")
+
+
+def peak_memory():
+    """Return the peak resident set size of this process in bytes.
+
+    :rtype: int or None
+    :return: None if it can't be determined on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def phase(stats, name):
+    """Return a context manager measuring the phase `name` if `stats` isn't
+    None.
+
+    :param Stats stats:
+    :param str name: One of :data:`PHASES`
+    """
+    if stats is None:
+        return _unmeasured()
+    return stats.phase(name)
+
+
+@contextmanager
+def _unmeasured():
+    yield
+
+
+class Stats:
+    """The time spent in each phase and what was generated.
+
+    Phases can be nested, the time of a phase doesn't include the time
+    spent in the phases nested in it. Phases that happen more than once (like
+    rendering for every output) are summed up.
+    """
+
+    def __init__(self):
+        #: Wall and CPU time in seconds and peak memory in bytes by phase
+        self.phases = OrderedDict()
+        #: The number of environments and jobs of every basepython
+        self.basepythons = OrderedDict()
+        #: The path, size and whether it changed of every output
+        self.outputs = OrderedDict()
+        self._stack = []
+
+    def add(self, name, wall, cpu):
+        """Add `wall` and `cpu` seconds to the phase `name`.
+
+        :param str name:
+        :param float wall:
+        :param float cpu:
+        """
+        entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0,
+                                              "peak_memory": None})
+        entry["wall"] += wall
+        entry["cpu"] += cpu
+        entry["peak_memory"] = peak_memory()
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the code run in this context as the phase `name`.
+
+        :param str name: One of :data:`PHASES`
+        """
+        # The time spent in nested phases, subtracted from this one
+        nested = [0.0, 0.0]
+        self._stack.append(nested)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+            self.add(name, wall - nested[0], cpu - nested[1])
+
+    def record_basepythons(self, basepythons):
+        """Record the environments and jobs of `basepythons`.
+
+        :param [tox2travis.tox2travis.BasePython] basepythons:
+        """
+        for basepython in basepythons:
+            self.basepythons[basepython.tox_version] = {
+                "environments": len(basepython.environments),
+                "jobs": len(basepython.jobs),
+            }
+
+    def record_output(self, name, path, size, changed):
+        """Record the output written by the writer `name`.
+
+        :param str name:
+        :param str path:
+        :param int size: The size of the output in bytes
+        :param bool changed: Whether the file was written
+        """
+        self.outputs[name] = {"path": path, "bytes": size, "changed": changed}
+
+    def to_dict(self):
+        """Return a JSON serializable representation of these statistics.
+
+        :rtype: dict
+        """
+        return {
+            "phases": self.phases,
+            "basepythons": self.basepythons,
+            "environments": sum(bp["environments"]
+                                for bp in self.basepythons.values()),
+            "jobs": sum(bp["jobs"] for bp in self.basepythons.values()),
+            "outputs": self.outputs,
+            "bytes_written": sum(output["bytes"]
+                                 for output in self.outputs.values()
+                                 if output["changed"]),
+        }
+
+    def format_timings(self):
+        """Return a table of the time spent in each phase.
+
+        :rtype: str
+        """
+        lines = ["{:<10} {:>10} {:>10} {:>12}".format("phase", "wall", "cpu",
+                                                      "peak memory")]
+        names = [name for name in PHASES if name in self.phases]
+        names.extend(name for name in self.phases if name not in PHASES)
+        for name in names:
+            entry = self.phases[name]
+            memory = entry["peak_memory"]
+            lines.append("{:<10} {:>8.1f}ms {:>8.1f}ms {:>12}".format(
+                name, entry["wall"] * 1000, entry["cpu"] * 1000,
+                "-" if memory is None
+                else "{:.1f}MiB".format(memory / 1024 / 1024)))
+        total_wall = sum(entry["wall"] for entry in self.phases.values())
+        total_cpu = sum(entry["cpu"] for entry in self.phases.values())
+        lines.append("{:<10} {:>8.1f}ms {:>8.1f}ms".format(
+            "total", total_wall * 1000, total_cpu * 1000))
+        return "\n".join(lines)
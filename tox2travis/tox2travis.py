@@ -2,14 +2,23 @@
 # coding: utf-8
 # Copyright © 2017, 2018, 2019, 2020 Wieland Hoffmann
 # License: MIT, see LICENSE for details
+import hashlib
+import json
 import logging
+import threading
 
 
-from contextlib import ExitStack
-from os import makedirs
-from os.path import dirname
-from textwrap import dedent, indent
-from tox.config import parseconfig
+from collections import OrderedDict
+from importlib import import_module
+from io import StringIO
+from operator import attrgetter
+from os.path import basename
+from types import MappingProxyType
+
+
+from .registry import (PythonVersion, default_registry,  # noqa: F401
+                       shipped_registry)
+from .stats import phase
 
 
 class UnkownBasePython(Exception):
@@ -23,26 +32,48 @@ class UnkownBasePython(Exception):
 class BasePython:
     """A base python version in tox and travis and its environments."""
 
+    __slots__ = ("tox_version", "travis_version", "actions_version",
+                 "_environments", "_jobs")
+
     def __init__(self, tox_version, travis_version, environments=None, actions_version=None):  # noqa: D400,E501
         """
         :param str tox_version:
         :param str travis_version:
-        :param [tox.config.TestenvConfig] environments:
+        :param [tox2travis.config.Environment] environments:
         :param str actions_version:
         """
         self.tox_version = tox_version
         self.travis_version = travis_version
-        self._environments = environments or []
+        # Keyed by the environment name, which makes deduplication cheap
+        # while keeping the order environments were added in
+        self._environments = OrderedDict()
+        self._jobs = None
+        for environment in environments or []:
+            self.add_environment(environment)
         self.actions_version = actions_version or travis_version
 
+    @classmethod
+    def from_version(cls, version):
+        """Return an empty bucket for the python version `version`.
+
+        :param PythonVersion version:
+        :rtype: BasePython
+        """
+        return cls(version.tox_version, version.travis_version,
+                   actions_version=version.actions_version)
+
     def add_environment(self, environment):
         """Add a new environment to this python version.
 
+        Environments with the same name as one that has already been added
+        are ignored.
+
         :param self:
         :param environment:
         """
-        if environment not in self._environments:
-            self._environments.append(environment)
+        if environment.envname not in self._environments:
+            self._environments[environment.envname] = environment
+            self._jobs = None
 
     def _clear_environments(self):
         """Clear the list of environments associated with this python version.
@@ -50,6 +81,7 @@ class BasePython:
         :param self:
         """
         self._environments.clear()
+        self._jobs = None
 
     @property
     def environments(self):
@@ -57,87 +89,182 @@ class BasePython:
 
         :rtype: [tox.config.TestenvConfig]
         """
-        return self._environments
-
-
-# https://tox.readthedocs.io/en/latest/example/basic.html#a-simple-tox-ini-default-environments
-# Available “default” test environments names are:
-#
-#   py
-#   py2
-#   py27
-#   py3
-#   py34
-#   py35
-#   py36
-#   py37
-#   py38
-#   jython
-#   pypy
-#   pypy2
-#   pypy27
-#   pypy3
-#   pypy35
-#   py26, py32 and py33 also still work
-#
-# This list could also be generated from tox.config.default_factors, but not
-# all of them map directly to a version of python supported by travis (for
-# example py37/python3.7 should map to "3.7-dev" at the time of this writing).
-
-#: All CPython versions known to tox
-TOX_CPYTHONS = ["2.7", "3.5", "3.6", "3.7", "3.8"]
+        return list(self._environments.values())
+
+    @property
+    def jobs(self):
+        """Return the environments run by each CI job of this python version.
+
+        Every environment gets its own job unless they have been sharded,
+        see :mod:`tox2travis.shard`.
+
+        :rtype: [[tox.config.TestenvConfig]]
+        """
+        if self._jobs is None:
+            return [[environment] for environment in self.environments]
+        return self._jobs
+
+    @jobs.setter
+    def jobs(self, jobs):
+        self._jobs = jobs
+
+    @property
+    def sharded(self):
+        """Return whether the environments have been split into jobs.
+
+        :rtype: bool
+        """
+        return self._jobs is not None
+
+
+#: The registry shipped with tox2travis, see :mod:`tox2travis.registry`.
+#: Like all module level data it's never modified. Importing doesn't read
+#: ``$TOX2TRAVIS_PYTHONS``, the functions below look up
+#: :func:`default_registry` on every call instead of using it.
+REGISTRY = shipped_registry()
+
+#: All CPython versions known to tox, by their Travis CI name
+TOX_CPYTHONS = REGISTRY.cpythons
 #: All pypy versions known to tox and travis
-# https://docs.travis-ci.com/user/reference/xenial/#python-support
-TOX_PYPYS    = [BasePython("pypy", "pypy2.7-6.0"), BasePython("pypy2", "pypy2.7-6.0", actions_version="pypy2"), BasePython("pypy3", "pypy3.6-7.1.1", actions_version="pypy3")]  # noqa: E221,E501
+TOX_PYPYS = REGISTRY.pypys
 #: All Python development versions supported by tox and travis
-TOX_DEVPTHONS = []
+TOX_DEVPTHONS = REGISTRY.development
+
+#: All known python versions. This is shared and never modified,
+#: :func:`fill_basepythons` creates the buckets for every run.
+ALL_KNOWN_BASEPYTHONS = REGISTRY.versions
+
+#: All strings that can be used as a fallback: tox names and their aliases
+ALL_VALID_FALLBACKS = tuple(REGISTRY.names)
 
-ALL_KNOWN_BASEPYTHONS = [
-    BasePython("python{version}".format(version=version), version)
-    for version in TOX_CPYTHONS
-]
 
-ALL_KNOWN_BASEPYTHONS.extend(TOX_PYPYS)
-ALL_KNOWN_BASEPYTHONS.extend(TOX_DEVPTHONS)
+#: All configuration parsers, "auto" uses the fast one and falls back to tox
+ALL_PARSERS = ("auto", "fast", "tox")
 
-#: All strings that can be used as a fallback
-ALL_VALID_FALLBACKS = [python.tox_version for python in ALL_KNOWN_BASEPYTHONS]
+_TOX_LOCK = threading.Lock()
 
 
-def get_all_environments(toxini=None):
+def get_all_environments(toxini=None, parser="auto"):
     """Get a list of all tox environments.
 
-    :type toxini: str
-    :rtype: [tox.config.TestenvConfig]
+    The configuration is looked up once and only ever read by its absolute
+    path, so this doesn't depend on the current directory if `toxini` is
+    given.
+
+    :param str toxini: A tox config file or a directory to start looking for
+                       one, defaults to the current directory
+    :param str parser: One of :data:`ALL_PARSERS`
+    :rtype: [tox2travis.config.Environment]
     """
-    if toxini is None:
-        config = parseconfig([])
-    else:
-        config = parseconfig(["-c", toxini])
-    envconfigs = sorted(config.envconfigs.values(), key=lambda e: e.envname)
-    return envconfigs
+    from . import config as _config
+
+    if parser not in ALL_PARSERS:
+        raise ValueError("{} is not a known parser".format(parser))
+    config_path = _config.find_config(toxini)
+    if parser != "tox":
+        try:
+            if config_path is None:
+                raise _config.UnsupportedConfigError(
+                    "no tox config file found")
+            envconfigs = _config.parse_environments(config_path)
+        except _config.UnsupportedConfigError as e:
+            if parser == "fast":
+                raise
+            logging.debug("Falling back to tox for parsing: %s", e)
+        else:
+            return sorted(envconfigs, key=attrgetter("envname"))
+    return _get_all_environments_from_tox(config_path or toxini)
+
 
+def _get_all_environments_from_tox(toxini=None):
+    from tox.config import parseconfig
+    from .config import Environment, environment_inputs, normalize_dep
+
+    # Parsing changes tox' global reporter
+    with _TOX_LOCK:
+        if toxini is None:
+            config = parseconfig([])
+        else:
+            config = parseconfig(["-c", toxini])
+    toxinidir = str(config.toxinidir)
+    envconfigs = []
+    for envconfig in config.envconfigs.values():
+        installs_package = not (config.skipsdist or envconfig.skip_install)
+        inputs = environment_inputs(str(config.toxinipath),
+                                    str(envconfig.changedir),
+                                    envconfig.commands, installs_package,
+                                    str(config.toxworkdir))
+        envconfigs.append(Environment(envconfig.envname,
+                                      envconfig.basepython,
+                                      [normalize_dep(str(dep), toxinidir)
+                                       for dep in envconfig.deps],
+                                      inputs))
+    return sorted(envconfigs, key=attrgetter("envname"))
+
+
+def canonical_basepython(name, known=None):
+    """Return the tox name of the python version `name` refers to.
+
+    :param str name: A tox name or an alias from the registry
+    :param known: If given, `name` is returned unchanged if it's in here
+    :type known: {str} or None
+    :rtype: str
+    :return: `name` itself if the registry doesn't know it
+    """
+    if known is not None and name in known:
+        return name
+    version = default_registry().get(name)
+    if version is None:
+        return name
+    return version.tox_version
 
-def fill_basepythons(basepythons, envconfigs, fallback_basepython=None):  # noqa: D400, E501
+
+def fill_basepythons(basepythons, envconfigs, fallback_basepython=None,
+                     rules=None):  # noqa: D400
     """Return a list of :type:`BasePython` objects with their environments
     populated from `envconfigs.
 
-    :type basepythons: [BasePython]
+    Environments matching one of the `rules` use its target, all others
+    their own basepython or, if that is unknown, `fallback_basepython`.
+
+    :param basepythons: :class:`PythonVersion` objects, for which new
+                        buckets are created, or existing buckets
+    :type basepythons: [PythonVersion or BasePython]
     :type envconfigs: [tox.config.TestenvConfig]
     :type fallback_basepython: str
+    :type rules: tox2travis.rules.RuleSet
     :rtype: [BasePython]
     """
-    basepythons = {basepython.tox_version: basepython
+    basepythons = {basepython.tox_version:
+                   basepython if isinstance(basepython, BasePython)
+                   else BasePython.from_version(basepython)
                    for basepython in basepythons}
     all_basepythons = basepythons.keys()
 
-    if (fallback_basepython is not None and
-        fallback_basepython not in all_basepythons):
-        raise ValueError("{} is not a known basepython, but was specified as the fallback".format(fallback_basepython))  # noqa: E501
-
+    if fallback_basepython is not None:
+        fallback_basepython = canonical_basepython(fallback_basepython,
+                                                   all_basepythons)
+        if fallback_basepython not in all_basepythons:
+            raise ValueError("{} is not a known basepython, but was specified as the fallback".format(fallback_basepython))  # noqa: E501
+
+    # Rule targets may be aliases as well
+    targets = {}
+    if rules:
+        for target in rules.targets:
+            targets[target] = canonical_basepython(target, all_basepythons)
+            if targets[target] not in all_basepythons:
+                raise ValueError("{} is not a known basepython, but was specified as the target of a mapping rule".format(target))  # noqa: E501
+
+    ignored = []
     for envconfig in envconfigs:
         basepython = envconfig.basepython
-        if basepython in all_basepythons:
+        target = rules.match(envconfig.envname, basepython) if rules else None
+        if target is not None:
+            bp = basepythons[targets[target]]
+            logging.debug("%s uses %s (rule: %s)", envconfig.envname,
+                          basepython, bp.travis_version)
+            bp.add_environment(envconfig)
+        elif basepython in all_basepythons:
             bp = basepythons[basepython]
             logging.debug("%s uses %s (%s)", envconfig.envname, basepython,
                           bp.travis_version)
@@ -148,150 +275,208 @@ def fill_basepythons(basepythons, envconfigs, fallback_basepython=None):  # noqa
                 logging.debug("%s uses %s (fallback: %s)", envconfig.envname,
                               basepython, bp.travis_version)
                 bp.add_environment(envconfig)
+            else:
+                ignored.append(envconfig.envname)
+    if ignored:
+        logging.warning("Ignoring environments with an unknown basepython: "
+                        "%s", ", ".join(ignored))
     return list(basepythons.values())
 
 
-class WriterBase(ExitStack):
-    """Base class for all writers, allowing use as a context manager."""
-
-    def __init__(self):
-        super().__init__()
-        self.outfile = None
-
-    def __enter__(self):
-        super().__enter__()
-        dir_ = dirname(self.filename)
-        if dir_:
-            makedirs(dir_, exist_ok=True)
-        self.outfile = self.enter_context(open(self.filename, "w"))
-        return self
-
-
-class ActionsWriter(WriterBase):
-    """A class for writing a GitHub actions yaml file."""
-
-    filename = ".github/workflows/tox.yml"
-    name = "actions"
-
-    def header(self):
-        """Write the tox.yml header."""
-        text = dedent("""\
-        name: Run tox
-        on: [pull_request, push]
-        jobs:
-          build:
-            runs-on: ubuntu-latest
-            strategy:
-              matrix:
-                include:
-        """)
-        self.outfile.write(text)
-
-    def footer(self):
-        """Write the tox.yml footer."""
-        text = dedent("""\
-            steps:
-            - uses: actions/checkout@v2
-            - name: Set up Python ${{ matrix.python-version }}
-              uses: actions/setup-python@v2
-              with:
-                python-version: ${{ matrix.python-version }}
-            - uses: actions/cache@v1
-              with:
-                path: ~/.cache/pip
-                key: ${{ runner.os }}-pip-${{ hashFiles('**/requirements.txt') }}
-                restore-keys: |
-                  ${{ runner.os }}-pip-
-            - name: Install dependencies
-              run: |
-                python -m pip install --upgrade pip
-                pip install tox
-            - name: Test with tox
-              run: |
-                tox -e ${{ matrix.env }}
-        """)  # noqa: E501
-        indented = indent(text, ' ' * 4)
-        self.outfile.write(indented)
-
-    def generate_matrix_specifications(self, basepythons):
-        """Write the matrix entries for all `basepythons`.
-
-        :type basepythons: [BasePython]
-        :rtype: [str]
-        """
-        for basepython in basepythons:
-            for entry in self.generate_specs_for_basepython(basepython):
-                indented = indent(entry, ' ' * 10)
-                self.outfile.write(indented)
-
-    def generate_specs_for_basepython(self, basepython):
-        """Write the matrix entries for `basepython`.
+def resolve_basepythons(toxini=None, custom_mapping=(), fallback_python=None,
+                        parser="auto", cache=None, mapping_rules=(),
+                        stats=None):
+    """Return all known basepythons populated with the environments of the
+    tox configuration at `toxini`.
+
+    :param str toxini: A tox config file or a directory to start looking for
+                       one, defaults to the current directory
+    :param [(str, str)] custom_mapping: Pairs of additional basepythons and
+                                        the travis version they map to
+    :param str fallback_python:
+    :param str parser: One of :data:`ALL_PARSERS`
+    :param tox2travis.cache.Cache cache: Reuse previous results stored in
+                                         this cache
+    :param [(str, str)] mapping_rules: Pairs of patterns and target
+                                       basepythons, see
+                                       :mod:`tox2travis.rules`
+    :param tox2travis.stats.Stats stats: Measure the phases in this
+    :rtype: [BasePython]
+    """
+    from .config import find_config
+
+    key = None
+    with phase(stats, "parse"):
+        config_path = find_config(toxini)
+        if cache is not None and config_path is not None:
+            key = cache.key(config_path,
+                            custom_mapping=custom_mapping,
+                            fallback_python=fallback_python,
+                            parser=parser,
+                            mapping_rules=mapping_rules,
+                            registry=default_registry().digest)
+            if key is not None:
+                basepythons = cache.get(key)
+                if basepythons is not None:
+                    return basepythons
+
+        envs = get_all_environments(config_path or toxini, parser=parser)
+
+    with phase(stats, "bucketing"):
+        basepythons = list(default_registry().versions)
+        for mapping in custom_mapping:
+            basepython, travis_version = mapping
+            basepythons.append(PythonVersion(basepython, travis_version))
+
+        rules = None
+        if mapping_rules:
+            from .rules import RuleSet
+
+            rules = RuleSet(mapping_rules)
+
+        basepythons = fill_basepythons(basepythons, envs, fallback_python,
+                                       rules)
+    if key is not None:
+        cache.put(key, basepythons)
+    return basepythons
+
+
+#: All writers by their name. They are referenced as ``module:class`` strings
+#: so they only get imported once they're used.
+WRITERS = MappingProxyType(OrderedDict([
+    ("travis", "tox2travis.writers:TravisWriter"),
+    ("actions", "tox2travis.writers:ActionsWriter"),
+]))
+
+#: The names of all writers, the first one is the default
+ALL_WRITER_NAMES = tuple(WRITERS)
+
+
+def get_writer(name):
+    """Return the writer class called `name`.
+
+    :param str name: One of :data:`ALL_WRITER_NAMES`
+    :rtype: type
+    """
+    try:
+        module_name, _, class_name = WRITERS[name].partition(":")
+    except KeyError:
+        raise ValueError("{} is not a known writer".format(name))
+    return getattr(import_module(module_name), class_name)
 
-        :type basepython: BasePython
-        :rtype: [str]
-        """
-        single_entry_spec = dedent("""\
-        - python-version: "{python}"
-          env: {toxenv}
-        """)
-        actions_version = basepython.actions_version
-        for environment in basepython.environments:
-            yield single_entry_spec.format(python=actions_version,
-                                           toxenv=environment.envname)
-
-
-class TravisWriter(WriterBase):
-    """A class for writing a .travis.yml file."""
-
-    filename = ".travis.yml"
-    name = "travis"
-
-    def header(self):
-        """Write the .travis.yml header."""
-        text = dedent("""\
-        language: python
-        cache: pip
-        dist: xenial
-        matrix:
-          include:
-        """)
-        self.outfile.write(text)
-
-    def footer(self):
-        """Write the .travis.yml footer."""
-        text = dedent("""\
-        install:
-          - travis_retry pip install tox
-        script:
-          - travis_retry tox
-        """)
-        self.outfile.write(text)
-
-    def generate_matrix_specifications(self, basepythons):
-        """Write the matrix entries for all `basepythons`.
-
-        :type basepythons: [BasePython]
-        :rtype: [str]
-        """
-        for basepython in basepythons:
-            for entry in self.generate_specs_for_basepython(basepython):
-                indented = indent(entry, '  ')
-                self.outfile.write(indented)
 
-    def generate_specs_for_basepython(self, basepython):
-        """Write the matrix entries for `basepython`.
+#: Bump this whenever the generated output changes for the same inputs
+OUTPUT_FORMAT_VERSION = 4
 
-        :type basepython: BasePython
-        :rtype: [str]
-        """
-        single_entry_spec = dedent("""\
-        - python: "{python}"
-          env: TOXENV={toxenv}
-        """)
-        travis_version = basepython.travis_version
-        for environment in basepython.environments:
-            yield single_entry_spec.format(python=travis_version,
-                                           toxenv=environment.envname)
 
+def input_fingerprint(toxini=None, **options):
+    """Return a hash of the tox configuration at `toxini` and `options`.
 
-ALL_WRITERS = [TravisWriter, ActionsWriter]
+    :param str toxini: A tox config file or a directory to start looking for
+                       one, defaults to the current directory
+    :param options: All other options influencing the output
+    :rtype: str or None
+    :return: None if the output depends on more than these inputs
+    """
+    from .config import find_config, hash_config_files
+
+    config_path = find_config(toxini)
+    if config_path is None:
+        return None
+    config_files = hash_config_files(config_path)
+    if config_files is None:
+        return None
+    inputs = {
+        "format": OUTPUT_FORMAT_VERSION,
+        "config": basename(config_path),
+        "config_files": config_files,
+        "registry": default_registry().digest,
+        # Options that are not set don't influence the output, leaving them
+        # out keeps fingerprints stable when new options are added
+        "options": {key: value for key, value in options.items() if value},
+    }
+    serialized = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return "sha256:" + hashlib.sha256(serialized).hexdigest()
+
+
+def render_config(basepythons, output, stream=None, fingerprint=None,
+                  parallel=None, affected=False, staging=None,
+                  fail_fast=None, concurrency=None, wheelhouse=False,
+                  record_durations=False):
+    """Render the CI configuration for `basepythons` with the writer
+    `output` without touching the filesystem.
+
+    :param [BasePython] basepythons:
+    :param str output: One of :data:`ALL_WRITER_NAMES`
+    :param stream: A file-like object to write the configuration to
+    :param str fingerprint: As returned by :func:`input_fingerprint`
+    :param str parallel: Run the environments of each job in parallel with
+                         this many processes, or ``auto``
+    :param bool affected: Only run the jobs whose inputs changed
+    :param tox2travis.stage.Staging staging: Run the jobs in stages
+    :param bool fail_fast: Whether a failing job cancels the build
+    :param tox2travis.concurrency.Concurrency concurrency:
+    :param bool wheelhouse: Build the package and wheels of all dependencies
+                            once, before running tox
+    :param bool record_durations: Record the durations of the environments
+                                  of every job
+    :rtype: str or None
+    :return: The configuration, unless it was written to `stream`
+    """
+    if stream is None:
+        stream = StringIO()
+        render_config(basepythons, output, stream, fingerprint, parallel,
+                      affected, staging, fail_fast, concurrency, wheelhouse,
+                      record_durations)
+        return stream.getvalue()
+    with get_writer(output)(fingerprint=fingerprint, parallel=parallel,
+                            stream=stream, affected=affected,
+                            staging=staging, fail_fast=fail_fast,
+                            concurrency=concurrency,
+                            wheelhouse=wheelhouse,
+                            record_durations=record_durations) as writer:
+        writer.generate(basepythons)
+
+
+def write_config(basepythons, output, directory=None, fingerprint=None,
+                 check=False, parallel=None, stats=None, affected=False,
+                 staging=None, fail_fast=None, concurrency=None,
+                 wheelhouse=False, record_durations=False):
+    """Write the CI configuration for `basepythons` with the writer `output`.
+
+    The file is only written if its content changes.
+
+    :param [BasePython] basepythons:
+    :param str output: One of :data:`ALL_WRITER_NAMES`
+    :param str directory: The directory to write to, defaults to the current
+                          directory
+    :param str fingerprint: As returned by :func:`input_fingerprint`
+    :param bool check: Don't write anything, only check for changes
+    :param str parallel: Run the environments of each job in parallel with
+                         this many processes, or ``auto``
+    :param tox2travis.stats.Stats stats: Measure the phases in this
+    :param bool affected: Only run the jobs whose inputs changed
+    :param tox2travis.stage.Staging staging: Run the jobs in stages
+    :param bool fail_fast: Whether a failing job cancels the build
+    :param tox2travis.concurrency.Concurrency concurrency:
+    :param bool wheelhouse: Build the package and wheels of all dependencies
+                            once, before running tox
+    :param bool record_durations: Record the durations of the environments
+                                  of every job
+    :rtype: bool
+    :return: Whether the file changed (or would change, with `check`)
+    """
+    writer = get_writer(output)(directory, fingerprint=fingerprint,
+                                check=check, parallel=parallel,
+                                affected=affected, staging=staging,
+                                fail_fast=fail_fast,
+                                concurrency=concurrency,
+                                wheelhouse=wheelhouse,
+                                record_durations=record_durations)
+    # Writing happens when the writer's context is left
+    with phase(stats, "writing"), writer:
+        with phase(stats, "rendering"):
+            writer.generate(basepythons)
+    if stats is not None:
+        stats.record_output(output, writer.path, writer.size, writer.changed)
+    return writer.changed
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Regenerate the CI configuration whenever the tox configuration changes."""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+
+#: How long (in seconds) changes have to settle before regenerating
+DEFAULT_DEBOUNCE = 0.2
+#: How often (in seconds) :class:`PollingWatcher` looks at the files
+DEFAULT_POLL_INTERVAL = 0.5
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+            _IN_CREATE | _IN_DELETE)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Watches files in a directory with inotify."""
+
+    def __init__(self, directory, filenames):  # noqa: D400
+        """
+        :param str directory:
+        :param [str] filenames: The names of the files in `directory` to
+                                watch
+        :raises OSError: if inotify is not available
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        self.filenames = set(filenames)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the directory, editors often replace files instead of
+        # writing them in place
+        watch = libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                       _IN_MASK)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def wait(self, timeout=None):
+        """Wait up to `timeout` seconds for one of the files to change.
+
+        :param float timeout: Wait forever if None
+        :rtype: bool
+        :return: Whether one of the files changed
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        changed = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if os.fsdecode(name) in self.filenames:
+                changed = True
+        return changed
+
+    def close(self):
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watches files in a directory by regularly looking at them."""
+
+    def __init__(self, directory, filenames, interval=DEFAULT_POLL_INTERVAL):  # noqa: D400,E501
+        """
+        :param str directory:
+        :param [str] filenames: The names of the files in `directory` to
+                                watch
+        :param float interval: How often to look at the files, in seconds
+        """
+        self.paths = [os.path.join(directory, name) for name in filenames]
+        self.interval = interval
+        self._state = self._stat()
+
+    def _stat(self):
+        state = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                state.append(None)
+            else:
+                state.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return state
+
+    def wait(self, timeout=None):
+        """Wait up to `timeout` seconds for one of the files to change.
+
+        :param float timeout: Wait forever if None
+        :rtype: bool
+        :return: Whether one of the files changed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self._stat()
+            if state != self._state:
+                self._state = state
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+    def close(self):
+        """Stop watching."""
+
+
+def create_watcher(directory, filenames):
+    """Return an :class:`InotifyWatcher` or, if inotify isn't available, a
+    :class:`PollingWatcher`.
+
+    :param str directory:
+    :param [str] filenames:
+    """
+    try:
+        return InotifyWatcher(directory, filenames)
+    except (OSError, AttributeError) as e:
+        logging.debug("Falling back to polling: %s", e)
+        return PollingWatcher(directory, filenames)
+
+
+def changed_buckets(old, new):
+    """Return the basepythons whose environments differ between `old` and
+    `new`.
+
+    :param [tox2travis.tox2travis.BasePython] old:
+    :param [tox2travis.tox2travis.BasePython] new:
+    :rtype: [str]
+    """
+    def envnames(basepythons):
+        return {bp.tox_version: [env.envname for env in bp.environments]
+                for bp in basepythons or []}
+
+    old, new = envnames(old), envnames(new)
+    return sorted(name for name in set(old) | set(new)
+                  if old.get(name, []) != new.get(name, []))
+
+
+def watch(watcher, callback, debounce=DEFAULT_DEBOUNCE, stop=None):
+    """Call `callback` whenever `watcher` reports a change.
+
+    Changes in quick succession (like an editor writing a backup file and
+    then the file itself) only call `callback` once.
+
+    :param watcher: An :class:`InotifyWatcher` or :class:`PollingWatcher`
+    :param callback: A function without arguments
+    :param float debounce: How long (in seconds) changes have to settle
+    :param threading.Event stop: Stop watching once this is set
+    """
+    while stop is None or not stop.is_set():
+        if not watcher.wait(DEFAULT_POLL_INTERVAL):
+            continue
+        while watcher.wait(debounce):
+            pass
+        try:
+            callback()
+        except Exception:
+            logging.exception("Regenerating failed")
+
+
+class Regenerator:
+    """Regenerates the output for one tox configuration, remembering the
+    previous result between calls.
+    """
+
+    def __init__(self, outputs, basepythons=None, cache=None, directory=None, **options):  # noqa: D400,E501
+        """
+        :param [str] outputs: Names of writers
+        :param [tox2travis.tox2travis.BasePython] basepythons: The result of
+            the previous generation, if any
+        :param tox2travis.cache.Cache cache:
+        :param str directory: The directory to write to, defaults to the
+            current directory
+        :param options: Passed on to
+            :func:`tox2travis.tox2travis.resolve_basepythons`
+        """
+        self.outputs = outputs
+        self.basepythons = basepythons
+        self.cache = cache
+        self.directory = directory
+        self.options = options
+
+    def __call__(self):
+        """Regenerate the outputs, which are only written if they changed.
+
+        :rtype: [str]
+        :return: The basepythons whose environments changed
+        """
+        from .plan import Plan
+
+        plan = Plan.create(cache=self.cache, **self.options)
+        changed = changed_buckets(self.basepythons, plan.basepythons)
+        self.basepythons = plan.basepythons
+        for name in changed:
+            logging.info("Environments of %s changed", name)
+
+        for output in plan.render(self.outputs, self.directory):
+            logging.info("Regenerated the %s configuration", output)
+        return changed
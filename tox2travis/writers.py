@@ -0,0 +1,1011 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# Copyright © 2017, 2018, 2019, 2020 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import hashlib
+import json
+import os
+import re
+import shlex
+
+
+from collections import OrderedDict
+from contextlib import ExitStack
+from io import StringIO
+from os import makedirs
+from os.path import dirname, join, normpath
+from tempfile import NamedTemporaryFile
+from textwrap import dedent, indent
+
+
+from .concurrency import Concurrency
+from .config import TOXINIDIR, minimal_paths
+from .stage import QUICK_STAGE, STAGES, TEST_STAGE
+
+
+#: The first line of every generated file
+HEADER_COMMENT = "# Generated by tox2travis"
+#: What follows :data:`HEADER_COMMENT` if the input fingerprint is known
+FINGERPRINT_PREFIX = HEADER_COMMENT + ", input fingerprint: "
+
+#: The name of the cached directory containing the durations recorded by the
+#: jobs, and the prefix of the names of their artifacts
+DURATIONS_DIRECTORY = "tox-durations"
+
+#: Writes the record of a job generated with ``record_durations``, read by
+#: :func:`tox2travis.shard.read_durations`. It runs with the python of the
+#: job, which may be python 2. ``TOX_ENVS`` are the environments of the job,
+#: ``TOX_STARTED`` is when it started creating them, ``TOX_RESULT`` is the
+#: file written by ``tox --result-json`` and ``TOX_DURATIONS`` the record.
+RECORD_DURATIONS_SCRIPT = dedent("""\
+    import json
+    import os
+    import time
+
+    if os.environ.get("TOX_STARTED"):
+        record = {"version": 1,
+                  "envs": os.environ["TOX_ENVS"].split(","),
+                  "duration": round(time.time() -
+                                    float(os.environ["TOX_STARTED"]), 3),
+                  "testenvs": {}}
+        try:
+            with open(os.environ["TOX_RESULT"]) as fp:
+                record["testenvs"] = json.load(fp).get("testenvs") or {}
+        except (IOError, ValueError):
+            pass
+        directory = os.path.dirname(os.environ["TOX_DURATIONS"])
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.environ["TOX_DURATIONS"], "w") as fp:
+            json.dump(record, fp, indent=2, sort_keys=True)
+""")
+
+# Characters with a special meaning in POSIX extended regular expressions
+_ERE_SPECIAL = re.compile(r"[.\[\]()*+?{}|^$\\]")
+
+# pip options in deps that reference requirement or constraint files
+_DEPENDENCY_FILE_PATTERN = re.compile(
+    r"^(?:-r|-c|--requirement|--constraint)(?:\s*=\s*|\s*)(?P<path>\S+)$")
+
+
+def read_fingerprint(path):
+    """Return the input fingerprint embedded in the file at `path`.
+
+    Only the first line of the file is read.
+
+    :param str path:
+    :rtype: str or None
+    """
+    try:
+        with open(path, encoding="utf-8") as fp:
+            line = fp.readline()
+    except (OSError, ValueError):
+        return None
+    if not line.startswith(FINGERPRINT_PREFIX):
+        return None
+    return line[len(FINGERPRINT_PREFIX):].strip() or None
+
+
+def _toxenv(job):
+    """Return the value of ``TOXENV`` (or ``tox -e``) running all
+    environments of `job`.
+
+    :param job: A list of environments
+    :rtype: str
+    """
+    return ",".join(environment.envname for environment in job)
+
+
+# The ids of the GitHub Actions jobs running the stages
+_JOB_IDS = {QUICK_STAGE: "quick", TEST_STAGE: "build"}
+
+
+def _wheelhouse_name(version, package=None):
+    """Return the name of the artifact containing the wheelhouse for the
+    python version `version` of `package`.
+
+    :param str version:
+    :param str package:
+    :rtype: str
+    """
+    name = "wheelhouse-" + version
+    if package is not None:
+        name += "-" + package.replace("/", "_")
+    return name
+
+
+def _durations_name(job, package=None):
+    """Return the name of the record of the durations of `job` of
+    `package`.
+
+    :param job: A list of environments
+    :param str package:
+    :rtype: str
+    """
+    from .run import job_directory_name
+
+    name = job_directory_name([environment.envname for environment in job])
+    if package is not None:
+        name = package.replace("/", "_") + "-" + name
+    return name
+
+
+def _yaml_entry(entry):
+    """Return the GitHub Actions matrix entry `entry` as a YAML list item.
+
+    :param OrderedDict entry:
+    :rtype: str
+    """
+    lines = []
+    for key, value in entry.items():
+        if key in ("python-version", "tox-dep-files", "wheel-deps"):
+            value = json.dumps(value)
+        lines.append("{}: {}\n".format(key, value))
+    return "- " + "  ".join(lines)
+
+
+def _deps(environment):
+    # Environments parsed by tox have DepConfig objects
+    return [str(dep) for dep in getattr(environment, "deps", None) or ()]
+
+
+def dependency_key(job):
+    """Return a short hash of the basepython and dependencies of every
+    environment in `job`.
+
+    Files referenced by dependencies are not part of it, see
+    :func:`dependency_files`.
+
+    :param job: A list of environments
+    :rtype: str
+    """
+    data = [[environment.envname, environment.basepython, _deps(environment)]
+            for environment in job]
+    serialized = json.dumps(data).encode("utf-8")
+    return hashlib.sha256(serialized).hexdigest()[:16]
+
+
+def dependency_files(job, package=None):
+    """Return the requirement and constraint files the environments of
+    `job` install from, relative to the repository root.
+
+    :param job: A list of environments
+    :param str package: The directory of the package, relative to the
+                        repository root
+    :rtype: [str]
+    """
+    paths = set()
+    for environment in job:
+        for dep in _deps(environment):
+            match = _DEPENDENCY_FILE_PATTERN.match(dep)
+            if match is None:
+                continue
+            path = match.group("path")
+            if path.startswith(TOXINIDIR):
+                path = path[len(TOXINIDIR):].lstrip("/")
+            if "{" in path or path.startswith("/"):
+                # Outside of the repository, not something the CI can hash
+                continue
+            if package is not None:
+                path = join(package, path)
+            paths.add(normpath(path))
+    return sorted(paths)
+
+
+def wheel_dependencies(job):
+    """Return the arguments for ``pip wheel`` building wheels of the
+    dependencies of all environments in `job`, one tuple per dependency.
+
+    Like tox, every dependency is passed as a single argument, version
+    specifiers and environment markers included, only pip options like
+    ``-r requirements.txt`` are split. Dependencies that tox has to
+    substitute something in, or that are installed in editable mode, are
+    left out.
+
+    :param job: A list of environments
+    :rtype: [(str)]
+    """
+    args = []
+    for environment in job:
+        for dep in _deps(environment):
+            # The prepare job runs in the directory of the tox configuration
+            dep = dep.replace(TOXINIDIR + "/", "").strip()
+            if "{" in dep or dep.startswith(("-e", "--editable")):
+                continue
+            if not dep.startswith("-"):
+                args.append((dep,))
+                continue
+            try:
+                args.append(tuple(shlex.split(dep)))
+            except ValueError:
+                continue
+    return args
+
+
+def job_inputs(job, package=None):
+    """Return the paths whose changes affect the environments of `job`,
+    relative to the repository root.
+
+    Paths outside of the repository are left out.
+
+    :param job: A list of environments
+    :param str package: The directory of the package, relative to the
+                        repository root
+    :rtype: [str]
+    """
+    paths = dependency_files(job, package)
+    for environment in job:
+        # Environments without known inputs depend on everything
+        for path in getattr(environment, "inputs", None) or ["."]:
+            if package is not None:
+                path = join(package, path)
+            paths.append(normpath(path))
+    return minimal_paths(path for path in paths
+                         if path != ".." and not path.startswith("../"))
+
+
+def inputs_pattern(paths):
+    """Return a regular expression matching `paths` and everything in them.
+
+    It's understood by both Python and ``grep -E``.
+
+    :param [str] paths: As returned by :func:`job_inputs`
+    :rtype: str
+    """
+    if "." in paths:
+        return "^"
+    return "^({})(/|$)".format("|".join(_ERE_SPECIAL.sub(r"\\\g<0>", path)
+                                        for path in paths))
+
+
+class WriterBase(ExitStack):
+    """Base class for all writers, allowing use as a context manager.
+
+    Everything is written to memory first. When the context is left, the
+    file at :attr:`path` is only replaced (atomically) if its content
+    changed, so unchanged files keep their modification time. If a `stream`
+    is given, everything is written to it instead and the filesystem isn't
+    touched at all.
+    """
+
+    def __init__(self, directory=None, aggregate=False, fingerprint=None,
+                 check=False, parallel=None, stream=None, affected=False,
+                 staging=None, fail_fast=None, concurrency=None,
+                 wheelhouse=False, record_durations=False):  # noqa: D400,E501
+        """
+        :param str directory: The directory to write :attr:`filename` in,
+                              defaults to the current directory
+        :param bool aggregate: Whether matrix entries are for different
+                               packages in subdirectories of `directory`
+        :param str fingerprint: A hash of the inputs, written into the first
+                                line
+        :param bool check: Only check whether the file would change, don't
+                           write it
+        :param str parallel: Run the environments of each job with
+                             ``tox -p parallel``, ``auto`` uses all cores of
+                             the runner
+        :param stream: A file-like object to write to instead of
+                       :attr:`path`
+        :param bool affected: Only run the jobs whose inputs changed, see
+                              :func:`job_inputs`
+        :param tox2travis.stage.Staging staging: Run the jobs in stages,
+                                                 shortest first
+        :param bool fail_fast: Whether a failing job cancels (or, on
+                               Travis CI, finishes) the build, ``None``
+                               keeps the default of the CI
+        :param tox2travis.concurrency.Concurrency concurrency: Defaults to
+            the default settings
+        :param bool wheelhouse: Build the package and wheels of all
+                                dependencies once in a ``prepare`` job,
+                                only supported on GitHub Actions
+        :param bool record_durations: Record the durations of the
+                                      environments of every job, see
+                                      :data:`RECORD_DURATIONS_SCRIPT`
+        """
+        super().__init__()
+        self.directory = directory
+        self.aggregate = aggregate
+        self.fingerprint = fingerprint
+        self.check = check
+        self.parallel = parallel
+        self.stream = stream
+        self.affected = affected
+        self.staging = staging
+        self.fail_fast = fail_fast
+        self.concurrency = concurrency
+        if concurrency is None:
+            self.concurrency = Concurrency()
+        self.wheelhouse = wheelhouse
+        self.record_durations = record_durations
+        self.outfile = None
+        # The matrix entries written by footer(), see buffer_entry()
+        self._entries = []
+        #: Whether the file changed (or would change, with `check`)
+        self.changed = None
+        #: The size of the output in bytes
+        self.size = None
+
+    @property
+    def tox_command(self):
+        """Return the tox command line run by every job.
+
+        :rtype: str
+        """
+        if self.parallel is None:
+            return "tox"
+        return "tox -p {}".format(self.parallel)
+
+    def inputs_pattern(self, job, package=None):
+        """Return the pattern matching the inputs of `job`, including the
+        generated file itself.
+
+        :param job: A list of environments
+        :param str package:
+        :rtype: str
+        """
+        return inputs_pattern(minimal_paths(job_inputs(job, package) +
+                                            [self.filename]))
+
+    def buffer_entry(self, job, entry):
+        """Keep the matrix entry `entry` running `job` until
+        :meth:`buffered_stages` is called.
+
+        :param job: A list of environments
+        :param entry: The matrix entry, in the format of the writer
+        """
+        if self.staging is None:
+            stage, key = TEST_STAGE, ()
+        else:
+            stage, key = self.staging.stage(job), self.staging.sort_key(job)
+        self._entries.append((key, len(self._entries), stage, entry))
+
+    def buffered_stages(self):
+        """Return the entries kept by :meth:`buffer_entry` by stage.
+
+        Stages are in the order they run, without empty ones. Within a stage,
+        the shortest jobs come first.
+
+        :rtype: OrderedDict
+        """
+        stages = OrderedDict((stage, []) for stage in STAGES)
+        for _, _, stage, entry in sorted(self._entries,
+                                         key=lambda item: item[:2]):
+            stages[stage].append(entry)
+        return OrderedDict((stage, entries)
+                           for stage, entries in stages.items() if entries)
+
+    @property
+    def path(self):
+        """Return the path of the file this writer writes to.
+
+        :rtype: str
+        """
+        if self.directory is None:
+            return self.filename
+        return join(self.directory, self.filename)
+
+    def __enter__(self):
+        super().__enter__()
+        if self.stream is not None:
+            self.outfile = self.stream
+        else:
+            self.outfile = self.enter_context(StringIO())
+        if self.fingerprint is None:
+            self.outfile.write(HEADER_COMMENT + "\n")
+        else:
+            self.outfile.write(FINGERPRINT_PREFIX + self.fingerprint + "\n")
+        return self
+
+    def __exit__(self, *exc_details):
+        if exc_details[0] is None and self.stream is None:
+            content = self.outfile.getvalue()
+            self.size = len(content.encode("utf-8"))
+            self.changed = self._finish(content)
+        return super().__exit__(*exc_details)
+
+    def generate(self, basepythons):
+        """Write the whole configuration for `basepythons`.
+
+        :type basepythons: [BasePython]
+        """
+        self.header()
+        self.generate_matrix_specifications(basepythons)
+        self.footer()
+
+    def _finish(self, content):
+        mode = 0o644
+        try:
+            with open(self.path, encoding="utf-8") as fp:
+                if fp.read() == content:
+                    return False
+                mode = os.fstat(fp.fileno()).st_mode & 0o7777
+        except (OSError, ValueError):
+            pass
+        if self.check:
+            return True
+
+        dir_ = dirname(self.path)
+        if dir_:
+            makedirs(dir_, exist_ok=True)
+        with NamedTemporaryFile("w", dir=dir_ or ".", encoding="utf-8",
+                                prefix=".tox2travis-", delete=False) as fp:
+            fp.write(content)
+        try:
+            os.chmod(fp.name, mode)
+            os.replace(fp.name, self.path)
+        except OSError:
+            os.remove(fp.name)
+            raise
+        return True
+
+
+class ActionsWriter(WriterBase):
+    """A class for writing a GitHub actions yaml file."""
+
+    filename = ".github/workflows/tox.yml"
+    name = "actions"
+
+    def __init__(self, *args, **kwargs):  # noqa: D107
+        super().__init__(*args, **kwargs)
+        # The arguments for `pip wheel` by package and python version
+        self._wheelhouses = OrderedDict()
+
+    @property
+    def _buffered(self):
+        # The entries of the changes job are needed before any other job
+        return self.staging is not None or self.affected
+
+    def _job_header(self, job_id, needs=(), condition=None, include=""):
+        """Return the start of the job `job_id` up to its matrix entries.
+
+        :param str job_id:
+        :param [str] needs: The jobs that have to succeed first
+        :param str condition: An expression deciding whether the job runs
+        :param str include: The matrix entries, if they're not written as
+                            a list after this
+        :rtype: str
+        """
+        lines = ["{}:".format(job_id)]
+        if len(needs) == 1:
+            lines.append("  needs: {}".format(needs[0]))
+        elif needs:
+            lines.append("  needs: [{}]".format(", ".join(needs)))
+        if condition is not None:
+            lines.append("  if: ${{{{ {} }}}}".format(condition))
+        lines.append("  runs-on: ubuntu-latest")
+        if self.concurrency.timeout_minutes is not None:
+            lines.append("  timeout-minutes: {}".format(
+                self.concurrency.timeout_minutes))
+        lines.append("  strategy:")
+        if self.fail_fast is not None:
+            lines.append("    fail-fast: {}".format(
+                "true" if self.fail_fast else "false"))
+        if self.concurrency.max_parallel is not None:
+            lines.append("    max-parallel: {}".format(
+                self.concurrency.max_parallel))
+        lines.extend(["    matrix:",
+                      "      include:{}".format(include and " " + include)])
+        return indent("\n".join(lines) + "\n", ' ' * 2)
+
+    def header(self):
+        """Write the tox.yml header.
+
+        With :attr:`staging` or :attr:`affected`, the matrix entries are
+        collected and all jobs are written by :meth:`footer`.
+        """
+        text = dedent("""\
+        name: Run tox
+        on: [pull_request, push]
+        """)
+        if self.concurrency.group is not None:
+            text += "concurrency:\n  group: {}\n".format(
+                json.dumps(self.concurrency.group))
+            if self.concurrency.cancel_in_progress:
+                text += "  cancel-in-progress: true\n"
+        text += "jobs:\n"
+        if not self._buffered:
+            text += self._job_header(_JOB_IDS[TEST_STAGE],
+                                     ["prepare"] if self.wheelhouse else ())
+        self.outfile.write(text)
+
+    def _write_changes_job(self, stages):
+        """Write the ``changes`` job selecting the entries of every job in
+        `stages` whose inputs changed.
+
+        All entries are selected if the changed files can't be determined,
+        for example for the first push of a branch.
+
+        :param OrderedDict stages: The matrix entries by stage
+        """
+        text = dedent("""\
+        changes:
+          runs-on: ubuntu-latest
+          outputs:
+        """)
+        for stage in stages:
+            text += "    {job}: ${{{{ steps.affected.outputs.{job} }}}}\n" \
+                .format(job=_JOB_IDS[stage])
+        text += indent(dedent("""\
+        steps:
+        - uses: actions/checkout@v2
+          with:
+            fetch-depth: 0
+        - id: affected
+          name: Select the jobs whose inputs changed
+          shell: python
+          env:
+            BASE: ${{ github.event.pull_request.base.sha || github.event.before }}
+            MATRIX: |
+        """), ' ' * 2)  # noqa: E501
+        for stage, entries in stages.items():
+            for entry in entries:
+                entry = OrderedDict(entry)
+                entry["tox-job"] = _JOB_IDS[stage]
+                text += "        {}\n".format(json.dumps(entry))
+        text += indent(dedent("""\
+        run: |
+          import json
+          import os
+          import re
+          import subprocess
+
+          entries = [json.loads(line)
+                     for line in os.environ["MATRIX"].splitlines()
+                     if line.strip()]
+          base = os.environ["BASE"]
+          changed = None
+          if base.strip("0"):
+              diff = subprocess.run(
+                  ["git", "diff", "--name-only", base, "HEAD"],
+                  stdout=subprocess.PIPE, universal_newlines=True)
+              if diff.returncode == 0:
+                  changed = diff.stdout.splitlines()
+          if changed is None:
+              print("The changed files are unknown, running all jobs")
+          selected = {}
+          for entry in entries:
+              job_entries = selected.setdefault(entry.pop("tox-job"), [])
+              if changed is None or any(re.match(entry["tox-inputs"], path)
+                                        for path in changed):
+                  job_entries.append(entry)
+          with open(os.environ["GITHUB_OUTPUT"], "a") as fp:
+              for job, job_entries in selected.items():
+                  print(job + ":", ", ".join(entry["env"]
+                                             for entry in job_entries))
+                  fp.write(job + "=" + json.dumps(job_entries) + "\\n")
+        """), ' ' * 4)
+        self.outfile.write(indent(text, ' ' * 2))
+
+    def _steps(self):
+        """Return the steps of the jobs running tox.
+
+        The tox environments of every job are cached, keyed on their
+        basepython and dependencies (``matrix.tox-deps``) and the
+        requirement files they install (``matrix.tox-dep-files``). They are
+        created in a separate step, so a cache hit skips creating and
+        installing them.
+
+        With :attr:`record_durations`, every job records the durations of
+        its environments, from creating them to the end of their tests, in
+        ``matrix.durations``. Every record is uploaded as its own
+        ``tox-durations-*`` artifact, even if the tests fail.
+
+        :rtype: str
+        """
+        text = dedent("""\
+            steps:
+            - uses: actions/checkout@v2
+            - name: Set up Python ${{ matrix.python-version }}
+              uses: actions/setup-python@v2
+              with:
+                python-version: ${{ matrix.python-version }}
+            - uses: actions/cache@v4
+              with:
+                path: ~/.cache/pip
+                key: pip-${{ runner.os }}-${{ matrix.python-version }}-${{ matrix.tox-deps }}
+                restore-keys: |
+                  pip-${{ runner.os }}-${{ matrix.python-version }}-
+            - uses: actions/cache@v4
+              if: ${{ !matrix.tox-dep-files }}
+              with:
+                path: .tox
+                key: tox-${{ runner.os }}-${{ matrix.python-version }}-${{ matrix.tox-deps }}
+            - uses: actions/cache@v4
+              if: ${{ matrix.tox-dep-files }}
+              with:
+                path: .tox
+                key: tox-${{ runner.os }}-${{ matrix.python-version }}-${{ matrix.tox-deps }}-${{ hashFiles(matrix.tox-dep-files) }}
+            - name: Install dependencies
+              run: |
+                python -m pip install --upgrade pip
+                pip install tox
+            - name: Create tox environments
+              run: |
+                tox -e ${{ matrix.env }} --notest
+            - name: Test with tox
+              run: |
+                tox -e ${{ matrix.env }}
+        """)  # noqa: E501
+        tox = self.tox_command
+        if self.wheelhouse:
+            tox += " $TOX_INSTALLPKG"
+            text = text.replace(
+                "- uses: actions/cache@v4\n", dedent("""\
+                - uses: actions/download-artifact@v4
+                  with:
+                    name: ${{ matrix.wheelhouse }}
+                    path: wheelhouse
+                - name: Use the wheelhouse
+                  run: |
+                    pip config --user set global.find-links "$PWD/wheelhouse"
+                    for package in wheelhouse/package/*.whl; do
+                      if [ -f "$package" ]; then
+                        echo "TOX_INSTALLPKG=--installpkg $PWD/$package" >> "$GITHUB_ENV"
+                      fi
+                    done
+                - uses: actions/cache@v4
+                """), 1)  # noqa: E501
+        text = text.replace("tox -e", tox + " -e")
+        if self.aggregate:
+            text = text.replace("path: wheelhouse",
+                                "path: ${{ matrix.package }}/wheelhouse")
+            text = text.replace(
+                "    done\n",
+                "    done\n  working-directory: ${{ matrix.package }}\n")
+            text = text.replace("path: .tox",
+                                "path: ${{ matrix.package }}/.tox")
+            text = text.replace(
+                " --notest\n",
+                " --notest\n  working-directory: ${{ matrix.package }}\n")
+            text += "  working-directory: ${{ matrix.package }}\n"
+        if self.record_durations:
+            text = text.replace(
+                "  run: |\n    " + tox + " -e ${{ matrix.env }} --notest\n",
+                "  run: |\n    echo \"TOX_STARTED=$(date +%s)\" >> "
+                "\"$GITHUB_ENV\"\n    " + tox +
+                " -e ${{ matrix.env }} --notest\n")
+            text = text.replace(
+                "    " + tox + " -e ${{ matrix.env }}\n",
+                "    " + tox + " -e ${{ matrix.env }} --result-json "
+                "\"$RUNNER_TEMP/tox-result.json\"\n")
+            text += dedent("""\
+            - name: Record durations
+              if: ${{{{ always() }}}}
+              shell: python
+              env:
+                TOX_ENVS: ${{{{ matrix.env }}}}
+                TOX_RESULT: ${{{{ runner.temp }}}}/tox-result.json
+                TOX_DURATIONS: ${{{{ runner.temp }}}}/{directory}/${{{{ matrix.durations }}}}.json
+              run: |
+            {script}- uses: actions/upload-artifact@v4
+              if: ${{{{ always() }}}}
+              with:
+                name: {directory}-${{{{ matrix.durations }}}}
+                path: ${{{{ runner.temp }}}}/{directory}
+            """).format(directory=DURATIONS_DIRECTORY,  # noqa: E501
+                        script=indent(RECORD_DURATIONS_SCRIPT, ' ' * 4))
+        return indent(text, ' ' * 4)
+
+    def footer(self):
+        """Write the tox.yml footer.
+
+        With :attr:`staging`, every stage gets its own job, which only runs
+        if the jobs of the previous stages succeeded. With :attr:`affected`,
+        the ``changes`` job selects the matrix entries of every job.
+        """
+        steps = self._steps()
+        if not self._buffered:
+            self.outfile.write(steps)
+            self._write_prepare_job()
+            return
+
+        stages = self.buffered_stages()
+        if self.affected:
+            self._write_changes_job(stages)
+        self._write_prepare_job()
+        previous = ["prepare"] if self.wheelhouse else []
+        for stage, entries in stages.items():
+            job_id = _JOB_IDS[stage]
+            if not self.affected:
+                self.outfile.write(self._job_header(job_id, previous))
+                for entry in entries:
+                    self.outfile.write(indent(_yaml_entry(entry), ' ' * 10))
+            else:
+                condition = "needs.changes.outputs.{} != '[]'".format(job_id)
+                if previous:
+                    # Run even if jobs of previous stages were skipped
+                    condition = "!failure() && !cancelled() && " + condition
+                include = "${{{{ fromJSON(needs.changes.outputs.{}) }}}}" \
+                    .format(job_id)
+                self.outfile.write(self._job_header(
+                    job_id, ["changes"] + previous, condition, include))
+            self.outfile.write(steps)
+            previous.append(job_id)
+
+    def _write_prepare_job(self):
+        """Write the ``prepare`` job, if :attr:`wheelhouse` is set.
+
+        For every python version (and package, with :attr:`aggregate`), it
+        builds a wheel of the package and wheels of tox and the dependencies
+        of all environments into ``wheelhouse``, and uploads them as an
+        artifact. The jobs running tox download it, let pip find
+        dependencies in it and install the package with ``--installpkg``
+        instead of building it in every environment.
+        """
+        if not self.wheelhouse:
+            return
+        text = self._job_header("prepare")
+        for (package, version), args in self._wheelhouses.items():
+            entry = OrderedDict([("python-version", version),
+                                 ("wheelhouse", _wheelhouse_name(version,
+                                                                 package))])
+            if package is not None:
+                entry["package"] = package
+            entry["wheel-deps"] = " ".join(shlex.quote(arg)
+                                           for dep in args for arg in dep)
+            text += indent(_yaml_entry(entry), ' ' * 10)
+        steps = dedent("""\
+            steps:
+            - uses: actions/checkout@v2
+            - name: Set up Python ${{ matrix.python-version }}
+              uses: actions/setup-python@v2
+              with:
+                python-version: ${{ matrix.python-version }}
+            - name: Build wheels of the package and its dependencies
+              run: |
+                python -m pip install --upgrade pip wheel
+                if [ -f setup.py ] || [ -f pyproject.toml ]; then
+                  pip wheel --no-deps -w wheelhouse/package .
+                fi
+                pip wheel -w wheelhouse tox $(ls wheelhouse/package/*.whl 2>/dev/null) ${{ matrix.wheel-deps }}
+            - uses: actions/upload-artifact@v4
+              with:
+                name: ${{ matrix.wheelhouse }}
+                path: wheelhouse
+        """)  # noqa: E501
+        if self.aggregate:
+            steps = steps.replace(
+                "wheel-deps }}\n",
+                "wheel-deps }}\n  working-directory: ${{ matrix.package }}\n")
+            steps = steps.replace("path: wheelhouse",
+                                  "path: ${{ matrix.package }}/wheelhouse")
+        self.outfile.write(text + indent(steps, ' ' * 4))
+
+    def _add_wheel_dependencies(self, basepython, package):
+        """Remember the dependencies of the environments of `basepython`
+        for :meth:`_write_prepare_job`.
+
+        :type basepython: BasePython
+        :param str package:
+        """
+        if not basepython.jobs:
+            return
+        args = self._wheelhouses.setdefault(
+            (package, basepython.actions_version), OrderedDict())
+        for job in basepython.jobs:
+            for dep in wheel_dependencies(job):
+                args.setdefault(dep)
+
+    def generate_matrix_specifications(self, basepythons, package=None):
+        """Write the matrix entries for all `basepythons`.
+
+        :type basepythons: [BasePython]
+        :param str package: The directory of the package the environments
+                            belong to, if :attr:`aggregate` is set
+        :rtype: [str]
+        """
+        for basepython in basepythons:
+            if self.wheelhouse:
+                self._add_wheel_dependencies(basepython, package)
+            if self._buffered:
+                for job in basepython.jobs:
+                    self.buffer_entry(job, self.matrix_entry(basepython, job,
+                                                             package))
+                continue
+            for entry in self.generate_specs_for_basepython(basepython,
+                                                            package):
+                indented = indent(entry, ' ' * 10)
+                self.outfile.write(indented)
+
+    def generate_specs_for_basepython(self, basepython, package=None):
+        """Write the matrix entries for `basepython`.
+
+        :type basepython: BasePython
+        :param str package:
+        :rtype: [str]
+        """
+        for job in basepython.jobs:
+            yield _yaml_entry(self.matrix_entry(basepython, job, package))
+
+    def matrix_entry(self, basepython, job, package=None):
+        """Return the matrix entry running `job`.
+
+        :type basepython: BasePython
+        :param job: A list of environments
+        :param str package:
+        :rtype: OrderedDict
+        """
+        entry = OrderedDict([("python-version", basepython.actions_version),
+                             ("env", _toxenv(job)),
+                             ("tox-deps", dependency_key(job))])
+        if package is not None:
+            entry["package"] = package
+        files = dependency_files(job, package)
+        if files:
+            # hashFiles() takes newline separated patterns
+            entry["tox-dep-files"] = "\n".join(files)
+        if self.affected:
+            entry["tox-inputs"] = self.inputs_pattern(job, package)
+        if self.wheelhouse:
+            entry["wheelhouse"] = _wheelhouse_name(basepython.actions_version,
+                                                   package)
+        if self.record_durations:
+            entry["durations"] = _durations_name(job, package)
+        return entry
+
+
+class TravisWriter(WriterBase):
+    """A class for writing a .travis.yml file."""
+
+    filename = ".travis.yml"
+    name = "travis"
+
+    def header(self):
+        """Write the .travis.yml header.
+
+        Travis CI can only be told to cancel superseded builds or to limit
+        the number of concurrent jobs in the settings of the repository, so
+        these are only mentioned in comments.
+        """
+        text = dedent("""\
+        language: python
+        cache:
+          directories:
+            - $HOME/.cache/pip
+            - .tox
+        dist: xenial
+        matrix:
+          include:
+        """)
+        if self.aggregate:
+            text = text.replace("- .tox", '- "$PACKAGE/.tox"')
+        if self.record_durations:
+            text = text.replace("\ndist:", "\n    - $HOME/{}\ndist:".format(
+                DURATIONS_DIRECTORY))
+        hints = ""
+        if (self.concurrency.group is not None and
+                self.concurrency.cancel_in_progress):
+            hints += dedent("""\
+            # Enable "Auto Cancellation" in the repository settings to cancel
+            # builds superseded by newer commits
+            """)
+        if self.concurrency.max_parallel is not None:
+            hints += ("# Set \"Limit concurrent jobs\" to {} in the "
+                      "repository settings\n"
+                      .format(self.concurrency.max_parallel))
+        text = hints + text
+        if self.fail_fast is not None:
+            text = text.replace("  include:", "  fast_finish: {}\n  include:"
+                                .format("true" if self.fail_fast
+                                        else "false"))
+        self.outfile.write(text)
+
+    def footer(self):
+        """Write the .travis.yml footer.
+
+        Travis CI keeps a separate cache for every job configuration, and
+        ``TOX_DEPS`` in the matrix entries makes that depend on the
+        dependencies of the environments, so cached tox environments are
+        reused exactly as long as their dependencies don't change. They are
+        created during ``install``, so a cache hit skips that.
+
+        With :attr:`staging`, the collected matrix entries are written
+        first, each with its stage. Travis CI only starts a stage once all
+        jobs of the previous one succeeded.
+
+        With :attr:`record_durations`, every job records the durations of
+        its environments in the cached directory ``$HOME/tox-durations``
+        right before the cache is uploaded, even if the tests fail.
+        """
+        if self.staging is not None:
+            stages = self.buffered_stages()
+            for stage, entries in stages.items():
+                for entry in entries:
+                    entry = entry.replace("- ", "- stage: {}\n  ".format(stage),
+                                          1)
+                    self.outfile.write(indent(entry, '  '))
+            self.outfile.write("stages:\n")
+            for stage in stages:
+                self.outfile.write("  - {}\n".format(stage))
+
+        tox = "travis_retry " + self.tox_command
+        install, script = tox + " --notest", tox
+        if self.aggregate:
+            # Don't change the directory the script starts in
+            install = '(cd "$PACKAGE" && {})'.format(install)
+            script = 'cd "$PACKAGE" && ' + script
+        if self.record_durations:
+            install = "export TOX_STARTED=$(date +%s)\n  - " + install
+            script += ' --result-json "$HOME/tox-result.json"'
+        text = dedent("""\
+        install:
+          - travis_retry pip install tox
+          - {install}
+        script:
+          - {script}
+        """).format(install=install, script=script)
+        if self.record_durations:
+            text += dedent("""\
+            before_cache:
+              - |
+                TOX_ENVS="$TOXENV" TOX_RESULT="$HOME/tox-result.json" TOX_DURATIONS="$HOME/{directory}/$TOXENV.json" python - <<'EOF'
+            {script}    EOF
+            """).format(directory=DURATIONS_DIRECTORY,  # noqa: E501
+                        script=indent(RECORD_DURATIONS_SCRIPT, ' ' * 4))
+        if self.affected:
+            # TOX_INPUTS in the matrix entries matches the inputs of the
+            # job. If the changed files are unknown, the job runs.
+            text = dedent("""\
+            before_install:
+              - if changed=$(git diff --name-only "$TRAVIS_COMMIT_RANGE" 2>/dev/null) && ! printf '%s\\n' "$changed" | grep -qE "$TOX_INPUTS"; then echo "No inputs of $TOXENV changed"; travis_terminate 0; fi
+            """) + text  # noqa: E501
+        self.outfile.write(text)
+
+    def generate_matrix_specifications(self, basepythons, package=None):
+        """Write the matrix entries for all `basepythons`.
+
+        :type basepythons: [BasePython]
+        :param str package: The directory of the package the environments
+                            belong to, if :attr:`aggregate` is set
+        :rtype: [str]
+        """
+        for basepython in basepythons:
+            if self.staging is not None:
+                for job in basepython.jobs:
+                    self.buffer_entry(job, self.matrix_entry(basepython, job,
+                                                             package))
+                continue
+            for entry in self.generate_specs_for_basepython(basepython,
+                                                            package):
+                indented = indent(entry, '  ')
+                self.outfile.write(indented)
+
+    def generate_specs_for_basepython(self, basepython, package=None):
+        """Write the matrix entries for `basepython`.
+
+        :type basepython: BasePython
+        :param str package:
+        :rtype: [str]
+        """
+        for job in basepython.jobs:
+            yield self.matrix_entry(basepython, job, package)
+
+    def matrix_entry(self, basepython, job, package=None):
+        """Return the matrix entry running `job`.
+
+        :type basepython: BasePython
+        :param job: A list of environments
+        :param str package:
+        :rtype: str
+        """
+        single_entry_spec = dedent("""\
+        - python: "{python}"
+          env: TOXENV={toxenv} TOX_DEPS={deps}
+        """)
+        if package is not None:
+            single_entry_spec = single_entry_spec.replace(
+                "TOXENV={toxenv}", "TOXENV={toxenv} PACKAGE={package}")
+        inputs = None
+        if self.affected:
+            single_entry_spec = single_entry_spec.replace(
+                "TOX_DEPS={deps}", "TOX_DEPS={deps} TOX_INPUTS='{inputs}'")
+            # Quoted for the shell
+            inputs = self.inputs_pattern(job, package).replace("'", "'\\''")
+        return single_entry_spec.format(python=basepython.travis_version,
+                                        toxenv=_toxenv(job),
+                                        deps=dependency_key(job),
+                                        package=package,
+                                        inputs=inputs)
+
+
+ALL_WRITERS = (TravisWriter, ActionsWriter)